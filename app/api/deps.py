@@ -0,0 +1,25 @@
+import secrets
+
+from fastapi import Request
+
+from app.core.config.settings import get_settings
+from app.core.exceptions import ForbiddenError, UnauthorizedError
+
+
+async def require_admin(request: Request) -> None:
+    """Allow only callers presenting ADMIN_API_KEY as a bearer token
+
+    Without a configured key admin endpoints are closed, unless
+    ADMIN_OPEN_ACCESS opts in to serving them to anyone.
+    """
+    settings = get_settings()
+    if not settings.ADMIN_API_KEY:
+        if settings.ADMIN_OPEN_ACCESS:
+            return
+        raise ForbiddenError("Admin endpoints are disabled, set ADMIN_API_KEY to enable them")
+
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(
+        token.strip().encode(), settings.ADMIN_API_KEY.encode()
+    ):
+        raise UnauthorizedError("Invalid admin API key")
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import threading
+from typing import Any, Dict
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from app.api.deps import require_admin
+from app.core.concurrency import get_upstream_limiter
+from app.core.config.settings import get_settings
+from app.core.diagnostics import count_tasks, get_loop_monitor, sample_profile
+from app.core.exceptions import ConflictError, NotFoundError, ValidationError
+from app.core.middleware.compression import compression_stats
+from app.core.providers.health import get_health_checker
+from app.core.providers.keys import get_key_pool
+from app.core.providers.latency import get_latency_tracker
+from app.services.cache.similarity import get_similarity_cache
+from app.services.embeddings.service import get_embedding_batcher
+
+router = APIRouter(prefix="/debug", dependencies=[Depends(require_admin)])
+logger = logging.getLogger(__name__)
+
+# One profile at a time, overlapping samplers would skew each other
+_profile_lock = asyncio.Lock()
+
+
+@router.post("/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = 10.0,
+    interval_ms: float = 5.0,
+    all_threads: bool = False
+) -> str:
+    """Sample the event loop thread (or every thread) for a number of
+    seconds and return the stacks in folded format for a flame graph"""
+    max_seconds = get_settings().PROFILE_MAX_SECONDS
+    if not 0 < seconds <= max_seconds:
+        raise ValidationError(f"seconds must be between 0 and {max_seconds}")
+    if not 1 <= interval_ms <= 1000:
+        raise ValidationError("interval_ms must be between 1 and 1000")
+    if _profile_lock.locked():
+        raise ConflictError("A profile is already running")
+    async with _profile_lock:
+        thread_ids = None if all_threads else [threading.get_ident()]
+        logger.info(f"Profiling for {seconds}s every {interval_ms}ms")
+        return await asyncio.to_thread(sample_profile, seconds, interval_ms / 1000, thread_ids)
+
+
+@router.get("/loop")
+async def loop_stats() -> Dict[str, Any]:
+    """Event loop lag, recent stalls with the stack that blocked the loop,
+    and garbage collector pauses"""
+    if not get_settings().LOOP_MONITOR_ENABLED:
+        raise NotFoundError("Event loop monitor is disabled")
+    return get_loop_monitor().to_dict()
+
+
+@router.get("/tasks")
+async def task_counts(generators: bool = True) -> Dict[str, Any]:
+    """Live asyncio tasks by coroutine and async generators by function"""
+    return count_tasks(include_generators=generators)
+
+
+@router.get("/compression")
+async def compression() -> Dict[str, Any]:
+    """Response compression counters"""
+    return compression_stats.to_dict()
+
+
+@router.get("/cache")
+async def cache_stats() -> Dict[str, Any]:
+    """Similarity cache size and hit rate"""
+    if not get_settings().SIMILARITY_CACHE_ENABLED:
+        raise NotFoundError("Similarity cache is disabled")
+    return get_similarity_cache().to_dict()
+
+
+@router.get("/embeddings")
+async def embedding_stats() -> Dict[str, Any]:
+    """Embedding cache hit rate and upstream batching"""
+    return get_embedding_batcher().to_dict()
+
+
+@router.get("/scheduler")
+async def scheduler_stats() -> Dict[str, Any]:
+    """Upstream slots in use and requests queued per priority class and tenant"""
+    return get_upstream_limiter().to_dict()
+
+
+@router.get("/upstreams")
+async def upstream_health() -> Dict[str, Any]:
+    """Health of each deployment, from probes and real traffic"""
+    return get_health_checker().to_dict()
+
+
+@router.get("/latency")
+async def upstream_latency() -> Dict[str, Any]:
+    """Rolling time to first token and throughput quantiles per deployment and model"""
+    return get_latency_tracker().to_dict()
+
+
+@router.get("/keys")
+async def key_pool() -> Dict[str, Any]:
+    """Rate limit headroom of each upstream API key, by key fingerprint"""
+    return get_key_pool().to_dict()
@@ -1,14 +1,26 @@
 import logging
 from fastapi import APIRouter, HTTPException, Request
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from typing import Union
 
-from app.core.exceptions import LLMAPIException
-from app.schemas.base import ChatCompletionRequest, ChatCompletionResponse
+from app.core.concurrency import parse_priority
+from app.core.config.settings import get_settings
+from app.core.exceptions import LLMAPIException, ValidationError
+from app.core.streaming import DisconnectAwareStreamingResponse
+from app.core.tracing import TracedRoute
+from app.schemas.base import (
+    ChatCompletionRequest,
+    ChatCompletionResponse,
+    BatchChatCompletionRequest,
+    EmbeddingRequest,
+    EmbeddingResponse
+)
 from app.services.chat.service import ChatService
+from app.services.embeddings.service import EmbeddingService
+from app.services.batch.service import BatchService
 from app.core.context import request_id_var
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 logger = logging.getLogger(__name__)
 
 
@@ -24,12 +36,20 @@ async def create_chat_completion(
             f"Received request: {request.model_dump_json()}",
             extra={"trace_id": trace_id}
         )
-        response = await ChatService.chat_completion(request)
+        priority = parse_priority(fastapi_request)
         if request.stream:
-            return StreamingResponse(
+            response = await ChatService.chat_completion(request, priority=priority)
+            return DisconnectAwareStreamingResponse(
                 response,
                 media_type="text/event-stream"
             )
+        raw_body = None
+        if get_settings().RAW_FORWARDING_ENABLED:
+            # Already read and cached by FastAPI while parsing the request
+            raw_body = await fastapi_request.body()
+        response = await ChatService.chat_completion(request, priority=priority, raw_body=raw_body)
+        if isinstance(response, bytes):
+            return Response(content=response, media_type="application/json")
         return response
     except LLMAPIException as e:
         logger.error(
@@ -45,4 +65,36 @@ async def create_chat_completion(
         raise HTTPException(
             status_code=500,
             detail=f"Internal server error: {str(e)}"
-        ) 
\ No newline at end of file
+        ) 
+
+
+@router.post("/chat/completions/batch")
+async def create_chat_completion_batch(
+    batch: BatchChatCompletionRequest,
+) -> StreamingResponse:
+    """Create many chat completions, streamed back as NDJSON in completion order"""
+    trace_id = request_id_var.get()
+    max_items = get_settings().BATCH_MAX_ITEMS
+    if len(batch.requests) > max_items:
+        raise ValidationError(
+            f"Batch contains {len(batch.requests)} requests, maximum is {max_items}"
+        )
+    if len({item.custom_id for item in batch.requests}) != len(batch.requests):
+        raise ValidationError("custom_id values must be unique within a batch")
+
+    logger.info(
+        f"Received batch of {len(batch.requests)} requests",
+        extra={"trace_id": trace_id}
+    )
+    return DisconnectAwareStreamingResponse(
+        BatchService.chat_completion_batch(batch),
+        media_type="application/x-ndjson"
+    )
+
+
+@router.post("/embeddings", response_model=EmbeddingResponse)
+async def create_embeddings(request: EmbeddingRequest, fastapi_request: Request) -> Response:
+    """Create embeddings, batched upstream with concurrent requests"""
+    response = await EmbeddingService.create_embeddings(request, parse_priority(fastapi_request))
+    # Serialized directly, validating every vector element again is slow
+    return Response(content=response.model_dump_json(), media_type="application/json")
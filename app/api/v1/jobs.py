@@ -0,0 +1,60 @@
+import asyncio
+import logging
+from typing import AsyncIterator
+from fastapi import APIRouter, Request
+from fastapi.responses import Response, StreamingResponse
+
+from app.schemas.base import BatchJob
+from app.services.batch.jobs import get_batch_job_manager
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Bytes of a results file read at a time
+RESULTS_CHUNK_SIZE = 64 * 1024
+
+
+async def _read_prefix(path: str, size: int) -> AsyncIterator[bytes]:
+    """The first size bytes of a file, in chunks"""
+    with open(path, "rb") as f:
+        while size > 0:
+            chunk = await asyncio.to_thread(f.read, min(size, RESULTS_CHUNK_SIZE))
+            if not chunk:
+                break
+            size -= len(chunk)
+            yield chunk
+
+
+@router.post("/batch/jobs", response_model=BatchJob, status_code=202)
+async def create_batch_job(request: Request) -> BatchJob:
+    """Create a batch job from a JSONL body of {"custom_id", "request"} lines"""
+    return await get_batch_job_manager().create_job(request.stream())
+
+
+@router.get("/batch/jobs/{job_id}", response_model=BatchJob)
+async def get_batch_job(job_id: str) -> BatchJob:
+    """Get batch job status"""
+    return await get_batch_job_manager().get_job(job_id)
+
+
+@router.post("/batch/jobs/{job_id}/cancel", response_model=BatchJob)
+async def cancel_batch_job(job_id: str) -> BatchJob:
+    """Cancel a batch job"""
+    return await get_batch_job_manager().cancel_job(job_id)
+
+
+@router.get("/batch/jobs/{job_id}/results")
+async def get_batch_job_results(job_id: str) -> Response:
+    """Download batch job results as JSONL (up to the last checkpoint while
+    the job is running)"""
+    path, size = await get_batch_job_manager().get_results(job_id)
+    if not size:
+        return Response(content=b"", media_type="application/x-ndjson")
+    return StreamingResponse(
+        _read_prefix(path, size),
+        media_type="application/x-ndjson",
+        headers={
+            "Content-Length": str(size),
+            "Content-Disposition": f'attachment; filename="{job_id}.jsonl"'
+        }
+    )
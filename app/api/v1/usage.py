@@ -0,0 +1,35 @@
+import logging
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Depends
+
+from app.api.deps import require_admin
+from app.core.exceptions import ValidationError
+from app.services.usage.recorder import GROUP_BY_COLUMNS, get_usage_recorder
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+logger = logging.getLogger(__name__)
+
+
+@router.get("/usage")
+async def get_usage(
+    tenant: Optional[str] = None,
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+    group_by: str = "tenant"
+) -> Dict[str, Any]:
+    """Token and cost totals, grouped by a comma separated list of
+    tenant, model, provider and bucket (hour start, unix seconds)"""
+    columns = [column.strip() for column in group_by.split(",") if column.strip()]
+    invalid = [column for column in columns if column not in GROUP_BY_COLUMNS]
+    if not columns or invalid:
+        raise ValidationError(
+            f"group_by must be a comma separated list of: {', '.join(GROUP_BY_COLUMNS)}"
+        )
+    data = await get_usage_recorder().query(
+        group_by=list(dict.fromkeys(columns)),
+        tenant=tenant,
+        since=since,
+        until=until
+    )
+    return {"object": "list", "data": data}
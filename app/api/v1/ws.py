@@ -0,0 +1,186 @@
+import asyncio
+import json
+import logging
+import uuid
+from contextlib import aclosing
+from typing import Any, Dict
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError as PydanticValidationError
+
+from app.core.config.settings import get_settings
+from app.core.context import deadline_after, deadline_var, get_tenant_id, identify_tenant, request_id_var, slo_var, tenant_var
+from app.core.exceptions import AppError
+from app.core.middleware.rate_limit import get_rate_limiter
+from app.core.providers.latency import parse_slo
+from app.core.tracing import start_root_span, use_span
+from app.schemas.base import ChatCompletionRequest
+from app.services.chat.service import ChatService
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+class _StreamMultiplexer:
+    """Runs the completion streams of one WebSocket connection
+
+    Client messages:
+      {"type": "request", "id": "<stream id>", "request": {<chat completion request>}}
+      {"type": "cancel", "id": "<stream id>"}
+
+    A request may also carry "timeout" (seconds) and "slo" fields, read
+    like the deadline and latency SLO headers of an HTTP request; those
+    headers on the handshake do not apply to its streams. Each request
+    counts against the tenant's rate limit.
+
+    Server messages, tagged with the stream id:
+      {"type": "chunk", "id": ..., "data": {<chat.completion.chunk>}}
+      {"type": "response", "id": ..., "data": {<chat.completion>}}  (stream false)
+      {"type": "done", "id": ...}
+      {"type": "cancelled", "id": ...}
+      {"type": "error", "id": ..., "error": {"status_code": ..., "message": ...}}
+    """
+
+    def __init__(self, websocket: WebSocket, max_streams: int):
+        self.websocket = websocket
+        self.max_streams = max_streams
+        self.connection_id = uuid.uuid4().hex[:12]
+        self._streams: Dict[str, asyncio.Task] = {}
+        self._send_lock = asyncio.Lock()
+
+    async def _send(self, text: str) -> None:
+        async with self._send_lock:
+            await self.websocket.send_text(text)
+
+    async def _send_message(self, message: Dict[str, Any]) -> None:
+        await self._send(json.dumps(message))
+
+    async def _send_error(self, stream_id: Any, status_code: int, message: str) -> None:
+        await self._send_message({
+            "type": "error",
+            "id": stream_id,
+            "error": {"status_code": status_code, "message": message}
+        })
+
+    async def _run_stream(self, stream_id: str, request: ChatCompletionRequest, message: Dict[str, Any]) -> None:
+        request_id_var.set(f"{self.connection_id}:{stream_id}")
+        deadline_var.set(deadline_after(message.get("timeout"), f"timeout of stream {stream_id}"))
+        slo = message.get("slo")
+        slo_var.set(parse_slo(slo) if isinstance(slo, str) else None)
+        if get_settings().TRACING_ENABLED:
+            with use_span(start_root_span("WS /chat/completions/ws")):
+                await self._relay(stream_id, request)
+        else:
+            await self._relay(stream_id, request)
+
+    async def _relay(self, stream_id: str, request: ChatCompletionRequest) -> None:
+        # Chunks are spliced into the envelope as they are, not re-parsed
+        prefix = '{"type":"chunk","id":' + json.dumps(stream_id) + ',"data":'
+        try:
+            response = await ChatService.chat_completion(request)
+            if not request.stream:
+                await self._send(
+                    '{"type":"response","id":' + json.dumps(stream_id)
+                    + ',"data":' + response.model_dump_json() + "}"
+                )
+                return
+            async with aclosing(response) as stream:
+                async for text in stream:
+                    # A coalesced chunk may hold several SSE frames
+                    for frame in text.split("\n\n"):
+                        if not frame.startswith("data: "):
+                            continue
+                        payload = frame[6:]
+                        if payload == "[DONE]":
+                            continue
+                        await self._send(prefix + payload + "}")
+            await self._send_message({"type": "done", "id": stream_id})
+        except asyncio.CancelledError:
+            raise
+        except AppError as e:
+            await self._send_error(stream_id, e.status_code, e.message)
+        except HTTPException as e:
+            await self._send_error(stream_id, e.status_code, str(e.detail))
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            logger.exception(f"WebSocket stream {stream_id} failed")
+            await self._send_error(stream_id, 500, f"Internal server error: {str(e)}")
+        finally:
+            self._streams.pop(stream_id, None)
+
+    async def _cancel(self, stream_id: str) -> None:
+        task = self._streams.pop(stream_id, None)
+        if task is None:
+            await self._send_error(stream_id, 404, f"Unknown stream id: {stream_id}")
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await self._send_message({"type": "cancelled", "id": stream_id})
+
+    async def _handle(self, text: str) -> None:
+        try:
+            message = json.loads(text)
+            message_type = message["type"]
+            stream_id = message["id"]
+        except (ValueError, KeyError, TypeError):
+            await self._send_error(None, 400, "Messages must be JSON objects with a type and an id")
+            return
+        if not isinstance(stream_id, str):
+            await self._send_error(None, 400, "Stream ids must be strings")
+            return
+
+        if message_type == "cancel":
+            await self._cancel(stream_id)
+            return
+        if message_type != "request":
+            await self._send_error(stream_id, 400, f"Unknown message type: {message_type}")
+            return
+        if stream_id in self._streams:
+            await self._send_error(stream_id, 409, f"Stream id already in use: {stream_id}")
+            return
+        if len(self._streams) >= self.max_streams:
+            await self._send_error(
+                stream_id, 429, f"At most {self.max_streams} concurrent streams per connection"
+            )
+            return
+        settings = get_settings()
+        if settings.RATE_LIMIT_ENABLED:
+            try:
+                get_rate_limiter().check(get_tenant_id())
+            except AppError as e:
+                await self._send_error(stream_id, e.status_code, e.message)
+                return
+        try:
+            request = ChatCompletionRequest.model_validate(message.get("request"))
+        except PydanticValidationError as e:
+            await self._send_error(stream_id, 422, f"Invalid request: {e.errors()[0]['msg']}")
+            return
+        self._streams[stream_id] = asyncio.create_task(self._run_stream(stream_id, request, message))
+
+    async def run(self) -> None:
+        try:
+            while True:
+                await self._handle(await self.websocket.receive_text())
+        except WebSocketDisconnect:
+            pass
+        finally:
+            # Abort the upstream requests of every stream still running
+            tasks = list(self._streams.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@router.websocket("/chat/completions/ws")
+async def chat_completions_ws(websocket: WebSocket) -> None:
+    """Multiplex many chat completions, streamed or not, over one WebSocket"""
+    await websocket.accept()
+    tenant_var.set(identify_tenant(websocket))
+    multiplexer = _StreamMultiplexer(websocket, get_settings().WS_MAX_STREAMS)
+    logger.info(f"WebSocket connection {multiplexer.connection_id} opened")
+    await multiplexer.run()
+    logger.info(f"WebSocket connection {multiplexer.connection_id} closed")
@@ -0,0 +1,191 @@
+import asyncio
+import fnmatch
+import heapq
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.core.config.settings import get_settings
+from app.core.context import check_deadline, get_deadline, get_tenant_id
+from app.core.exceptions import DeadlineExceededError
+from app.core.tracing import start_span
+
+# Priority classes, lower value is served first
+PRIORITY_ONLINE = 0
+PRIORITY_BATCH = 1
+
+PRIORITY_NAMES = {"interactive": PRIORITY_ONLINE, "online": PRIORITY_ONLINE, "batch": PRIORITY_BATCH}
+
+
+def parse_priority(request) -> int:
+    """Priority class a client asked for in the priority header, online by default"""
+    value = request.headers.get(get_settings().PRIORITY_HEADER, "")
+    return PRIORITY_NAMES.get(value.strip().lower(), PRIORITY_ONLINE)
+
+
+class UpstreamLimiter:
+    """Bounded upstream concurrency shared by online and batch traffic
+
+    Online requests are always admitted before queued batch work, and batch
+    work may only ever hold a fraction of the slots so that online traffic
+    arriving later does not have to wait for long batch runs to drain.
+
+    Within a priority class, queued requests are served by start-time fair
+    queuing across tenants: each request gets a start tag of
+    max(virtual time, the tenant's previous finish tag) and a finish tag
+    1/weight later, and the lowest start tag is served next. A tenant with
+    a thousand requests queued therefore only delays a newly arriving
+    tenant by one request, however early its backlog arrived.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        batch_share: float = 0.5,
+        tenant_weights: Optional[Dict[str, float]] = None
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.batch_max_concurrency = max(1, int(self.max_concurrency * batch_share))
+        self.tenant_weights = tenant_weights or {}
+        self._in_flight = 0
+        self._batch_in_flight = 0
+        self._seq = 0
+        # Per priority class: heap of (start tag, seq, tenant, waiter), live
+        # waiters per tenant, each tenant's last finish tag, and virtual time
+        self._queues: Dict[int, List[Tuple[float, int, str, asyncio.Future]]] = {
+            PRIORITY_ONLINE: [],
+            PRIORITY_BATCH: [],
+        }
+        self._queued: Dict[int, Dict[str, int]] = {PRIORITY_ONLINE: {}, PRIORITY_BATCH: {}}
+        self._finish_tags: Dict[int, Dict[str, float]] = {PRIORITY_ONLINE: {}, PRIORITY_BATCH: {}}
+        self._virtual_time: Dict[int, float] = {PRIORITY_ONLINE: 0.0, PRIORITY_BATCH: 0.0}
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def get_weight(self, tenant: str) -> float:
+        """Share of tenant relative to others, from tenant_weights (exact ID or glob)"""
+        if tenant in self.tenant_weights:
+            return self.tenant_weights[tenant]
+        for pattern, weight in self.tenant_weights.items():
+            if fnmatch.fnmatchcase(tenant, pattern):
+                return weight
+        return 1.0
+
+    def _can_admit(self, priority: int) -> bool:
+        if self._in_flight >= self.max_concurrency:
+            return False
+        if priority == PRIORITY_BATCH:
+            return self._batch_in_flight < self.batch_max_concurrency
+        return True
+
+    def _grant(self, priority: int) -> None:
+        self._in_flight += 1
+        if priority == PRIORITY_BATCH:
+            self._batch_in_flight += 1
+
+    def _enqueue(self, priority: int, tenant: str) -> asyncio.Future:
+        finish_tags = self._finish_tags[priority]
+        start = max(self._virtual_time[priority], finish_tags.get(tenant, 0.0))
+        finish_tags[tenant] = start + 1.0 / max(self.get_weight(tenant), 1e-6)
+        waiter = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._queues[priority], (start, self._seq, tenant, waiter))
+        queued = self._queued[priority]
+        queued[tenant] = queued.get(tenant, 0) + 1
+        return waiter
+
+    def _dequeued(self, priority: int, tenant: str) -> None:
+        queued = self._queued[priority]
+        queued[tenant] -= 1
+        if not queued[tenant]:
+            del queued[tenant]
+            # An idle tenant restarts at virtual time, its tag is not needed
+            if self._finish_tags[priority].get(tenant, 0.0) <= self._virtual_time[priority]:
+                self._finish_tags[priority].pop(tenant, None)
+
+    def _wake_waiters(self) -> None:
+        """Hand free slots to waiters, online first, fairly across tenants"""
+        for priority in (PRIORITY_ONLINE, PRIORITY_BATCH):
+            queue = self._queues[priority]
+            while queue and self._can_admit(priority):
+                start, _, tenant, waiter = heapq.heappop(queue)
+                if waiter.done():
+                    # Cancelled while queued, already uncounted
+                    continue
+                self._virtual_time[priority] = start
+                self._dequeued(priority, tenant)
+                self._grant(priority)
+                waiter.set_result(None)
+
+    async def acquire(self, priority: int = PRIORITY_ONLINE) -> None:
+        """Wait for an upstream slot, at most until the request's deadline"""
+        check_deadline()
+        queued_ahead = any(
+            self._queued[p] for p in self._queued if p <= priority
+        )
+        if not queued_ahead and self._can_admit(priority):
+            self._grant(priority)
+            return
+
+        tenant = get_tenant_id() or "anonymous"
+        waiter = self._enqueue(priority, tenant)
+        try:
+            async with asyncio.timeout_at(get_deadline()):
+                try:
+                    await waiter
+                except asyncio.CancelledError:
+                    if waiter.done() and not waiter.cancelled():
+                        # Slot was granted right before cancellation, give it back
+                        self.release(priority)
+                    else:
+                        waiter.cancel()
+                        self._dequeued(priority, tenant)
+                    raise
+        except TimeoutError:
+            raise DeadlineExceededError() from None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self._in_flight,
+            "batch_in_flight": self._batch_in_flight,
+            "max_concurrency": self.max_concurrency,
+            "batch_max_concurrency": self.batch_max_concurrency,
+            "queued": {
+                name: dict(self._queued[priority])
+                for name, priority in (("online", PRIORITY_ONLINE), ("batch", PRIORITY_BATCH))
+            },
+        }
+
+    def release(self, priority: int = PRIORITY_ONLINE) -> None:
+        """Return an upstream slot"""
+        self._in_flight -= 1
+        if priority == PRIORITY_BATCH:
+            self._batch_in_flight -= 1
+        self._wake_waiters()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_ONLINE) -> AsyncIterator[None]:
+        """Hold an upstream slot for the duration of the block"""
+        with start_span("upstream.slot_wait", priority=priority):
+            await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+
+# Global limiter instance
+_upstream_limiter: Optional[UpstreamLimiter] = None
+
+def get_upstream_limiter() -> UpstreamLimiter:
+    """Get the process wide upstream limiter"""
+    global _upstream_limiter
+    if _upstream_limiter is None:
+        settings = get_settings()
+        _upstream_limiter = UpstreamLimiter(
+            max_concurrency=settings.UPSTREAM_MAX_CONCURRENCY,
+            batch_share=settings.UPSTREAM_BATCH_SHARE,
+            tenant_weights=settings.TENANT_WEIGHTS
+        )
+    return _upstream_limiter
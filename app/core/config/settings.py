@@ -12,6 +12,14 @@ class Settings(BaseSettings):
     API_V1_STR: str = "/api/v1"
     DEBUG: bool = False
     
+    # Server launcher (python -m app.server)
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: int = 0  # 0 means one worker per CPU core
+    SERVER_GRACEFUL_TIMEOUT: float = 30.0  # seconds in-flight requests get on shutdown
+    SERVER_LOOP: str = "auto"  # "auto" uses uvloop when installed
+    SERVER_HTTP: str = "auto"  # "auto" uses httptools when installed
+
     # CORS settings
     ALLOWED_HOSTS: List[str] = ["*"]
     
@@ -20,6 +28,159 @@ class Settings(BaseSettings):
     RATE_LIMIT_REQUESTS: int = 100
     RATE_LIMIT_PERIOD: int = 60  # seconds (alias for RATE_LIMIT_WINDOW)
     
+    # Batch completions
+    BATCH_MAX_ITEMS: int = 1000
+    BATCH_MAX_CONCURRENCY: int = 16
+
+    # Batch jobs
+    BATCH_JOB_ENABLED: bool = True
+    BATCH_JOB_DIR: str = "data/batch_jobs"
+    BATCH_JOB_WORKERS: int = 2
+    BATCH_JOB_CONCURRENCY: int = 8
+    BATCH_JOB_CHECKPOINT_INTERVAL: float = 5.0  # seconds
+
+    # Upstream concurrency shared by online and batch traffic
+    UPSTREAM_MAX_CONCURRENCY: int = 256
+    UPSTREAM_BATCH_SHARE: float = 0.5  # max fraction of slots batch work may hold
+    # Relative shares of queued upstream capacity, keyed by tenant ID or glob
+    # pattern (e.g. "hdr:team-a", "ip:10.0.*"); tenants not listed have weight 1
+    TENANT_WEIGHTS: Dict[str, float] = {}
+    TENANT_HEADER: Optional[str] = None  # e.g. "X-Tenant-ID", trusted to name the tenant when set
+    PRIORITY_HEADER: str = "X-Priority"  # "interactive" (default) or "batch"
+
+    # Upstream timeouts in seconds; time to first byte defaults to each
+    # provider's *_TIMEOUT, routing table deployments and routes can override all
+    UPSTREAM_CONNECT_TIMEOUT: float = 5.0
+    UPSTREAM_POOL_TIMEOUT: float = 10.0  # waiting for a pooled connection
+    UPSTREAM_IDLE_TIMEOUT: float = 30.0  # between chunks of a stream
+    # Header carrying the seconds a client is willing to wait for a response
+    DEADLINE_HEADER: str = "X-Request-Timeout"
+
+    # Upstream connection warm-up and keep-alive
+    UPSTREAM_WARMUP_CONNECTIONS: int = 2  # per upstream, 0 disables warm-up
+    UPSTREAM_WARMUP_TIMEOUT: float = 10.0  # seconds
+    UPSTREAM_KEEPALIVE_EXPIRY: float = 90.0  # seconds an idle pooled connection is kept
+    UPSTREAM_KEEPALIVE_INTERVAL: float = 20.0  # seconds between idle probes, 0 disables
+
+    # Upstream DNS cache
+    UPSTREAM_DNS_CACHE_ENABLED: bool = True
+    UPSTREAM_DNS_TTL: float = 60.0  # seconds, used when the resolver reports no TTL
+    UPSTREAM_DNS_REFRESH_AHEAD: float = 10.0  # seconds before expiry to refresh in background
+    UPSTREAM_DNS_STALE_TTL: float = 3600.0  # seconds a stale answer may be served if refresh fails
+
+    # Upstream API key pools: provider *_API_KEY settings and routing table
+    # api_key_env variables may hold several comma separated keys
+    KEY_POOL_ENABLED: bool = True  # schedule by rate limit headers, else only the first key is used
+    KEY_POOL_MAX_WAIT: float = 5.0  # seconds a request may wait for a key with quota before trying anyway
+    KEY_POOL_RESERVE: float = 0.02  # fraction of each rate limit left unused, for other workers and requests in flight
+
+    # Upstream health checks, consulted by routing and /readyz
+    HEALTH_CHECK_ENABLED: bool = True
+    HEALTH_CHECK_INTERVAL: float = 15.0  # seconds between probes of each deployment
+    HEALTH_CHECK_TIMEOUT: float = 5.0  # seconds
+    HEALTH_FAILURE_THRESHOLD: int = 3  # consecutive failed probes or requests before a deployment is avoided
+
+    # Model routing table, see config/routing.json
+    ROUTING_TABLE_PATH: Optional[str] = "config/routing.json"
+    ROUTING_RELOAD_INTERVAL: float = 5.0  # seconds between checks for file changes
+
+    # Latency SLO routes ("mode": "slo" in the routing table)
+    SLO_HEADER: str = "X-Latency-SLO"  # e.g. "ttfb_ms=800, tokens_per_second=30", overrides the route's SLO
+    SLO_WINDOW: float = 300.0  # seconds of streams per statistics window
+    SLO_MIN_SAMPLES: int = 20  # streams a window needs before its quantiles are trusted
+    SLO_EXPLORE_RATE: float = 0.05  # fraction of requests sent to other targets to keep their statistics fresh
+
+    # Token estimation and pre-flight context checks
+    TOKEN_CACHE_SIZE: int = 10000  # memoized message token counts
+    CONTEXT_OVERFLOW_POLICY: str = "reject"  # "reject", "trim" or "off"
+    MODEL_CONTEXT_WINDOWS: Dict[str, int] = {
+        "gpt-4o*": 128000,
+        "gpt-4.1*": 1047576,
+        "gpt-4-turbo*": 128000,
+        "gpt-4": 8192,
+        "gpt-3.5-turbo*": 16385,
+        "o1*": 200000,
+        "o3*": 200000,
+        "deepseek-chat": 65536,
+        "deepseek-reasoner": 65536,
+        "claude-*": 200000,
+    }
+
+    # Usage and cost accounting
+    USAGE_ENABLED: bool = True
+    USAGE_DB_PATH: str = "data/usage.db"
+    USAGE_FLUSH_INTERVAL: float = 10.0  # seconds between batched writes
+    # USD per million tokens, keyed by model name or glob pattern
+    MODEL_PRICES: Dict[str, Dict[str, float]] = {
+        "gpt-4o-mini*": {"prompt": 0.15, "completion": 0.60},
+        "gpt-4o*": {"prompt": 2.50, "completion": 10.00},
+        "gpt-4.1-mini*": {"prompt": 0.40, "completion": 1.60},
+        "gpt-4.1*": {"prompt": 2.00, "completion": 8.00},
+        "deepseek-chat": {"prompt": 0.27, "completion": 1.10},
+        "deepseek-reasoner": {"prompt": 0.55, "completion": 2.19},
+        "claude-opus-4*": {"prompt": 15.00, "completion": 75.00},
+        "claude-sonnet-4*": {"prompt": 3.00, "completion": 15.00},
+        "claude-3-5-haiku*": {"prompt": 0.80, "completion": 4.00},
+    }
+
+    # Admin endpoints (usage, debug); closed when unset
+    ADMIN_API_KEY: Optional[str] = None
+    ADMIN_OPEN_ACCESS: bool = False  # serve them without a key, for local use only
+
+    # Forward non-streaming request and response bodies without re-encoding
+    RAW_FORWARDING_ENABLED: bool = True
+
+    # Near-duplicate cache for non-streaming requests at temperature 0
+    SIMILARITY_CACHE_ENABLED: bool = False
+    SIMILARITY_CACHE_THRESHOLD: float = 0.9  # estimated Jaccard similarity of the conversation's shingles
+    SIMILARITY_CACHE_MODEL_THRESHOLDS: Dict[str, float] = {}  # keyed by model name or glob pattern
+    SIMILARITY_CACHE_MAX_ENTRIES: int = 10000
+    SIMILARITY_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    SIMILARITY_CACHE_TTL: float = 3600.0  # seconds
+
+    # Embeddings micro-batching
+    EMBEDDINGS_BATCH_WINDOW_MS: float = 5.0  # wait this long for more inputs before calling upstream
+    EMBEDDINGS_MAX_BATCH_SIZE: int = 256  # inputs per upstream request
+    EMBEDDINGS_CACHE_MAX_BYTES: int = 128 * 1024 * 1024  # vectors cached per input, 8 bytes per dimension
+
+    # Streaming
+    STREAM_BUFFER_SIZE: int = 32  # chunks buffered between upstream reader and client
+    STREAM_COALESCE_WINDOW_MS: float = 0.0  # join SSE frames arriving within this window, 0 disables
+    STREAM_COALESCE_MAX_BYTES: int = 4096  # flush a coalesced write once it reaches this size
+    STREAM_FAILOVER_ENABLED: bool = True  # resume streams an upstream breaks off on another deployment
+    STREAM_FAILOVER_MAX_ATTEMPTS: int = 2  # resumptions per stream
+
+    # WebSocket endpoint multiplexing completion streams
+    WS_ENABLED: bool = True
+    WS_MAX_STREAMS: int = 32  # concurrent streams per connection
+
+    # Response compression
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024  # bytes, smaller whole responses are sent as is
+    COMPRESSION_GZIP_LEVEL: int = 6
+
+    # Span tracing, exported as OTLP/JSON
+    TRACING_ENABLED: bool = False
+    TRACING_SAMPLE_RATE: float = 0.1  # fraction of new traces recorded, callers' traceparent decides otherwise
+    TRACING_EXPORT_FILE: Optional[str] = "logs/traces.jsonl"
+    TRACING_OTLP_ENDPOINT: Optional[str] = None  # e.g. http://localhost:4318/v1/traces
+    TRACING_EXPORT_INTERVAL: float = 5.0  # seconds
+
+    # Traffic capture for load testing with python -m app.tools.replay
+    CAPTURE_ENABLED: bool = False
+    CAPTURE_FILE: str = "logs/capture.jsonl"
+    CAPTURE_PAYLOADS: str = "redact"  # "redact", "full" or "none" (shape and timing only)
+    CAPTURE_SAMPLE_RATE: float = 1.0  # fraction of requests captured
+    CAPTURE_MAX_BODY_BYTES: int = 1024 * 1024  # larger bodies are captured by size only
+    CAPTURE_REDACT_KEY: Optional[str] = None  # secret behind redaction filler, else kept in CAPTURE_FILE + ".key"
+
+    # Admin debug endpoints: profiler, event loop lag and task counts
+    DEBUG_ENDPOINTS_ENABLED: bool = True
+    PROFILE_MAX_SECONDS: float = 60.0
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL: float = 0.1  # seconds between heartbeats
+    LOOP_SLOW_THRESHOLD_MS: float = 100.0  # loop stalls longer than this are recorded with their stack
+
     # Logging settings
     LOG_DIR: str = "logs"
     LOG_LEVEL: int = logging.INFO
@@ -38,17 +199,21 @@ class Settings(BaseSettings):
     ANTHROPIC_API_KEY: Optional[str] = None
     ANTHROPIC_API_BASE: str = "https://api.anthropic.com"
     ANTHROPIC_TIMEOUT: float = 30.0
+    ANTHROPIC_VERSION: str = "2023-06-01"
+    ANTHROPIC_DEFAULT_MAX_TOKENS: int = 4096  # the Messages API requires max_tokens
     
     # Deepseek Provider
     DEEPSEEK_API_KEY: Optional[str] = None
     DEEPSEEK_API_BASE: str = "https://api.deepseek.com/v1"
     DEEPSEEK_TIMEOUT: float = 30.0
     
-    # Provider configurations
+    # Provider defaults for routing table deployments, and the prefix
+    # routes used when there is no routing table file
     PROVIDER_CONFIGS: Dict[str, Dict[str, str]] = {
-        "gpt": {"provider": "openai", "api_key": "OPENAI_API_KEY", "api_base": "OPENAI_API_BASE"},
-        "anthropic": {"provider": "anthropic", "api_key": "ANTHROPIC_API_KEY", "api_base": "ANTHROPIC_API_BASE"},
-        "deepseek": {"provider": "deepseek", "api_key": "DEEPSEEK_API_KEY", "api_base": "DEEPSEEK_API_BASE"},
+        "gpt": {"provider": "openai", "api_key": "OPENAI_API_KEY", "api_base": "OPENAI_API_BASE", "timeout": "OPENAI_TIMEOUT"},
+        "text-embedding": {"provider": "openai", "api_key": "OPENAI_API_KEY", "api_base": "OPENAI_API_BASE", "timeout": "OPENAI_TIMEOUT"},
+        "claude": {"provider": "anthropic", "api_key": "ANTHROPIC_API_KEY", "api_base": "ANTHROPIC_API_BASE", "timeout": "ANTHROPIC_TIMEOUT"},
+        "deepseek": {"provider": "deepseek", "api_key": "DEEPSEEK_API_KEY", "api_base": "DEEPSEEK_API_BASE", "timeout": "DEEPSEEK_TIMEOUT"},
     }
     
     class Config:
@@ -1,5 +1,12 @@
 import contextvars
-from typing import Optional
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from app.core.config.settings import get_settings
+from app.core.exceptions import DeadlineExceededError
+
+logger = logging.getLogger(__name__)
 
 # Create a context variable for request_id
 request_id_var = contextvars.ContextVar("request_id", default=None)
@@ -10,4 +17,66 @@ def get_request_id() -> Optional[str]:
 
 def set_request_id(request_id: str) -> None:
     """Set request ID in context"""
-    request_id_var.set(request_id) 
\ No newline at end of file
+    request_id_var.set(request_id) 
+# Context variable for the tenant a request is accounted to
+tenant_var = contextvars.ContextVar("tenant", default=None)
+
+def get_tenant_id() -> Optional[str]:
+    """Get tenant ID from context"""
+    return tenant_var.get(None)
+
+def identify_tenant(request) -> str:
+    """Derive a stable tenant ID from a request
+
+    Callers are told apart by the TENANT_HEADER when one is configured
+    (set by a trusted proxy) and sent, else by client address. Bearer
+    tokens are not checked by the gateway, so they cannot name a tenant:
+    a caller could claim a fresh identity with every request.
+    """
+    header = get_settings().TENANT_HEADER
+    if header:
+        tenant = request.headers.get(header, "").strip()
+        if tenant:
+            return "hdr:" + tenant
+    return "ip:" + (request.client.host if request.client else "unknown")
+
+# Context variable for the request's deadline, on the monotonic clock
+# (which is also the event loop's clock, so asyncio.timeout_at takes it)
+deadline_var = contextvars.ContextVar("deadline", default=None)
+
+def get_deadline() -> Optional[float]:
+    """Get the request's deadline from context"""
+    return deadline_var.get(None)
+
+def remaining_time() -> Optional[float]:
+    """Seconds left until the request's deadline, None without one"""
+    deadline = deadline_var.get(None)
+    return None if deadline is None else deadline - time.monotonic()
+
+def check_deadline() -> None:
+    """Give up on a request whose deadline has passed"""
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceededError()
+
+# Context variable for the latency SLO fields a request asked for
+slo_var = contextvars.ContextVar("slo", default=None)
+
+def get_request_slo() -> Optional[Dict[str, float]]:
+    """Get the request's SLO overrides from context"""
+    return slo_var.get(None)
+
+def parse_deadline(request, header: str) -> Optional[float]:
+    """Deadline of a request from its timeout header, in seconds from now"""
+    return deadline_after(request.headers.get(header), f"{header} header")
+
+def deadline_after(value: Any, source: str = "timeout") -> Optional[float]:
+    """Deadline a timeout in seconds from now gives, None if it is unset"""
+    if value is None or value == "":
+        return None
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        logger.warning(f"Ignoring invalid {source}: {value!r}")
+        return None
+    return time.monotonic() + seconds if seconds > 0 else None
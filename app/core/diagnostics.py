@@ -0,0 +1,197 @@
+import asyncio
+import gc
+import os
+import sys
+import threading
+import time
+import types
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from app.core.config.settings import get_settings
+
+
+def _frame_label(frame: types.FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _format_stack(frame: Optional[types.FrameType], limit: int = 64) -> List[str]:
+    """Labels of frame and its callers, innermost first"""
+    stack = []
+    while frame is not None and len(stack) < limit:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    return stack
+
+
+def sample_profile(
+    seconds: float,
+    interval: float = 0.005,
+    thread_ids: Optional[List[int]] = None
+) -> str:
+    """Sample stacks for a while and return them in folded format
+
+    Runs in the calling thread, which should not be the one profiled. Each
+    output line is "outer;...;inner count", the input format of
+    flamegraph.pl, speedscope and most other flame graph tools.
+    """
+    own_id = threading.get_ident()
+    counts: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id or (thread_ids is not None and thread_id not in thread_ids):
+                continue
+            counts[";".join(reversed(_format_stack(frame)))] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+class LoopMonitor:
+    """Event loop lag watchdog
+
+    A task on the loop stamps a heartbeat every interval; the difference
+    between when it asked to wake up and when it did is the loop lag. A
+    separate thread checks the heartbeat and, while the loop is stuck for
+    longer than threshold, captures the loop thread's stack, which is the
+    code blocking it. GC pauses are timed through gc.callbacks. When the
+    loop is idle this costs one timer per interval.
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.1, max_events: int = 50):
+        self.interval = interval
+        self.threshold = threshold
+        self.slow_callbacks: Deque[Dict[str, Any]] = deque(maxlen=max_events)
+        self.lag_max = 0.0
+        self.lag_total = 0.0
+        self.samples = 0
+        self.gc_stats: Dict[int, Dict[str, float]] = {
+            generation: {"collections": 0, "pause_total_ms": 0.0, "pause_max_ms": 0.0}
+            for generation in range(3)
+        }
+        self._gc_started = 0.0
+        self._heartbeat = 0.0
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._pending_event: Optional[Dict[str, Any]] = None
+
+    async def _heartbeat_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.samples += 1
+            self.lag_total += lag
+            self.lag_max = max(self.lag_max, lag)
+            event = self._pending_event
+            if event is not None:
+                # The stall that was captured has ended, record how long it was
+                event["lag_ms"] = round(lag * 1000, 3)
+                self._pending_event = None
+
+    def _watch(self) -> None:
+        captured_for = 0.0
+        while not self._stopped.wait(self.interval):
+            heartbeat = self._heartbeat
+            if heartbeat == captured_for or time.monotonic() - heartbeat < self.interval + self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            event = {
+                "timestamp": time.time(),
+                "lag_ms": None,  # filled in once the loop resumes
+                "stack": _format_stack(frame),
+            }
+            self.slow_callbacks.append(event)
+            self._pending_event = event
+            captured_for = heartbeat
+
+    def _on_gc(self, phase: str, info: Dict[str, Any]) -> None:
+        if phase == "start":
+            self._gc_started = time.perf_counter()
+            return
+        pause = (time.perf_counter() - self._gc_started) * 1000
+        stats = self.gc_stats[info["generation"]]
+        stats["collections"] += 1
+        stats["pause_total_ms"] += pause
+        stats["pause_max_ms"] = max(stats["pause_max_ms"], pause)
+
+    async def start(self) -> None:
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._heartbeat_loop())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        gc.callbacks.append(self._on_gc)
+
+    async def stop(self) -> None:
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "lag_avg_ms": round(self.lag_total / self.samples * 1000, 3) if self.samples else None,
+            "lag_max_ms": round(self.lag_max * 1000, 3),
+            "slow_callbacks": list(self.slow_callbacks),
+            "gc": {
+                str(generation): {k: round(v, 3) for k, v in stats.items()}
+                for generation, stats in self.gc_stats.items()
+            },
+        }
+
+
+def _coroutine_name(obj: Any) -> str:
+    code = getattr(obj, "cr_code", None) or getattr(obj, "gi_code", None) or getattr(obj, "ag_code", None)
+    if code is not None:
+        return f"{getattr(obj, '__qualname__', code.co_name)} ({os.path.basename(code.co_filename)})"
+    return type(obj).__qualname__
+
+
+def count_tasks(include_generators: bool = True) -> Dict[str, Any]:
+    """Live tasks by coroutine, and live async generators by function
+
+    Counting generators scans the whole heap, so it is only done on demand.
+    """
+    tasks = Counter(_coroutine_name(task.get_coro()) for task in asyncio.all_tasks())
+    result: Dict[str, Any] = {
+        "tasks_total": sum(tasks.values()),
+        "tasks": dict(tasks.most_common()),
+    }
+    if include_generators:
+        generators = Counter(
+            _coroutine_name(obj) for obj in gc.get_objects()
+            if isinstance(obj, types.AsyncGeneratorType) and obj.ag_frame is not None
+        )
+        result["async_generators_total"] = sum(generators.values())
+        result["async_generators"] = dict(generators.most_common())
+    return result
+
+
+# Global loop monitor instance
+_loop_monitor: Optional[LoopMonitor] = None
+
+def get_loop_monitor() -> LoopMonitor:
+    """Get the process wide event loop monitor"""
+    global _loop_monitor
+    if _loop_monitor is None:
+        settings = get_settings()
+        _loop_monitor = LoopMonitor(
+            interval=settings.LOOP_MONITOR_INTERVAL,
+            threshold=settings.LOOP_SLOW_THRESHOLD_MS / 1000
+        )
+    return _loop_monitor
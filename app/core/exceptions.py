@@ -85,6 +85,17 @@ class ForbiddenError(AppError):
         )
 
 
+class ConflictError(AppError):
+    """Conflict with the current state error"""
+    def __init__(self, message: str, details: Optional[Dict[str, Any]] = None):
+        super().__init__(
+            status_code=status.HTTP_409_CONFLICT,
+            message=message,
+            error_code="CONFLICT",
+            details=details
+        )
+
+
 class InternalError(AppError):
     """Internal server error"""
     def __init__(self, message: str, details: Optional[Dict[str, Any]] = None):
@@ -118,6 +129,57 @@ class ProviderNotFoundError(LLMAPIException):
         )
 
 
+class ContextLengthExceededError(LLMAPIException):
+    """Raised when a request cannot fit the model's context window"""
+    def __init__(
+        self,
+        model: str,
+        context_window: int,
+        prompt_tokens: int,
+        completion_tokens: int = 0
+    ) -> None:
+        detail = (
+            f"This model's maximum context length is {context_window} tokens. "
+            f"However, you requested about {prompt_tokens + completion_tokens} tokens "
+            f"({prompt_tokens} in the messages, {completion_tokens} in the completion) "
+            f"for model: {model}"
+        )
+        super().__init__(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=detail
+        )
+
+
+class UpstreamTimeoutError(LLMAPIException):
+    """Raised when an upstream does not respond in time"""
+    def __init__(self, phase: str, timeout: Optional[float], url: Optional[str] = None) -> None:
+        detail = f"Upstream {phase} timeout after {timeout}s"
+        if url:
+            detail += f" ({url})"
+        super().__init__(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=detail
+        )
+
+
+class StreamInterruptedError(LLMAPIException):
+    """Raised when an upstream stream ends before the message is finished"""
+    def __init__(self, deployment: str) -> None:
+        super().__init__(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Stream from {deployment} ended before the message was finished"
+        )
+
+
+class DeadlineExceededError(LLMAPIException):
+    """Raised when a request cannot complete before the client's deadline"""
+    def __init__(self) -> None:
+        super().__init__(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="Request deadline exceeded"
+        )
+
+
 class ProviderAPIError(LLMAPIException):
     """Raised when provider API returns an error"""
     def __init__(
@@ -137,6 +199,7 @@ class ProviderAPIError(LLMAPIException):
             message += "\nPlease check your API permissions"
         elif status_code == 429:
             message += "\nRate limit exceeded"
+        self.upstream_status = status_code
             
         super().__init__(
             status_code=status.HTTP_502_BAD_GATEWAY,
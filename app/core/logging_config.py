@@ -5,8 +5,7 @@ import json
 from logging.handlers import RotatingFileHandler
 import httpx
 import sys
-from .context import get_request_id
-from .middleware.request_logging import request_id_var
+from .context import get_request_id, request_id_var
 
 # Environment variable to control color output
 FORCE_COLOR = os.getenv('FORCE_COLOR', '1').lower() in ('1', 'true', 'yes', 'on')
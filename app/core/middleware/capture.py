@@ -0,0 +1,301 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config.settings import get_settings
+from app.core.context import identify_tenant
+
+logger = logging.getLogger(__name__)
+
+# Values that say what a request is rather than what it is about, kept as
+# they are when payloads are redacted
+_KEEP_KEYS = {"model", "role", "type", "encoding_format", "tool_choice", "custom_id", "name"}
+
+
+def request_shape(body: Any) -> Dict[str, Any]:
+    """Summary of a request body that is enough to synthesize a similar one"""
+    if not isinstance(body, dict):
+        return {}
+    shape: Dict[str, Any] = {}
+    for key in ("model", "stream", "max_tokens", "temperature", "dimensions"):
+        if key in body:
+            shape[key] = body[key]
+    messages = body.get("messages")
+    if isinstance(messages, list):
+        shape["messages"] = [
+            {
+                "role": message.get("role"),
+                "chars": len(message["content"]) if isinstance(message.get("content"), str) else 0,
+            }
+            for message in messages if isinstance(message, dict)
+        ]
+    inputs = body.get("input")
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    if isinstance(inputs, list):
+        shape["inputs"] = [len(text) if isinstance(text, str) else 0 for text in inputs]
+    requests = body.get("requests")
+    if isinstance(requests, list):
+        shape["requests"] = len(requests)
+    return shape
+
+
+def load_shared_key(path: str) -> bytes:
+    """Read the key in path, creating it if missing; every process that
+    races to create it ends up with the same one"""
+    try:
+        with open(path, "rb") as f:
+            key = f.read()
+        if key:
+            return key
+    except FileNotFoundError:
+        pass
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600)
+    try:
+        os.write(fd, os.urandom(32))
+    finally:
+        os.close(fd)
+    try:
+        # Linking fails if another process got there first, theirs is kept
+        os.link(tmp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.unlink(tmp_path)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class Redactor:
+    """Replaces text with filler of the same length and word boundaries
+
+    The filler is derived from a keyed hash of the text, so equal strings
+    stay equal (and caches behave the same on replay) while the key, kept
+    out of the capture, keeps the original from being recovered by
+    guessing. Processes writing one capture must share the key.
+    """
+
+    def __init__(self, key: Optional[bytes] = None):
+        self.key = key or os.urandom(16)
+
+    def text(self, value: str) -> str:
+        stream = hashlib.shake_256(self.key + value.encode("utf-8")).digest(len(value))
+        return "".join(
+            char if char.isspace() else chr(97 + byte % 26)
+            for char, byte in zip(value, stream)
+        )
+
+    def redact(self, value: Any, key: Optional[str] = None) -> Any:
+        if isinstance(value, str):
+            return value if key in _KEEP_KEYS else self.text(value)
+        if isinstance(value, dict):
+            return {k: self.redact(v, k) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.redact(item, key) for item in value]
+        return value
+
+
+class TrafficCapture:
+    """Buffers captured request records and appends them to a JSONL file
+
+    Each record holds the request's wall clock start, path, tenant, the
+    headers that change how it is served, its shape and (depending on
+    payloads: "full", "redact" or "none") its body, together with the
+    status, time to first body byte, duration and size of the response.
+    app.tools.replay re-drives such a file against a gateway.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        payloads: str = "redact",
+        sample_rate: float = 1.0,
+        max_body_bytes: int = 1024 * 1024,
+        interval: float = 1.0,
+        max_queue: int = 100000,
+        redact_key: Optional[bytes] = None
+    ):
+        self.file_path = file_path
+        self.payloads = payloads
+        self.sample_rate = sample_rate
+        self.max_body_bytes = max_body_bytes
+        self.interval = interval
+        self.redact_key = redact_key
+        self.redactor = Redactor(redact_key)
+        self._queue: Deque[str] = deque(maxlen=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+    def sampled(self) -> bool:
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def payload(self, body: bytes) -> Dict[str, Any]:
+        """Shape and, per the payloads setting, content of a request body"""
+        fields: Dict[str, Any] = {"body_bytes": len(body)}
+        if not body:
+            return fields
+        if len(body) > self.max_body_bytes:
+            fields["truncated"] = True
+            return fields
+        try:
+            parsed = json.loads(body)
+        except ValueError:
+            return fields
+        fields["shape"] = request_shape(parsed)
+        if self.payloads == "full":
+            fields["body"] = parsed
+        elif self.payloads == "redact":
+            fields["body"] = self.redactor.redact(parsed)
+        return fields
+
+    def add(self, record: Dict[str, Any]) -> None:
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+        self._queue.append(json.dumps(record, separators=(",", ":")))
+
+    def _append(self, lines: str) -> None:
+        with open(self.file_path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    async def flush(self) -> None:
+        """Write all buffered records"""
+        if not self._queue:
+            return
+        lines = "".join(line + "\n" for line in self._queue)
+        self._queue.clear()
+        await asyncio.to_thread(self._append, lines)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Traffic capture write failed, records dropped: {e}")
+
+    async def start(self) -> None:
+        if os.path.dirname(self.file_path):
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        if self.payloads == "redact" and self.redact_key is None:
+            # Shared by the workers, so equal texts get equal filler in every one
+            self.redactor = Redactor(await asyncio.to_thread(load_shared_key, f"{self.file_path}.key"))
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning(f"Final traffic capture write failed: {e}")
+
+
+class CaptureMiddleware:
+    """Records every API request for later replay
+
+    A pure ASGI middleware so streamed responses are timed until their
+    final body message. Should wrap compression, so response sizes are
+    those the client received.
+    """
+
+    def __init__(self, app: ASGIApp, capture: Optional[TrafficCapture] = None):
+        self.app = app
+        self.capture = capture or get_traffic_capture()
+        settings = get_settings()
+        self.prefix = settings.API_V1_STR
+        # Forwarded on replay, they change how a request is served
+        self.headers = [
+            settings.PRIORITY_HEADER.lower(),
+            settings.DEADLINE_HEADER.lower(),
+            settings.SLO_HEADER.lower(),
+            "accept-encoding"
+        ]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or not scope["path"].startswith(self.prefix)
+            or scope["path"].startswith(self.prefix + "/debug")
+            or not self.capture.sampled()
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        record: Dict[str, Any] = {
+            "ts": time.time(),
+            "method": scope["method"],
+            "path": scope["path"],
+            "query": scope.get("query_string", b"").decode("latin-1"),
+            "tenant": identify_tenant(Request(scope)),
+            "headers": {name: headers[name] for name in self.headers if name in headers},
+        }
+        start = time.perf_counter()
+        body = bytearray()
+        timing: Dict[str, Any] = {"response_bytes": 0, "chunks": 0}
+
+        async def capture_receive() -> Message:
+            message = await receive()
+            if message["type"] == "http.request" and len(body) <= self.capture.max_body_bytes:
+                body.extend(message.get("body", b""))
+            return message
+
+        async def capture_send(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                response_headers = Headers(raw=message["headers"])
+                timing["status"] = message["status"]
+                timing["trace_id"] = response_headers.get("x-trace-id")
+                timing["stream"] = response_headers.get("content-type", "").startswith("text/event-stream")
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                if chunk:
+                    timing.setdefault("ttfb", time.perf_counter() - start)
+                    timing["response_bytes"] += len(chunk)
+                    timing["chunks"] += 1
+            await send(message)
+
+        try:
+            await self.app(scope, capture_receive, capture_send)
+        finally:
+            record["duration"] = time.perf_counter() - start
+            record.update(timing)
+            record.setdefault("status", 500)
+            try:
+                record.update(self.capture.payload(bytes(body)))
+                self.capture.add(record)
+            except Exception as e:
+                logger.warning(f"Failed to capture request: {e}")
+
+
+# Global traffic capture instance
+_traffic_capture: Optional[TrafficCapture] = None
+
+def get_traffic_capture() -> TrafficCapture:
+    """Get the process wide traffic capture"""
+    global _traffic_capture
+    if _traffic_capture is None:
+        settings = get_settings()
+        _traffic_capture = TrafficCapture(
+            file_path=settings.CAPTURE_FILE,
+            payloads=settings.CAPTURE_PAYLOADS,
+            sample_rate=settings.CAPTURE_SAMPLE_RATE,
+            max_body_bytes=settings.CAPTURE_MAX_BODY_BYTES,
+            redact_key=settings.CAPTURE_REDACT_KEY.encode("utf-8") if settings.CAPTURE_REDACT_KEY else None
+        )
+    return _traffic_capture
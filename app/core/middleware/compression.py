@@ -0,0 +1,256 @@
+import time
+import zlib
+from typing import Dict, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # optional, enables "br"
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional, enables "zstd"
+    zstandard = None
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+)
+
+
+class CompressionStats:
+    """Running totals of compression work, for ratio and CPU cost reporting"""
+
+    def __init__(self):
+        self.responses: Dict[str, int] = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "responses": dict(self.responses),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": round(self.bytes_in / self.bytes_out, 3) if self.bytes_out else None,
+            "cpu_seconds": round(self.seconds, 6),
+            "cpu_us_per_kb": round(self.seconds * 1e6 / (self.bytes_in / 1024), 3) if self.bytes_in else None,
+        }
+
+
+compression_stats = CompressionStats()
+
+
+class _Compressor:
+    """Incremental compressor with a flush that emits everything written so far"""
+
+    def __init__(self, encoding: str, gzip_level: int):
+        self.encoding = encoding
+        if encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=3).compressobj()
+        elif encoding == "br":
+            self._obj = brotli.Compressor(quality=4)
+        else:
+            self._obj = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def _timed(self, data: bytes, func) -> bytes:
+        start = time.perf_counter()
+        out = func()
+        compression_stats.seconds += time.perf_counter() - start
+        compression_stats.bytes_in += len(data)
+        compression_stats.bytes_out += len(out)
+        return out
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress data, possibly holding some of it back for a better ratio"""
+        def run() -> bytes:
+            if self.encoding == "br":
+                return self._obj.process(data)
+            return self._obj.compress(data)
+        return self._timed(data, run)
+
+    def compress_flush(self, data: bytes) -> bytes:
+        """Compress data and flush it so the client can decode it right away"""
+        def run() -> bytes:
+            if self.encoding == "zstd":
+                return self._obj.compress(data) + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            if self.encoding == "br":
+                return self._obj.process(data) + self._obj.flush()
+            return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+        return self._timed(data, run)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        """Compress the last data and end the stream"""
+        def run() -> bytes:
+            if self.encoding == "zstd":
+                return self._obj.compress(data) + self._obj.flush()
+            if self.encoding == "br":
+                return self._obj.process(data) + self._obj.finish()
+            return self._obj.compress(data) + self._obj.flush()
+        return self._timed(data, run)
+
+
+def get_supported_encodings() -> List[str]:
+    """Encodings available in this process, in order of preference"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def negotiate_encoding(accept_encoding: str, supported: List[str]) -> Optional[str]:
+    """Pick the best supported encoding from an Accept-Encoding header"""
+    qualities: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in supported:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class CompressionMiddleware:
+    """Negotiated response compression (gzip, plus br/zstd when installed)
+
+    Responses with a known length are compressed only above minimum_size.
+    Streamed responses of unknown length, including text/event-stream, are
+    compressed incrementally and flushed after every body message, so each
+    (coalesced) SSE frame reaches the client as soon as it would have
+    uncompressed.
+
+    This is a pure ASGI middleware rather than BaseHTTPMiddleware so it can
+    see and flush individual body messages.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.supported = get_supported_encodings()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        encoding = negotiate_encoding(accept_encoding, self.supported) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(send, encoding, self.minimum_size, self.gzip_level)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, send: Send, encoding: str, minimum_size: int, gzip_level: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self._start: Optional[Message] = None
+        self._compressor: Optional[_Compressor] = None
+        self._passthrough = False
+        self._known_length = False
+
+    def _start_compressing(self, content_length: Optional[int] = None) -> None:
+        headers = MutableHeaders(raw=self._start["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if content_length is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(content_length)
+        compression_stats.responses[self.encoding] = compression_stats.responses.get(self.encoding, 0) + 1
+
+    async def send(self, message: Message) -> None:
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            content_length = headers.get("content-length")
+            # A declared length means the whole body exists up front, even
+            # if it arrives in several messages (e.g. via BaseHTTPMiddleware)
+            self._known_length = content_length is not None
+            self._passthrough = (
+                "content-encoding" in headers
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+                or (self._known_length and int(content_length) < self.minimum_size)
+            )
+            if self._passthrough:
+                await self._send(message)
+            else:
+                # Held back until the first body message shows whether this
+                # is a whole response or a stream
+                self._start = message
+            return
+
+        if message_type != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._start is not None:
+            if not more_body:
+                # Whole response in one message
+                if len(body) < self.minimum_size:
+                    await self._send(self._start)
+                    self._start = None
+                    await self._send(message)
+                    return
+                compressed = _Compressor(self.encoding, self.gzip_level).finish(body)
+                self._start_compressing(content_length=len(compressed))
+                await self._send(self._start)
+                self._start = None
+                await self._send({"type": "http.response.body", "body": compressed})
+                return
+
+            self._compressor = _Compressor(self.encoding, self.gzip_level)
+            self._start_compressing()
+            await self._send(self._start)
+            self._start = None
+
+        if self._compressor is None:
+            await self._send(message)
+            return
+
+        if more_body:
+            if not body:
+                return
+            if self._known_length:
+                # Not latency sensitive, let the compressor pick block boundaries
+                data = self._compressor.compress(body)
+            else:
+                data = self._compressor.compress_flush(body)
+            if data:
+                await self._send({"type": "http.response.body", "body": data, "more_body": True})
+        else:
+            await self._send({
+                "type": "http.response.body",
+                "body": self._compressor.finish(body),
+                "more_body": False
+            })
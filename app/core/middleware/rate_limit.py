@@ -1,12 +1,59 @@
-from typing import Callable
+from typing import Callable, Dict, List, Optional
 from fastapi import Request, Response
+from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 from app.core.config.settings import get_settings
+from app.core.context import identify_tenant
 from app.core.exceptions import RateLimitError
 import time
 import asyncio
 from collections import defaultdict
 
+# Orchestrator and load balancer probes
+EXEMPT_PATHS = {"/healthz", "/readyz"}
+
+
+class RateLimiter:
+    """Sliding window request counts per tenant
+
+    Shared by the HTTP middleware and the WebSocket endpoint, whose
+    requests arrive as messages the middleware never sees.
+    """
+
+    def __init__(self, requests: int, period: float):
+        self.max_requests = requests
+        self.period = period
+        self.requests: Dict[str, List[float]] = defaultdict(list)  # tenant -> list of timestamps
+
+    def check(self, tenant: str) -> None:
+        """Count a request of tenant, raising RateLimitError over the limit"""
+        # Clean old requests
+        current_time = time.time()
+        self.requests[tenant] = [
+            ts for ts in self.requests[tenant]
+            if current_time - ts < self.period
+        ]
+
+        # Check rate limit
+        if len(self.requests[tenant]) >= self.max_requests:
+            raise RateLimitError(
+                f"Rate limit of {self.max_requests} requests per {self.period}s exceeded"
+            )
+
+        # Add current request
+        self.requests[tenant].append(current_time)
+
+    def prune(self) -> None:
+        """Forget requests that have left the window"""
+        current_time = time.time()
+        for tenant in list(self.requests.keys()):
+            self.requests[tenant] = [
+                ts for ts in self.requests[tenant]
+                if current_time - ts < self.period
+            ]
+            if not self.requests[tenant]:
+                del self.requests[tenant]
+
 
 class RateLimitMiddleware(BaseHTTPMiddleware):
     """Middleware for rate limiting requests"""
@@ -14,29 +61,20 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
     def __init__(self, app):
         super().__init__(app)
         self.settings = get_settings()
-        self.requests = defaultdict(list)  # client_ip -> list of timestamps
+        self.limiter = get_rate_limiter()
         self._cleanup_task = None
     
     async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        if not self.settings.RATE_LIMIT_ENABLED:
+        if not self.settings.RATE_LIMIT_ENABLED or request.url.path in EXEMPT_PATHS:
             return await call_next(request)
         
-        # Get client IP
-        client_ip = request.client.host if request.client else "unknown"
-        
-        # Clean old requests
-        current_time = time.time()
-        self.requests[client_ip] = [
-            ts for ts in self.requests[client_ip]
-            if current_time - ts < self.settings.RATE_LIMIT_PERIOD
-        ]
-        
-        # Check rate limit
-        if len(self.requests[client_ip]) >= self.settings.RATE_LIMIT_REQUESTS:
-            raise RateLimitError()
-        
-        # Add current request
-        self.requests[client_ip].append(current_time)
+        # Same identity the upstream scheduler and usage accounting use
+        tenant = identify_tenant(request)
+        try:
+            self.limiter.check(tenant)
+        except RateLimitError as error:
+            # Raised here it would bypass the exception handlers and turn into a 500
+            return JSONResponse(status_code=error.status_code, content=error.to_dict())
         
         # Start cleanup task if not running
         if self._cleanup_task is None or self._cleanup_task.done():
@@ -48,11 +86,16 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         """Periodically clean up old requests"""
         while True:
             await asyncio.sleep(60)  # Clean up every minute
-            current_time = time.time()
-            for ip in list(self.requests.keys()):
-                self.requests[ip] = [
-                    ts for ts in self.requests[ip]
-                    if current_time - ts < self.settings.RATE_LIMIT_PERIOD
-                ]
-                if not self.requests[ip]:
-                    del self.requests[ip] 
\ No newline at end of file
+            self.limiter.prune()
+
+
+# Global rate limiter instance
+_rate_limiter: Optional[RateLimiter] = None
+
+def get_rate_limiter() -> RateLimiter:
+    """Get the process wide per tenant rate limiter"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        settings = get_settings()
+        _rate_limiter = RateLimiter(settings.RATE_LIMIT_REQUESTS, settings.RATE_LIMIT_PERIOD)
+    return _rate_limiter
@@ -1,19 +1,17 @@
 import time
 import logging
 import uuid
-import contextvars
 from typing import Callable, Awaitable
 from fastapi import Request, Response
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import StreamingResponse
 from starlette.types import ASGIApp, Message
-from app.core.context import set_request_id, get_request_id
+from app.core.config.settings import get_settings
+from app.core.context import deadline_var, identify_tenant, parse_deadline, request_id_var, slo_var, tenant_var
+from app.core.providers.latency import parse_slo
 
 logger = logging.getLogger(__name__)
 
-# Create a context variable for trace_id
-request_id_var = contextvars.ContextVar("request_id", default=None)
-
 class RequestLoggingMiddleware(BaseHTTPMiddleware):
     """Middleware for logging requests and responses"""
     
@@ -33,8 +31,10 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
         # Get or generate trace ID and set it in context at the very beginning
         # This needs to happen before ANY logging
         trace_id = self.get_trace_id(request)
-        request_id_var.set(trace_id)  # Set in context vars
-        set_request_id(trace_id)  # Set in our app context
+        request_id_var.set(trace_id)
+        tenant_var.set(identify_tenant(request))  # For usage accounting
+        deadline_var.set(parse_deadline(request, get_settings().DEADLINE_HEADER))
+        slo_var.set(parse_slo(request.headers.get(get_settings().SLO_HEADER)))
         
         # Add trace ID to request state and headers for downstream use
         request.state.trace_id = trace_id
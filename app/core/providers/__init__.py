@@ -1,10 +1,12 @@
 from .base import LLMProvider, LLMProviderFactory
 from .openai import OpenAIProvider
 from .deepseek import DeepseekProvider
+from .anthropic import AnthropicProvider
 
 __all__ = [
     "LLMProvider",
     "LLMProviderFactory",
     "OpenAIProvider",
-    "DeepseekProvider"
+    "DeepseekProvider",
+    "AnthropicProvider"
 ] 
\ No newline at end of file
@@ -0,0 +1,245 @@
+from typing import Any, AsyncGenerator, Dict, List, Optional
+import json
+import time
+
+from app.core.config.settings import get_settings
+from app.core.exceptions import ProviderAPIError
+from app.schemas.base import (
+    ChatCompletionChoice,
+    ChatCompletionRequest,
+    ChatCompletionResponse,
+    Message,
+    UsageInfo
+)
+from .base import LLMProvider, LLMProviderFactory
+from .base_openai import extract_error_message
+from .http_client import HTTPClientProvider
+
+# Anthropic stop reasons as OpenAI finish reasons
+FINISH_REASONS = {
+    "end_turn": "stop",
+    "stop_sequence": "stop",
+    "max_tokens": "length",
+    "tool_use": "tool_calls",
+    "refusal": "content_filter",
+}
+
+# OpenAI accepts temperatures up to 2, the Messages API only up to 1
+MAX_TEMPERATURE = 1.0
+
+
+def _prompt_tokens(usage: Dict[str, Any]) -> int:
+    """Input tokens including those written to or read from the prompt cache"""
+    return (
+        usage.get("input_tokens", 0)
+        + (usage.get("cache_creation_input_tokens") or 0)
+        + (usage.get("cache_read_input_tokens") or 0)
+    )
+
+
+@LLMProviderFactory.register("anthropic")
+class AnthropicProvider(LLMProvider, HTTPClientProvider):
+    """Anthropic Messages API provider
+
+    Translates OpenAI style chat completions to the Messages API and back.
+    A message with cache_control (e.g. {"type": "ephemeral"}) marks the end
+    of a prefix the upstream should cache, typically a long system prompt.
+    """
+
+    supports_prefill = True
+
+    def __init__(self, api_key: str, api_base: str, timeout: float = 30.0):
+        super().__init__(api_key, api_base, timeout)
+        self.messages_url = f"{self.api_base}/v1/messages"
+        self.models_url = f"{self.api_base}/v1/models"
+
+    @classmethod
+    def from_settings(cls) -> "AnthropicProvider":
+        """Create provider instance from settings"""
+        settings = get_settings()
+        return cls(
+            api_key=settings.ANTHROPIC_API_KEY,
+            api_base=settings.ANTHROPIC_API_BASE,
+            timeout=settings.ANTHROPIC_TIMEOUT
+        )
+
+    async def health_check(self) -> None:
+        """Probe the model list, which costs no tokens"""
+        await self.probe(self.models_url)
+
+    def auth_headers(self, api_key: str) -> Dict[str, str]:
+        """Anthropic authenticates with x-api-key"""
+        return {"x-api-key": api_key}
+
+    def prepare_headers(self, **kwargs) -> Dict[str, str]:
+        """Anthropic needs an API version"""
+        headers = super().prepare_headers(**kwargs)
+        headers["anthropic-version"] = get_settings().ANTHROPIC_VERSION
+        return headers
+
+    @staticmethod
+    def _content_block(message: Message) -> Dict[str, Any]:
+        block: Dict[str, Any] = {"type": "text", "text": message.content}
+        if message.cache_control:
+            block["cache_control"] = message.cache_control
+        return block
+
+    def prepare_payload(self, request: ChatCompletionRequest) -> Dict[str, Any]:
+        """Translate an OpenAI style request to a Messages API request"""
+        system: List[Dict[str, Any]] = []
+        messages: List[Dict[str, Any]] = []
+        for message in request.messages:
+            if message.role in ("system", "developer"):
+                system.append(self._content_block(message))
+                continue
+            role = "assistant" if message.role == "assistant" else "user"
+            if messages and messages[-1]["role"] == role:
+                # Consecutive turns of one role become one multi-block turn
+                messages[-1]["content"].append(self._content_block(message))
+            else:
+                messages.append({"role": role, "content": [self._content_block(message)]})
+
+        payload: Dict[str, Any] = {
+            "model": request.model,
+            "messages": messages,
+            "max_tokens": request.max_tokens or get_settings().ANTHROPIC_DEFAULT_MAX_TOKENS,
+        }
+        if system:
+            payload["system"] = system
+        if request.temperature is not None:
+            # Clamped rather than scaled, so 0 to 1 means the same on both APIs
+            payload["temperature"] = min(request.temperature, MAX_TEMPERATURE)
+        if request.top_p is not None:
+            payload["top_p"] = request.top_p
+        if request.stream:
+            payload["stream"] = True
+        return payload
+
+    async def chat_completion(self, request: ChatCompletionRequest) -> ChatCompletionResponse:
+        """Execute chat completion request"""
+        if request.stream:
+            raise ValueError("Use chat_completion_stream for streaming requests")
+
+        response = await self.make_request(
+            method="POST",
+            url=self.messages_url,
+            json=self.prepare_payload(request),
+            raise_for_status=False
+        )
+        if response.status_code >= 400:
+            raise ProviderAPIError(
+                provider="Anthropic",
+                status_code=response.status_code,
+                detail=extract_error_message(response.content),
+                url=self.messages_url
+            )
+        data = response.json()
+        usage = data.get("usage", {})
+        prompt_tokens = _prompt_tokens(usage)
+        completion_tokens = usage.get("output_tokens", 0)
+        text = "".join(
+            block.get("text", "") for block in data.get("content", []) if block.get("type") == "text"
+        )
+        return ChatCompletionResponse(
+            id=data.get("id", f"chatcmpl-{time.time()}"),
+            created=int(time.time()),
+            model=data.get("model", request.model),
+            choices=[
+                ChatCompletionChoice(
+                    index=0,
+                    message=Message(role="assistant", content=text),
+                    finish_reason=FINISH_REASONS.get(data.get("stop_reason"), data.get("stop_reason"))
+                )
+            ],
+            usage=UsageInfo(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            )
+        )
+
+    async def chat_completion_stream(
+        self,
+        request: ChatCompletionRequest
+    ) -> AsyncGenerator[str, None]:
+        """Execute streaming chat completion request
+
+        Every upstream event is translated to an OpenAI chunk as soon as it
+        arrives. Chunks are built as plain dicts in the shape the OpenAI
+        compatible providers emit, skipping model validation per token.
+        """
+        request.stream = True
+        self._reset_stream_state()
+        client_wants_usage = bool((request.stream_options or {}).get("include_usage"))
+        message_id = f"chatcmpl-{time.time()}"
+        created = int(time.time())
+        model = request.model
+        prompt_tokens = 0
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+            data = {
+                "id": message_id,
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(data)}\n\n"
+
+        async with self.stream_request(
+            method="POST",
+            url=self.messages_url,
+            json=self.prepare_payload(request)
+        ) as response:
+            async for line in self.aiter_lines(response):
+                # "event:" lines repeat the type that every data payload carries
+                if not line.startswith("data:"):
+                    continue
+                try:
+                    event = json.loads(line[5:])
+                except json.JSONDecodeError:
+                    continue
+                event_type = event.get("type")
+
+                if event_type == "content_block_delta":
+                    delta = event.get("delta", {})
+                    if delta.get("type") == "text_delta" and delta.get("text"):
+                        self._stream_text(delta["text"])
+                        yield chunk({"role": None, "content": delta["text"]})
+                elif event_type == "message_start":
+                    message = event.get("message", {})
+                    message_id = message.get("id", message_id)
+                    model = message.get("model", model)
+                    prompt_tokens = _prompt_tokens(message.get("usage", {}))
+                    yield chunk({"role": "assistant", "content": ""})
+                elif event_type == "message_delta":
+                    stop_reason = event.get("delta", {}).get("stop_reason")
+                    self.stream_finished = True
+                    completion_tokens = event.get("usage", {}).get("output_tokens", 0)
+                    self.stream_usage = UsageInfo(
+                        prompt_tokens=prompt_tokens,
+                        completion_tokens=completion_tokens,
+                        total_tokens=prompt_tokens + completion_tokens
+                    )
+                    yield chunk({"role": None, "content": None}, FINISH_REASONS.get(stop_reason, stop_reason))
+                elif event_type == "message_stop":
+                    self.stream_finished = True
+                    break
+                elif event_type == "error":
+                    error = event.get("error", {})
+                    raise ProviderAPIError(
+                        provider="Anthropic",
+                        status_code=response.status_code,
+                        detail=error.get("message", str(error)),
+                        url=self.messages_url
+                    )
+
+        if client_wants_usage and self.stream_usage is not None:
+            data = {
+                "id": message_id,
+                "created": created,
+                "model": model,
+                "choices": [],
+                "usage": self.stream_usage.model_dump(),
+            }
+            yield f"data: {json.dumps(data)}\n\n"
+        yield "data: [DONE]\n\n"
@@ -1,6 +1,6 @@
 import time
 import json
-from typing import AsyncGenerator, Any, Callable, TypeVar, Dict, List, Type, ClassVar, Optional
+from typing import AsyncGenerator, Any, Callable, TypeVar, Dict, List, Type, ClassVar, Optional, Tuple
 import httpx
 from abc import ABC, abstractmethod
 from app.schemas.base import (
@@ -19,6 +19,22 @@ T = TypeVar('T')
 
 class LLMProvider(ABC):
     """Abstract base class for LLM providers"""
+
+    # Set by chat_completion_stream for usage accounting and failover: the
+    # upstream's usage report if it sent one, the streamed completion text,
+    # and whether the upstream finished the message (a finish reason or its
+    # end of stream marker arrived)
+    stream_usage: Optional[UsageInfo] = None
+    stream_completion_chars: int = 0
+    stream_completion_parts: List[str]
+    stream_finished: bool = False
+
+    # Whether chat_completion_raw can forward request bodies as they are
+    supports_raw_forwarding: ClassVar[bool] = False
+    # Whether the upstream has an embeddings API
+    supports_embeddings: ClassVar[bool] = False
+    # Whether a trailing assistant message is continued rather than answered
+    supports_prefill: ClassVar[bool] = False
     
     @abstractmethod
     async def chat_completion(self, request: ChatCompletionRequest) -> ChatCompletionResponse:
@@ -30,6 +46,38 @@ class LLMProvider(ABC):
         """Execute streaming chat completion request"""
         pass
 
+    def _reset_stream_state(self) -> None:
+        self.stream_usage = None
+        self.stream_completion_chars = 0
+        self.stream_completion_parts = []
+        self.stream_finished = False
+
+    def _stream_text(self, text: str) -> None:
+        """Account for completion text passed on to the client"""
+        self.stream_completion_chars += len(text)
+        self.stream_completion_parts.append(text)
+
+    @property
+    def stream_completion_text(self) -> str:
+        return "".join(getattr(self, "stream_completion_parts", ()))
+
+    async def chat_completion_raw(self, body: bytes) -> bytes:
+        """Forward an encoded request body and return the response body as is"""
+        raise NotImplementedError
+
+    async def embeddings(
+        self,
+        inputs: List[str],
+        model: str,
+        dimensions: Optional[int] = None
+    ) -> Tuple[List[List[float]], int]:
+        """Embed inputs, returning the vectors in input order and the prompt tokens used"""
+        raise NotImplementedError
+
+    async def health_check(self) -> None:
+        """Cheaply check that the upstream can serve requests, raising if not"""
+        raise NotImplementedError
+
     async def __aenter__(self):
         return self
 
@@ -46,19 +94,32 @@ class LLMProviderFactory:
     _providers: ClassVar[Dict[str, Type[LLMProvider]]] = {}
     
     @classmethod
-    def register(cls, prefix: str):
-        """Register provider class with model name prefix"""
+    def register(cls, name: str):
+        """Register provider class under the name deployments refer to it by"""
         def wrapper(provider_cls: Type[LLMProvider]) -> Type[LLMProvider]:
-            cls._providers[prefix] = provider_cls
+            cls._providers[name] = provider_cls
             return provider_cls
         return wrapper
     
     @classmethod
-    def create(cls, model: str) -> LLMProvider:
-        """Create provider instance for model"""
-        for prefix, provider_cls in cls._providers.items():
-            if model.startswith(prefix):
-                if hasattr(provider_cls, 'from_settings'):
-                    return provider_cls.from_settings()
-                return provider_cls()
-        raise ValueError(f"No provider found for model: {model}") 
\ No newline at end of file
+    def is_registered(cls, provider: str) -> bool:
+        """Whether a provider class is registered under this name"""
+        return provider in cls._providers
+
+    @classmethod
+    def get_class(cls, provider: str) -> Type[LLMProvider]:
+        """Provider class registered under this name"""
+        provider_cls = cls._providers.get(provider)
+        if provider_cls is None:
+            raise ProviderNotFoundError(provider)
+        return provider_cls
+
+    @classmethod
+    def create(cls, deployment) -> LLMProvider:
+        """Create provider instance for a routing table deployment"""
+        provider_cls = cls.get_class(deployment.provider)
+        return provider_cls(
+            api_key=deployment.api_key,
+            api_base=deployment.api_base,
+            timeout=deployment.timeouts
+        )
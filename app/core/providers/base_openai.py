@@ -1,4 +1,4 @@
-from typing import Dict, AsyncGenerator
+from typing import Any, Dict, AsyncGenerator, List, Optional, Tuple
 import json
 import time
 
@@ -16,12 +16,67 @@ from app.schemas.base import (
 from .base import LLMProvider
 from .http_client import HTTPClientProvider
 
+_decoder = json.JSONDecoder()
+
+
+def patch_json_body(body: bytes, updates: Dict[str, Any]) -> bytes:
+    """Set top level fields of an encoded JSON object"""
+    data = json.loads(body)
+    data.update(updates)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def extract_usage(body: bytes) -> Optional[UsageInfo]:
+    """Read the usage object of an encoded completion response
+
+    Usage is normally the last field, so only that object is decoded
+    rather than the whole response.
+    """
+    text = body.decode("utf-8", errors="replace")
+    key = text.rfind('"usage"')
+    if key != -1:
+        start = text.find("{", key)
+        if start != -1:
+            try:
+                usage, _ = _decoder.raw_decode(text, start)
+                return UsageInfo(**{k: v for k, v in usage.items() if k in UsageInfo.model_fields})
+            except (ValueError, TypeError, AttributeError):
+                pass
+    try:
+        usage = json.loads(text).get("usage")
+    except (ValueError, AttributeError):
+        return None
+    return UsageInfo(**{k: v for k, v in usage.items() if k in UsageInfo.model_fields}) if usage else None
+
+
+def extract_error_message(body: bytes) -> str:
+    """Error message of an upstream error response, or the raw body"""
+    try:
+        error = json.loads(body).get("error")
+        if isinstance(error, dict) and error.get("message"):
+            return error["message"]
+        if isinstance(error, str):
+            return error
+    except (ValueError, AttributeError):
+        pass
+    return body.decode("utf-8", errors="replace")[:500]
+
+
 class OpenAICompatibleProvider(LLMProvider, HTTPClientProvider):
     """Base class for OpenAI-compatible providers"""
 
+    supports_raw_forwarding = True
+    supports_embeddings = True
+
     def __init__(self, api_key: str, api_base: str, timeout: float = 30.0):
         super().__init__(api_key, api_base, timeout)
         self.chat_completion_url = f"{self.api_base}/chat/completions"
+        self.embeddings_url = f"{self.api_base}/embeddings"
+        self.models_url = f"{self.api_base}/models"
+
+    def prepare_payload(self, request: ChatCompletionRequest) -> Dict:
+        """Prepare request payload"""
+        return request.model_dump(exclude_none=True)
 
     async def chat_completion(self, request: ChatCompletionRequest) -> ChatCompletionResponse:
         """Execute chat completion request"""
@@ -31,24 +86,87 @@ class OpenAICompatibleProvider(LLMProvider, HTTPClientProvider):
         response = await self.make_request(
             method="POST",
             url=self.chat_completion_url,
-            json=request.model_dump(exclude_none=True)
+            json=self.prepare_payload(request)
         )
         return self._process_completion_response(response.json())
 
+    async def chat_completion_raw(self, body: bytes) -> bytes:
+        """Forward an encoded request body and return the response body as is"""
+        response = await self.make_request(
+            method="POST",
+            url=self.chat_completion_url,
+            content=body,
+            raise_for_status=False
+        )
+        if response.status_code >= 400:
+            raise ProviderAPIError(
+                provider=type(self).__name__.replace("Provider", ""),
+                status_code=response.status_code,
+                detail=extract_error_message(response.content),
+                url=self.chat_completion_url
+            )
+        return response.content
+
+    async def health_check(self) -> None:
+        """Probe the model list, which costs no tokens"""
+        await self.probe(self.models_url)
+
+    async def embeddings(
+        self,
+        inputs: List[str],
+        model: str,
+        dimensions: Optional[int] = None
+    ) -> Tuple[List[List[float]], int]:
+        """Embed inputs, returning the vectors in input order and the prompt tokens used"""
+        payload: Dict[str, Any] = {"model": model, "input": inputs, "encoding_format": "float"}
+        if dimensions is not None:
+            payload["dimensions"] = dimensions
+        response = await self.make_request(
+            method="POST",
+            url=self.embeddings_url,
+            json=payload,
+            raise_for_status=False
+        )
+        if response.status_code >= 400:
+            raise ProviderAPIError(
+                provider=type(self).__name__.replace("Provider", ""),
+                status_code=response.status_code,
+                detail=extract_error_message(response.content),
+                url=self.embeddings_url
+            )
+        data = response.json()
+        vectors: List[List[float]] = [[] for _ in inputs]
+        for item in data["data"]:
+            vectors[item["index"]] = item["embedding"]
+        return vectors, data.get("usage", {}).get("prompt_tokens", 0)
+
     async def chat_completion_stream(
         self,
         request: ChatCompletionRequest
     ) -> AsyncGenerator[str, None]:
         """Execute streaming chat completion request"""
         request.stream = True
-        
+        self._reset_stream_state()
+        payload = self.prepare_payload(request)
+        # Always ask for the final usage chunk, but only pass it on to
+        # clients that asked for it themselves
+        client_wants_usage = bool((request.stream_options or {}).get("include_usage"))
+        payload["stream_options"] = {**(request.stream_options or {}), "include_usage": True}
+
         async with self.stream_request(
             method="POST",
             url=self.chat_completion_url,
-            json=request.model_dump(exclude_none=True)
+            json=payload
         ) as response:
             async for chunk in self._process_stream_response(response):
-                yield f"data: {json.dumps(chunk.model_dump())}\n\n"
+                if chunk.usage is not None:
+                    self.stream_usage = chunk.usage
+                    if not client_wants_usage:
+                        if not chunk.choices:
+                            continue
+                        chunk.usage = None
+                data = chunk.model_dump(exclude={"usage"} if chunk.usage is None else None)
+                yield f"data: {json.dumps(data)}\n\n"
             yield "data: [DONE]\n\n"
 
     def _process_completion_response(self, data: Dict) -> ChatCompletionResponse:
@@ -79,9 +197,12 @@ class OpenAICompatibleProvider(LLMProvider, HTTPClientProvider):
 
     async def _process_stream_response(self, response) -> AsyncGenerator[ChatCompletionStreamResponse, None]:
         """Process streaming response"""
-        async for line in response.aiter_lines():
+        async for line in self.aiter_lines(response):
             line = line.strip()
-            if not line or line == "data: [DONE]":
+            if line == "data: [DONE]":
+                self.stream_finished = True
+                continue
+            if not line:
                 continue
                 
             if line.startswith("data: "):
@@ -97,12 +218,19 @@ class OpenAICompatibleProvider(LLMProvider, HTTPClientProvider):
                     )
                     for i, choice in enumerate(chunk["choices"])
                 ]
-                
+                for choice in choices:
+                    if choice.delta.content:
+                        self._stream_text(choice.delta.content)
+                    if choice.finish_reason is not None:
+                        self.stream_finished = True
+                usage = chunk.get("usage")
+
                 yield ChatCompletionStreamResponse(
                     id=chunk.get("id", f"chatcmpl-{time.time()}"),
                     created=chunk.get("created", int(time.time())),
                     model=chunk["model"],
-                    choices=choices
+                    choices=choices,
+                    usage=UsageInfo(**usage) if usage else None
                 )
             except json.JSONDecodeError:
                 continue 
\ No newline at end of file
@@ -0,0 +1,231 @@
+import asyncio
+import ipaddress
+import itertools
+import logging
+import socket
+import time
+import typing
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import httpcore
+from httpcore import AsyncNetworkBackend, AsyncNetworkStream
+
+from app.core.config.settings import get_settings
+
+try:
+    import dns.asyncresolver
+    import dns.exception
+except ImportError:  # dnspython is optional, getaddrinfo is used without TTLs
+    dns = None
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _DNSEntry:
+    addresses: List[str]
+    expires_at: float
+    stale_until: float
+    refresh_at: float  # next background refresh, pushed back after a failed one
+    counter: typing.Iterator[int] = field(default_factory=itertools.count)
+    refreshing: Optional[asyncio.Task] = None
+
+
+class DNSCache:
+    """Async DNS cache for upstream hosts
+
+    Answers are kept for their record TTL (when dnspython is installed,
+    otherwise for a configured default) and refreshed in the background
+    once they get close to expiry, so lookups on the request path are
+    plain dict reads; only a host never seen before waits for the
+    resolver. If refreshing fails the previous answer keeps being served
+    for up to stale_ttl seconds past its expiry, and refreshing is retried
+    every min_ttl seconds rather than on every request. Refreshes start at
+    most half an entry's TTL early, so short TTLs are not re-resolved on
+    every lookup. Every A/AAAA record is kept so callers can spread
+    connections across them.
+    """
+
+    def __init__(
+        self,
+        default_ttl: float = 60.0,
+        refresh_ahead: float = 10.0,
+        stale_ttl: float = 3600.0,
+        min_ttl: float = 5.0
+    ):
+        self.default_ttl = default_ttl
+        self.refresh_ahead = refresh_ahead
+        self.stale_ttl = stale_ttl
+        self.min_ttl = min_ttl
+        self._entries: Dict[Tuple[str, int], _DNSEntry] = {}
+        self._pending: Dict[Tuple[str, int], asyncio.Future] = {}
+
+    async def _query(self, host: str, port: int) -> Tuple[List[str], float]:
+        """Resolve host to its addresses and TTL"""
+        if dns is not None:
+            resolver = dns.asyncresolver.get_default_resolver()
+            addresses: List[str] = []
+            ttls: List[float] = []
+            errors: List[str] = []
+            for rdtype in ("A", "AAAA"):
+                try:
+                    answer = await resolver.resolve(host, rdtype)
+                except dns.exception.DNSException as e:
+                    errors.append(str(e))
+                    continue
+                addresses.extend(rdata.to_text() for rdata in answer)
+                ttls.append(float(answer.rrset.ttl))
+            if not addresses:
+                raise OSError(f"Cannot resolve {host}: {'; '.join(errors)}")
+            return addresses, max(self.min_ttl, min(ttls))
+
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        # IPv4 first, it is the family most likely to be routable in containers
+        infos.sort(key=lambda info: info[0] != socket.AF_INET)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        return addresses, self.default_ttl
+
+    async def _refresh(self, host: str, port: int) -> List[str]:
+        key = (host, port)
+        entry = self._entries.get(key)
+        try:
+            addresses, ttl = await self._query(host, port)
+        except (OSError, asyncio.TimeoutError) as e:
+            now = time.monotonic()
+            if entry is not None and now < entry.stale_until:
+                logger.warning(f"DNS refresh for {host} failed, serving stale answer: {e}")
+                # Retry again shortly rather than on every request
+                entry.refresh_at = now + self.min_ttl
+                return entry.addresses
+            raise
+
+        now = time.monotonic()
+        new_entry = _DNSEntry(
+            addresses=addresses,
+            expires_at=now + ttl,
+            stale_until=now + ttl + self.stale_ttl,
+            refresh_at=now + ttl - min(self.refresh_ahead, ttl / 2)
+        )
+        if entry is not None:
+            new_entry.counter = entry.counter
+        self._entries[key] = new_entry
+        return addresses
+
+    def _schedule_refresh(self, host: str, port: int, entry: _DNSEntry) -> None:
+        if entry.refreshing is None or entry.refreshing.done():
+            entry.refreshing = asyncio.create_task(self._refresh_quietly(host, port))
+
+    async def _refresh_quietly(self, host: str, port: int) -> None:
+        try:
+            await self._refresh(host, port)
+        except Exception as e:
+            logger.warning(f"Background DNS refresh for {host} failed: {e}")
+
+    async def resolve(self, host: str, port: int) -> List[str]:
+        """Get all addresses of host, resolving only on a cold cache"""
+        try:
+            ipaddress.ip_address(host)
+            return [host]
+        except ValueError:
+            pass
+
+        key = (host, port)
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None:
+            if now < entry.refresh_at:
+                return entry.addresses
+            if now < entry.stale_until:
+                # About to expire (or expired while idle): answer from cache
+                # and revalidate in the background
+                self._schedule_refresh(host, port, entry)
+                return entry.addresses
+
+        # Cold cache: coalesce concurrent lookups for the same host
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._refresh(host, port))
+            self._pending[key] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(pending)
+
+    def next_offset(self, host: str, port: int) -> int:
+        """Round-robin offset into the address list of host"""
+        entry = self._entries.get((host, port))
+        return next(entry.counter) if entry is not None else 0
+
+
+class CachingNetworkBackend(AsyncNetworkBackend):
+    """httpcore network backend that connects through the DNS cache
+
+    TLS server name indication and certificate checks still use the
+    original host name, only the TCP connect goes to a cached address.
+    """
+
+    def __init__(self, backend: AsyncNetworkBackend, cache: DNSCache):
+        self._backend = backend
+        self._cache = cache
+
+    async def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: Optional[float] = None,
+        local_address: Optional[str] = None,
+        socket_options: Optional[typing.Iterable] = None,
+    ) -> AsyncNetworkStream:
+        try:
+            addresses = await self._cache.resolve(host, port)
+        except OSError as e:
+            raise httpcore.ConnectError(str(e)) from e
+
+        offset = self._cache.next_offset(host, port) % len(addresses)
+        last_error: Optional[Exception] = None
+        for address in addresses[offset:] + addresses[:offset]:
+            try:
+                return await self._backend.connect_tcp(
+                    address,
+                    port,
+                    timeout=timeout,
+                    local_address=local_address,
+                    socket_options=socket_options,
+                )
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                last_error = e
+        raise last_error
+
+    async def connect_unix_socket(
+        self,
+        path: str,
+        timeout: Optional[float] = None,
+        socket_options: Optional[typing.Iterable] = None,
+    ) -> AsyncNetworkStream:
+        return await self._backend.connect_unix_socket(
+            path, timeout=timeout, socket_options=socket_options
+        )
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+# Global DNS cache instance
+_dns_cache: Optional[DNSCache] = None
+
+def get_dns_cache() -> DNSCache:
+    """Get the process wide DNS cache"""
+    global _dns_cache
+    if _dns_cache is None:
+        settings = get_settings()
+        if dns is None:
+            logger.info(
+                f"dnspython is not installed, upstream DNS answers are cached for "
+                f"UPSTREAM_DNS_TTL ({settings.UPSTREAM_DNS_TTL:g}s) instead of their record TTLs"
+            )
+        _dns_cache = DNSCache(
+            default_ttl=settings.UPSTREAM_DNS_TTL,
+            refresh_ahead=settings.UPSTREAM_DNS_REFRESH_AHEAD,
+            stale_ttl=settings.UPSTREAM_DNS_STALE_TTL
+        )
+    return _dns_cache
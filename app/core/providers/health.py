@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Iterator, Optional
+
+import httpx
+
+from app.core.config.settings import get_settings
+from app.core.exceptions import ProviderAPIError, StreamInterruptedError, UpstreamTimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """Whether an error says the upstream, rather than the request, is at fault"""
+    if isinstance(error, (httpx.TransportError, UpstreamTimeoutError, StreamInterruptedError)):
+        return True
+    if isinstance(error, ProviderAPIError):
+        status = error.upstream_status
+    elif isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+    else:
+        return False
+    return status >= 500 or status in (401, 403)
+
+
+@dataclass
+class UpstreamHealth:
+    """Health of one deployment, from probes and real traffic"""
+    healthy: bool = True
+    verified: bool = False  # a probe or request has succeeded
+    failures: int = 0  # consecutive
+    last_error: Optional[str] = None
+    last_probe_at: Optional[float] = None  # wall clock
+    last_probe_latency: Optional[float] = None
+    changed_at: float = field(default_factory=time.time)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "verified": self.verified,
+            "consecutive_failures": self.failures,
+            "last_error": self.last_error,
+            "last_probe_at": self.last_probe_at,
+            "last_probe_latency": None if self.last_probe_latency is None else round(self.last_probe_latency, 4),
+            "changed_at": self.changed_at,
+        }
+
+
+class HealthChecker:
+    """Tracks which deployments can serve, for routing and readiness
+
+    Every interval each deployment with an API key is probed with a
+    request that costs no tokens (its model list). Results of real
+    upstream requests count too, so an upstream that starts failing is
+    noticed between probes. After failure_threshold consecutive failures
+    a deployment is unhealthy and routes avoid it when they have another
+    target; one successful probe or request makes it healthy again.
+    Deployments never checked count as healthy for routing, but readiness
+    needs one that has answered, and a deployment failing its startup
+    probe is unhealthy straight away.
+    """
+
+    def __init__(
+        self,
+        interval: float = 15.0,
+        timeout: float = 5.0,
+        failure_threshold: int = 3,
+        enabled: bool = True
+    ):
+        self.interval = interval
+        self.timeout = timeout
+        self.failure_threshold = max(1, failure_threshold)
+        self.enabled = enabled
+        self._states: Dict[str, UpstreamHealth] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.draining = False
+
+    def is_healthy(self, deployment: str) -> bool:
+        state = self._states.get(deployment)
+        return state is None or state.healthy
+
+    def _state(self, deployment: str) -> UpstreamHealth:
+        state = self._states.get(deployment)
+        if state is None:
+            state = self._states[deployment] = UpstreamHealth()
+        return state
+
+    def record_success(self, deployment: str) -> None:
+        if not self.enabled:
+            return
+        state = self._state(deployment)
+        state.failures = 0
+        state.verified = True
+        if not state.healthy:
+            state.healthy = True
+            state.changed_at = time.time()
+            logger.info(f"Upstream {deployment} is healthy again")
+
+    def record_failure(self, deployment: str, error: BaseException, threshold: Optional[int] = None) -> None:
+        if not self.enabled:
+            return
+        state = self._state(deployment)
+        state.failures += 1
+        state.last_error = f"{type(error).__name__}: {getattr(error, 'detail', None) or error}"[:500]
+        if state.healthy and state.failures >= (threshold or self.failure_threshold):
+            state.healthy = False
+            state.changed_at = time.time()
+            logger.warning(
+                f"Upstream {deployment} marked unhealthy after {state.failures} failures: {state.last_error}"
+            )
+
+    @contextmanager
+    def track(self, deployment: str) -> Iterator[None]:
+        """Record the outcome of a real upstream request made in the block
+
+        Errors that are the request's own (bad input, client gone, its
+        deadline passed) say nothing about the upstream and are ignored.
+        """
+        try:
+            yield
+        except BaseException as e:
+            if is_upstream_failure(e):
+                self.record_failure(deployment, e)
+            raise
+        self.record_success(deployment)
+
+    async def _probe(self, deployment, threshold: Optional[int] = None) -> None:
+        from app.core.providers.base import LLMProviderFactory
+        from app.core.providers.routing import Timeouts
+
+        # Probes give up sooner than requests, whatever the deployment allows
+        probe = replace(deployment, timeouts=Timeouts(self.timeout, self.timeout, self.timeout, self.timeout))
+        state = self._state(deployment.name)
+        start = time.perf_counter()
+        try:
+            async with LLMProviderFactory.create(probe) as provider:
+                await provider.health_check()
+        except NotImplementedError:
+            # Nothing to probe with, so only real requests can fail it
+            state.verified = True
+            return
+        except Exception as e:
+            self.record_failure(deployment.name, e, threshold)
+        else:
+            self.record_success(deployment.name)
+        finally:
+            state.last_probe_at = time.time()
+            state.last_probe_latency = time.perf_counter() - start
+
+    def _deployments(self) -> Dict[str, Any]:
+        from app.core.providers.routing import get_routing_table
+
+        return {
+            name: deployment
+            for name, deployment in get_routing_table().deployments.items()
+            if deployment.api_key
+        }
+
+    async def check_all(self, threshold: Optional[int] = None) -> None:
+        """Probe every deployment once, failing those that reach threshold
+        consecutive failures (failure_threshold by default)"""
+        deployments = self._deployments()
+        # Deployments dropped from the routing table are forgotten
+        for name in list(self._states):
+            if name not in deployments:
+                del self._states[name]
+        await asyncio.gather(*(self._probe(deployment, threshold) for deployment in deployments.values()))
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check_all()
+            except Exception as e:
+                logger.warning(f"Upstream health check failed: {e!r}")
+
+    def is_ready(self) -> bool:
+        """At least one deployment is configured, healthy and has answered
+        a probe or request"""
+        if self.draining:
+            return False
+        deployments = self._deployments()
+        if not self.enabled:
+            return bool(deployments)
+        return any(
+            state is not None and state.healthy and state.verified
+            for state in map(self._states.get, deployments)
+        )
+
+    async def start(self) -> None:
+        """Probe once before traffic is accepted, then every interval"""
+        self.draining = False
+        if not self.enabled:
+            return
+        try:
+            # Traffic has not proven these upstreams yet, one failed probe is enough
+            await asyncio.wait_for(self.check_all(threshold=1), timeout=self.timeout + 1.0)
+        except asyncio.TimeoutError:
+            logger.warning("Initial upstream health check timed out, continuing startup")
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        self.draining = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            name: (self._states[name].to_dict() if name in self._states else {"healthy": True, "verified": False})
+            for name in self._deployments()
+        }
+
+
+# Global health checker instance
+_health_checker: Optional[HealthChecker] = None
+
+def get_health_checker() -> HealthChecker:
+    """Get the process wide upstream health checker"""
+    global _health_checker
+    if _health_checker is None:
+        settings = get_settings()
+        _health_checker = HealthChecker(
+            interval=settings.HEALTH_CHECK_INTERVAL,
+            timeout=settings.HEALTH_CHECK_TIMEOUT,
+            failure_threshold=settings.HEALTH_FAILURE_THRESHOLD,
+            enabled=settings.HEALTH_CHECK_ENABLED
+        )
+    return _health_checker
@@ -1,52 +1,225 @@
-from typing import Optional, Dict, Any, Union
-from httpx import AsyncClient, Response
+from typing import AsyncIterator, Optional, Dict, Any, Tuple, Union
+from httpx import AsyncClient, AsyncHTTPTransport, Response, Limits
+from httpx._utils import get_environment_proxies
 from abc import ABC
 from contextlib import asynccontextmanager
-from app.core.context import get_request_id, request_id_var
+from app.core.config.settings import get_settings
+from app.core.context import get_deadline, get_request_id, remaining_time, request_id_var
+from app.core.exceptions import DeadlineExceededError, ProviderAPIError, UpstreamTimeoutError
+from app.core.tracing import SPAN_KIND_CLIENT, Span, UpstreamTrace, start_span
+from .dns import CachingNetworkBackend, get_dns_cache
+from .keys import estimate_tokens, get_key_pool, split_keys
+from .routing import Timeouts
+import asyncio
+import httpx
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+# Shared HTTP clients keyed by upstream base URL, so that every provider
+# instance talking to the same upstream reuses one connection pool
+_shared_clients: Dict[str, AsyncClient] = {}
+# Last time a response was received from each upstream (monotonic clock)
+_last_activity: Dict[str, float] = {}
+
+
+async def add_trace_id_to_log(request_or_response):
+    """Add trace_id to request/response for logging"""
+    trace_id = request_id_var.get()
+    if trace_id and hasattr(request_or_response, 'headers'):
+        request_or_response.headers['X-Request-ID'] = trace_id
+
+
+def get_idle_seconds(api_base: str) -> float:
+    """Seconds since the last response from an upstream"""
+    return time.monotonic() - _last_activity.get(api_base, 0.0)
+
+
+def _caching_transport(limits: Limits) -> Optional[AsyncHTTPTransport]:
+    """A transport resolving names through the DNS cache, None if this
+    httpcore version does not allow it"""
+    transport = AsyncHTTPTransport(limits=limits)
+    # httpx has no public hook for name resolution, so connect through
+    # the DNS cache at the httpcore network backend level
+    pool = getattr(transport, "_pool", None)
+    backend = getattr(pool, "_network_backend", None)
+    if backend is None:
+        logger.warning("Upstream DNS cache is not supported by this httpcore version, disabling it")
+        return None
+    pool._network_backend = CachingNetworkBackend(backend, get_dns_cache())
+    return transport
+
+
+def _proxy_mounts(limits: Limits) -> Dict[str, Optional[AsyncHTTPTransport]]:
+    """Transports for HTTP(S)_PROXY/ALL_PROXY, and None (the default
+    transport) for NO_PROXY hosts, as httpx sets them up itself"""
+    return {
+        pattern: None if proxy is None else AsyncHTTPTransport(proxy=proxy, limits=limits)
+        for pattern, proxy in get_environment_proxies().items()
+    }
+
+
+def get_shared_client(api_base: str, timeout: float = 30.0) -> AsyncClient:
+    """Get (or lazily create) the shared HTTP client for an upstream"""
+    client = _shared_clients.get(api_base)
+    if client is None or client.is_closed:
+        async def track_activity(response):
+            _last_activity[api_base] = time.monotonic()
+
+        event_hooks = {
+            'request': [add_trace_id_to_log],
+            'response': [add_trace_id_to_log, track_activity]
+        }
+        settings = get_settings()
+        limits = Limits(
+            max_connections=None,
+            max_keepalive_connections=100,
+            keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY
+        )
+        transport = _caching_transport(limits) if settings.UPSTREAM_DNS_CACHE_ENABLED else None
+        if transport is None:
+            client = AsyncClient(timeout=timeout, limits=limits, event_hooks=event_hooks)
+        else:
+            client = AsyncClient(
+                timeout=timeout,
+                transport=transport,
+                # httpx only reads proxies from the environment without a transport
+                mounts=_proxy_mounts(limits),
+                event_hooks=event_hooks
+            )
+        _shared_clients[api_base] = client
+    return client
+
+
+async def close_shared_clients() -> None:
+    """Close all shared HTTP clients"""
+    clients = list(_shared_clients.values())
+    _shared_clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
 class HTTPClientProvider(ABC):
     """Base class for providers that use HTTP client"""
     
-    def __init__(self, api_key: str, api_base: str, timeout: float = 30.0):
-        self.api_key = api_key
+    def __init__(self, api_key: str, api_base: str, timeout: Union[float, Timeouts] = 30.0):
+        # Several comma separated keys are used as a pool, see KeyPool
+        self.api_keys = split_keys(api_key)
+        self.api_key = self.api_keys[0] if self.api_keys else api_key
         self.api_base = api_base
-        self.timeout = timeout
+        # A plain number is the time to first byte, as in the *_TIMEOUT settings
+        self.timeouts = timeout if isinstance(timeout, Timeouts) else Timeouts.default(timeout)
         self._client: Optional[AsyncClient] = None
 
     @property
     async def client(self) -> AsyncClient:
-        """Lazy initialize HTTP client"""
-        if self._client is None:
-            event_hooks = {
-                'request': [self.add_trace_id_to_log],
-                'response': [self.add_trace_id_to_log]
-            }
-            self._client = AsyncClient(timeout=self.timeout, event_hooks=event_hooks)
+        """Get the shared HTTP client for this provider's upstream"""
+        if self._client is None or self._client.is_closed:
+            self._client = get_shared_client(self.api_base, self.timeouts.ttfb)
         return self._client
 
-    async def add_trace_id_to_log(self, request_or_response):
-        """Add trace_id to request/response for logging"""
-        trace_id = request_id_var.get()
-        if hasattr(request_or_response, 'headers'):
-            request_or_response.headers['X-Request-ID'] = trace_id
+    def _request_timeout(self, stream: bool = False) -> httpx.Timeout:
+        """Per phase timeouts for one request, none longer than the deadline allows
+
+        httpx applies the read timeout to every socket read. For streams the
+        gaps between chunks are bounded by aiter_lines, so reads get
+        whichever of the first byte and idle timeouts is longer.
+        """
+        timeouts = self.timeouts
+        read = timeouts.ttfb
+        if stream and read is not None:
+            read = None if timeouts.idle is None else max(read, timeouts.idle)
+        remaining = remaining_time()
+
+        def cap(value: Optional[float]) -> Optional[float]:
+            if remaining is None:
+                return value
+            return max(remaining, 0.001) if value is None else max(min(value, remaining), 0.001)
+
+        return httpx.Timeout(
+            connect=cap(timeouts.connect),
+            read=cap(read),
+            write=cap(timeouts.ttfb),
+            pool=cap(timeouts.pool)
+        )
+
+    def _timeout_error(self, e: Exception, url: str, phase: Optional[str] = None) -> Exception:
+        """The error to report for an upstream timeout, or the deadline if that passed"""
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0.01:
+            return DeadlineExceededError()
+        if phase is None:
+            if isinstance(e, httpx.ConnectTimeout):
+                phase = "connect"
+            elif isinstance(e, httpx.PoolTimeout):
+                phase = "pool"
+            else:
+                phase = "ttfb"
+        return UpstreamTimeoutError(phase, getattr(self.timeouts, phase, None), url)
+
+    async def aiter_lines(self, response: Response) -> AsyncIterator[str]:
+        """Lines of a streamed response, given up on when the upstream stalls
+
+        The first line may take up to the time to first byte timeout, every
+        later one the idle timeout, and none past the request's deadline.
+        Only the wait for the upstream is timed, not the time the consumer
+        spends on each line.
+        """
+        lines = response.aiter_lines()
+        phase, timeout = "ttfb", self.timeouts.ttfb
+        while True:
+            deadline = get_deadline()
+            if timeout is not None:
+                timeout_at = asyncio.get_running_loop().time() + timeout
+                deadline = timeout_at if deadline is None else min(deadline, timeout_at)
+            try:
+                async with asyncio.timeout_at(deadline):
+                    line = await anext(lines)
+            except StopAsyncIteration:
+                return
+            except TimeoutError as e:
+                raise self._timeout_error(e, str(response.url), phase) from e
+            yield line
+            phase, timeout = "idle", self.timeouts.idle
+
+    async def probe(self, url: str) -> None:
+        """GET url as a health probe
+
+        Any answer shows the upstream is reachable, except server errors
+        and refused credentials, which mean requests would fail too.
+        """
+        # With the first key and its own headers, so probes never wait for quota
+        response = await self.make_request(method="GET", url=url, headers=self.prepare_headers(), raise_for_status=False)
+        if response.status_code >= 500 or response.status_code in (401, 403):
+            raise ProviderAPIError(
+                provider=type(self).__name__.replace("Provider", ""),
+                status_code=response.status_code,
+                detail=f"health probe returned {response.status_code}",
+                url=url
+            )
 
     async def cleanup(self):
-        """Cleanup HTTP client"""
-        if self._client is not None:
-            await self._client.aclose()
-            self._client = None
+        """Release HTTP client
+
+        The client is shared between provider instances and is closed on
+        application shutdown, so it is only detached here.
+        """
+        self._client = None
+
+    def auth_headers(self, api_key: str) -> Dict[str, str]:
+        """Headers authenticating a request with api_key"""
+        return {"Authorization": f"Bearer {api_key}"}
 
     def prepare_headers(self, **kwargs) -> Dict[str, str]:
         """Prepare request headers"""
         trace_id = request_id_var.get()
         headers = {
             "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}",
-            "X-Request-ID": trace_id
+            **self.auth_headers(self.api_key),
         }
+        if trace_id:
+            headers["X-Request-ID"] = trace_id
         headers.update(kwargs)
         logger.info(
             "Preparing request headers",
@@ -54,6 +227,21 @@ class HTTPClientProvider(ABC):
         )
         return headers
 
+    @staticmethod
+    def _propagate_trace(span: Optional[Span], headers: Dict[str, str], kwargs: Dict[str, Any]) -> None:
+        """Send the trace context upstream and time the connection of sampled requests"""
+        if span is None:
+            return
+        headers["traceparent"] = span.traceparent
+        if span.sampled:
+            kwargs["extensions"] = {**kwargs.get("extensions", {}), "trace": UpstreamTrace(span)}
+
+    async def _pick_key(self, headers: Dict[str, str], tokens: float) -> Tuple[str, bool]:
+        """Authenticate headers with a key from the pool, see KeyPool.acquire"""
+        key, ready = await get_key_pool().acquire(self.api_keys, tokens)
+        headers.update(self.auth_headers(key))
+        return key, ready
+
     @asynccontextmanager
     async def stream_request(
         self,
@@ -62,8 +250,12 @@ class HTTPClientProvider(ABC):
         headers: Optional[Dict[str, str]] = None,
         **kwargs
     ):
-        """Make streaming HTTP request"""
-        request_headers = headers or self.prepare_headers()
+        """Make streaming HTTP request
+
+        Unless headers are given, the request is authenticated with a key
+        from the pool, and a 429 is retried with the next key ready in time.
+        """
+        request_headers = dict(headers or self.prepare_headers())
         trace_id = request_headers.get("X-Request-ID")
         
         logger.info(
@@ -74,27 +266,57 @@ class HTTPClientProvider(ABC):
                 "url": url
             }
         )
-        
-        client = await self.client
-        async with client.stream(
-            method=method,
-            url=url,
-            headers=request_headers,
-            timeout=self.timeout,
-            **kwargs
-        ) as response:
-            response.raise_for_status()
-            yield response
+
+        key = None
+        if headers is None and self.api_keys and get_key_pool().enabled:
+            tokens = estimate_tokens(kwargs.get("json"), kwargs.get("content"))
+            key, _ = await self._pick_key(request_headers, tokens)
+        attempts = len(self.api_keys) + 1 if key is not None else 1
+        for attempt in range(attempts):
+            throttled = False
+            with start_span("upstream.request", kind=SPAN_KIND_CLIENT, **{"http.method": method, "http.url": url}) as span:
+                self._propagate_trace(span, request_headers, kwargs)
+                client = await self.client
+                # No timeout scope around the yield: it would cancel whatever the
+                # consumer awaits, aiter_lines bounds the waits for the upstream
+                try:
+                    async with client.stream(
+                        method=method,
+                        url=url,
+                        headers=request_headers,
+                        timeout=self._request_timeout(stream=True),
+                        **kwargs
+                    ) as response:
+                        if span is not None:
+                            span.set_attribute("http.status_code", response.status_code)
+                        if key is not None:
+                            get_key_pool().update(key, response.headers, response.status_code)
+                            throttled = response.status_code == 429 and attempt + 1 < attempts
+                        if not throttled:
+                            response.raise_for_status()
+                            yield response
+                except httpx.TimeoutException as e:
+                    raise self._timeout_error(e, url) from e
+            if not throttled:
+                return
+            # The throttled response is closed before waiting for another key
+            key, ready = await self._pick_key(request_headers, tokens)
+            if not ready:
+                response.raise_for_status()
 
     async def make_request(
         self,
         method: str,
         url: str,
         headers: Optional[Dict[str, str]] = None,
+        raise_for_status: bool = True,
         **kwargs
     ) -> Response:
-        """Make regular HTTP request"""
-        request_headers = headers or self.prepare_headers()
+        """Make regular HTTP request
+
+        Keys are picked and 429s retried as for stream_request.
+        """
+        request_headers = dict(headers or self.prepare_headers())
         trace_id = request_headers.get("X-Request-ID")
         
         logger.info(
@@ -105,14 +327,37 @@ class HTTPClientProvider(ABC):
                 "url": url
             }
         )
-        
-        client = await self.client
-        response = await client.request(
-            method=method,
-            url=url,
-            headers=request_headers,
-            timeout=self.timeout,
-            **kwargs
-        )
-        response.raise_for_status()
-        return response 
\ No newline at end of file
+
+        key = None
+        if headers is None and self.api_keys and get_key_pool().enabled:
+            tokens = estimate_tokens(kwargs.get("json"), kwargs.get("content"))
+            key, _ = await self._pick_key(request_headers, tokens)
+        attempts = len(self.api_keys) + 1 if key is not None else 1
+        for attempt in range(attempts):
+            with start_span("upstream.request", kind=SPAN_KIND_CLIENT, **{"http.method": method, "http.url": url}) as span:
+                self._propagate_trace(span, request_headers, kwargs)
+                client = await self.client
+                try:
+                    async with asyncio.timeout_at(get_deadline()):
+                        response = await client.request(
+                            method=method,
+                            url=url,
+                            headers=request_headers,
+                            timeout=self._request_timeout(),
+                            **kwargs
+                        )
+                except (httpx.TimeoutException, TimeoutError) as e:
+                    raise self._timeout_error(e, url) from e
+                if span is not None:
+                    span.set_attribute("http.status_code", response.status_code)
+            if key is None:
+                break
+            get_key_pool().update(key, response.headers, response.status_code)
+            if response.status_code != 429 or attempt + 1 == attempts:
+                break
+            key, ready = await self._pick_key(request_headers, tokens)
+            if not ready:
+                break
+        if raise_for_status:
+            response.raise_for_status()
+        return response
@@ -0,0 +1,299 @@
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from app.core.config.settings import get_settings
+from app.core.context import remaining_time
+
+logger = logging.getLogger(__name__)
+
+# Rate limit headers of OpenAI compatible upstreams and of Anthropic:
+# (remaining, limit, reset) per limited quantity
+_RATE_LIMIT_HEADERS = {
+    "requests": (
+        ("x-ratelimit-remaining-requests", "x-ratelimit-limit-requests", "x-ratelimit-reset-requests"),
+        ("anthropic-ratelimit-requests-remaining", "anthropic-ratelimit-requests-limit", "anthropic-ratelimit-requests-reset"),
+    ),
+    "tokens": (
+        ("x-ratelimit-remaining-tokens", "x-ratelimit-limit-tokens", "x-ratelimit-reset-tokens"),
+        ("anthropic-ratelimit-tokens-remaining", "anthropic-ratelimit-tokens-limit", "anthropic-ratelimit-tokens-reset"),
+    ),
+}
+
+# A throttled key without a retry hint is rested this long, in seconds
+DEFAULT_RETRY_AFTER = 1.0
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """Seconds until a rate limit resets, from a number of seconds, a
+    duration such as "6m0s" or "20ms", or an RFC 3339 timestamp"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _DURATION.findall(value)
+    if parts and "".join(number + unit for number, unit in parts) == value:
+        scale = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+        return sum(float(number) * scale[unit] for number, unit in parts)
+    try:
+        return max(0.0, datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() - time.time())
+    except ValueError:
+        return None
+
+
+def _number(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def estimate_tokens(payload: Any = None, content: Optional[bytes] = None) -> float:
+    """Rough tokens a request counts against a token rate limit: its text
+    at about four characters a token plus the completion it asks for"""
+    if content is not None:
+        return len(content) / 4
+    if not isinstance(payload, dict):
+        return 0.0
+    chars = 0
+    for message in payload.get("messages") or []:
+        text = message.get("content") if isinstance(message, dict) else None
+        chars += len(text) if isinstance(text, str) else len(str(text or ""))
+    for text in (payload.get("system"), payload.get("input")):
+        if isinstance(text, str):
+            chars += len(text)
+        elif isinstance(text, list):
+            chars += sum(len(str(item)) for item in text)
+    return chars / 4 + (payload.get("max_tokens") or payload.get("max_completion_tokens") or 0)
+
+
+def split_keys(api_key: Optional[str]) -> List[str]:
+    """The keys of a comma separated API key setting"""
+    return [key.strip() for key in (api_key or "").split(",") if key.strip()]
+
+
+class _Limit:
+    """Last reported state of one rate limit of a key, counted down locally
+    for requests sent since"""
+
+    __slots__ = ("remaining", "limit", "reset_at")
+
+    def __init__(self):
+        self.remaining: Optional[float] = None
+        self.limit: Optional[float] = None
+        self.reset_at: Optional[float] = None  # monotonic clock
+
+    def _refill(self, now: float) -> None:
+        if self.reset_at is not None and now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = None
+
+    def headroom(self, now: float) -> Optional[float]:
+        """Fraction of the limit left, None when not reported"""
+        self._refill(now)
+        if self.remaining is None or not self.limit:
+            return None
+        return max(0.0, self.remaining / self.limit)
+
+    def blocked_for(self, now: float, cost: float, reserve: float) -> float:
+        """Seconds until cost fits while keeping a reserve fraction unused"""
+        self._refill(now)
+        if self.remaining is None or self.reset_at is None:
+            return 0.0
+        floor = (self.limit or 0.0) * reserve
+        if self.remaining - cost >= floor:
+            return 0.0
+        return self.reset_at - now
+
+    def spend(self, now: float, cost: float) -> None:
+        self._refill(now)
+        if self.remaining is not None:
+            self.remaining -= cost
+
+    def update(self, remaining: Optional[float], limit: Optional[float], reset: Optional[float], now: float) -> None:
+        if remaining is None:
+            return
+        self.remaining = remaining
+        if limit is not None:
+            self.limit = limit
+        self.reset_at = None if reset is None else now + reset
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        self._refill(now)
+        return {
+            "remaining": self.remaining,
+            "limit": self.limit,
+            "reset_in": None if self.reset_at is None else round(self.reset_at - now, 3),
+        }
+
+
+class KeyState:
+    """Rate limit state of one upstream API key"""
+
+    def __init__(self, key: str):
+        # Keys are never logged or reported, only this
+        self.fingerprint = hashlib.sha256(key.encode("utf-8")).hexdigest()[:8]
+        self.requests = _Limit()
+        self.tokens = _Limit()
+        self.paused_until = 0.0  # monotonic clock, set when the upstream throttled the key
+        self.sent = 0
+        self.throttled = 0
+
+    def wait(self, now: float, tokens: float, reserve: float) -> float:
+        """Seconds until the key has room for a request of this many tokens"""
+        return max(
+            0.0,
+            self.paused_until - now,
+            self.requests.blocked_for(now, 1, reserve),
+            self.tokens.blocked_for(now, tokens, reserve),
+        )
+
+    def headroom(self, now: float) -> float:
+        known = [h for h in (self.requests.headroom(now), self.tokens.headroom(now)) if h is not None]
+        return min(known) if known else 1.0
+
+    def spend(self, now: float, tokens: float) -> None:
+        self.sent += 1
+        self.requests.spend(now, 1)
+        self.tokens.spend(now, tokens)
+
+    def update(self, headers: Mapping[str, str], status: int) -> None:
+        now = time.monotonic()
+        for name, limit in (("requests", self.requests), ("tokens", self.tokens)):
+            for remaining, maximum, reset in _RATE_LIMIT_HEADERS[name]:
+                if remaining in headers:
+                    limit.update(
+                        _number(headers.get(remaining)),
+                        _number(headers.get(maximum)),
+                        parse_reset(headers.get(reset)),
+                        now
+                    )
+                    break
+        if status == 429:
+            self.throttled += 1
+            retry_after = _number(headers.get("retry-after-ms"))
+            retry_after = retry_after / 1000 if retry_after is not None else parse_reset(headers.get("retry-after"))
+            if retry_after is None:
+                resets = [
+                    limit.reset_at - now for limit in (self.requests, self.tokens)
+                    if limit.reset_at is not None and limit.remaining is not None and limit.remaining < 1
+                ]
+                retry_after = min(resets) if resets else DEFAULT_RETRY_AFTER
+            self.paused_until = max(self.paused_until, now + retry_after)
+            logger.warning(f"Upstream throttled API key {self.fingerprint}, resting it for {retry_after:.1f}s")
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        return {
+            "requests": self.requests.to_dict(now),
+            "tokens": self.tokens.to_dict(now),
+            "paused_for": round(max(0.0, self.paused_until - now), 3),
+            "sent": self.sent,
+            "throttled": self.throttled,
+        }
+
+
+class KeyPool:
+    """Spreads upstream requests over a deployment's API keys
+
+    Every upstream response reports how much of its key's request and
+    token rate limits is left and when they reset; requests sent since
+    are counted down locally. A request goes to the key with the most
+    headroom. Keys that would dip into the reserve fraction of a limit,
+    or that the upstream throttled, are paused until the limit resets, and
+    when every key is paused a request waits up to max_wait seconds (never
+    past its deadline) for one instead of running into a 429. State is per
+    key, so deployments sharing a key share its quota.
+    """
+
+    def __init__(self, max_wait: float = 5.0, reserve: float = 0.02, enabled: bool = True):
+        self.max_wait = max_wait
+        self.reserve = reserve
+        self.enabled = enabled
+        self._states: Dict[str, KeyState] = {}
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def state(self, key: str) -> KeyState:
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = KeyState(key)
+        return state
+
+    def _best(self, keys: Sequence[str], tokens: float, now: float) -> Tuple[str, float]:
+        """The key with most headroom among those ready (the least used on
+        a tie), else the one ready soonest, with its wait"""
+        waits = {key: self.state(key).wait(now, tokens, self.reserve) for key in keys}
+        ready = [key for key in keys if waits[key] <= 0]
+        if ready:
+            return max(ready, key=lambda key: (self.state(key).headroom(now), -self.state(key).sent)), 0.0
+        key = min(keys, key=waits.__getitem__)
+        return key, waits[key]
+
+    async def acquire(self, keys: Sequence[str], tokens: float = 0.0) -> Tuple[str, bool]:
+        """Pick a key for a request, waiting briefly for one with quota
+
+        Returns the key and whether it had room; when none will within
+        max_wait the key ready soonest is returned anyway and the
+        upstream decides.
+        """
+        if len(keys) == 1 and keys[0] not in self._states:
+            return keys[0], True
+        now = time.monotonic()
+        budget = self.max_wait
+        remaining = remaining_time()
+        if remaining is not None:
+            budget = min(budget, remaining)
+        give_up_at = now + budget
+        waited = False
+        while True:
+            key, wait = self._best(keys, tokens, now)
+            # Requests woken by the same reset may find it taken, and wait on
+            if wait <= 0 or now + wait > give_up_at:
+                break
+            if not waited:
+                self.waits += 1
+                waited = True
+            await asyncio.sleep(wait)
+            self.wait_seconds += time.monotonic() - now
+            now = time.monotonic()
+        self.state(key).spend(now, tokens)
+        return key, wait <= 0
+
+    def update(self, key: str, headers: Mapping[str, str], status: int) -> None:
+        """Record the rate limit state reported with a response for key"""
+        self.state(key).update(headers, status)
+
+    def to_dict(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "waits": self.waits,
+            "wait_seconds": round(self.wait_seconds, 3),
+            "keys": {state.fingerprint: state.to_dict(now) for state in self._states.values()},
+        }
+
+
+# Global key pool instance
+_key_pool: Optional[KeyPool] = None
+
+def get_key_pool() -> KeyPool:
+    """Get the process wide upstream API key pool"""
+    global _key_pool
+    if _key_pool is None:
+        settings = get_settings()
+        _key_pool = KeyPool(
+            max_wait=settings.KEY_POOL_MAX_WAIT,
+            reserve=settings.KEY_POOL_RESERVE,
+            enabled=settings.KEY_POOL_ENABLED
+        )
+    return _key_pool
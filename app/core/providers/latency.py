@@ -0,0 +1,287 @@
+import bisect
+import logging
+import time
+from dataclasses import dataclass, fields
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Quantiles an SLO may be stated at, each tracked by its own sketch
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class P2Quantile:
+    """Running estimate of one quantile in constant memory
+
+    The P-square algorithm (Jain and Chlamtac, 1985): five markers follow
+    the minimum, the p/2, p and (1+p)/2 quantiles and the maximum, and are
+    moved towards their ideal positions along a parabola through their
+    neighbours as observations arrive. Nothing else is stored.
+    """
+
+    __slots__ = ("p", "count", "heights", "positions", "desired", "increments")
+
+    def __init__(self, p: float):
+        self.p = p
+        self.count = 0
+        self.heights: List[float] = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1.0, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5.0]
+        self.increments = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, x: float) -> None:
+        self.count += 1
+        q = self.heights
+        if self.count <= 5:
+            bisect.insort(q, x)
+            return
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(q, x) - 1
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+        for i in (1, 2, 3):
+            delta = self.desired[i] - n[i]
+            if (delta >= 1 and n[i + 1] - n[i] > 1) or (delta <= -1 and n[i - 1] - n[i] < -1):
+                s = 1 if delta > 0 else -1
+                height = self._parabolic(i, s)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + s * (q[i + s] - q[i]) / (n[i + s] - n[i])
+                q[i] = height
+                n[i] += s
+
+    def _parabolic(self, i: int, s: int) -> float:
+        q, n = self.heights, self.positions
+        return q[i] + s / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + s) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - s) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self) -> Optional[float]:
+        if not self.count:
+            return None
+        if self.count <= 5:
+            return self.heights[min(self.count - 1, int(self.p * self.count))]
+        return self.heights[2]
+
+
+class _Window:
+    """Sketches of the streams served in one statistics window"""
+
+    __slots__ = ("started", "ttfb", "throughput")
+
+    def __init__(self, started: float):
+        self.started = started
+        self.ttfb = {q: P2Quantile(q) for q in QUANTILES}
+        # Slow streams are the low end of throughput
+        self.throughput = {q: P2Quantile(1 - q) for q in QUANTILES}
+
+    @property
+    def samples(self) -> int:
+        return self.ttfb[QUANTILES[0]].count
+
+    def to_dict(self) -> Dict[str, Any]:
+        def rounded(value: Optional[float]) -> Optional[float]:
+            return None if value is None else round(value, 4)
+
+        return {
+            "samples": self.samples,
+            "ttfb": {f"p{q * 100:g}": rounded(sketch.value()) for q, sketch in self.ttfb.items()},
+            "tokens_per_second": {
+                f"p{sketch.p * 100:g}": rounded(sketch.value()) for sketch in self.throughput.values()
+            },
+        }
+
+
+@dataclass(frozen=True)
+class LatencyEstimate:
+    """Time to first token (seconds) and tokens per second at a quantile,
+    throughput taken from the slow end"""
+    ttfb: float
+    tokens_per_second: Optional[float]
+
+
+class LatencyStats:
+    """Rolling latency quantiles of one deployment and model
+
+    Samples go into the current window; once it has lasted window seconds
+    it becomes the previous one and a fresh window starts. Estimates come
+    from the current window when it holds min_samples streams, else from
+    the previous one, so they follow the last one or two windows of
+    traffic in the memory of two sets of sketches.
+    """
+
+    def __init__(self, window: float, min_samples: int):
+        self.window = window
+        self.min_samples = min_samples
+        self.current = _Window(time.monotonic())
+        self.previous: Optional[_Window] = None
+
+    def _rotate(self, now: float) -> None:
+        elapsed = now - self.current.started
+        if elapsed < self.window:
+            return
+        self.previous = self.current if elapsed < 2 * self.window else None
+        self.current = _Window(now)
+
+    def record_ttfb(self, seconds: float) -> None:
+        self._rotate(time.monotonic())
+        for sketch in self.current.ttfb.values():
+            sketch.add(seconds)
+
+    def record_throughput(self, tokens_per_second: float) -> None:
+        self._rotate(time.monotonic())
+        for sketch in self.current.throughput.values():
+            sketch.add(tokens_per_second)
+
+    def _trusted(self) -> Optional[_Window]:
+        self._rotate(time.monotonic())
+        if self.current.samples >= self.min_samples:
+            return self.current
+        if self.previous is not None and self.previous.samples >= self.min_samples:
+            return self.previous
+        return None
+
+    def estimate(self, quantile: float) -> Optional[LatencyEstimate]:
+        """None until a window has enough samples"""
+        window = self._trusted()
+        if window is None:
+            return None
+        return LatencyEstimate(
+            ttfb=window.ttfb[quantile].value(),
+            tokens_per_second=window.throughput[quantile].value()
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        self._rotate(time.monotonic())
+        return {
+            "current": self.current.to_dict(),
+            "previous": None if self.previous is None else self.previous.to_dict(),
+        }
+
+
+class LatencyTracker:
+    """Streaming latency statistics per deployment and upstream model
+
+    Fed by every completion stream: its time to first chunk and, once it
+    finishes, its completion tokens per second after the first chunk; and
+    by every non-streaming completion, its total time counting as the
+    time to first chunk. SLO routes read the estimates to decide where
+    requests go.
+    """
+
+    def __init__(self, window: float = 300.0, min_samples: int = 20, max_keys: int = 1024):
+        self.window = window
+        self.min_samples = max(1, min_samples)
+        self.max_keys = max_keys
+        self._stats: Dict[Tuple[str, str], LatencyStats] = {}
+
+    def _get(self, deployment: str, model: str, create: bool = False) -> Optional[LatencyStats]:
+        stats = self._stats.get((deployment, model))
+        if stats is None and create and len(self._stats) < self.max_keys:
+            stats = self._stats[(deployment, model)] = LatencyStats(self.window, self.min_samples)
+        return stats
+
+    def record_ttfb(self, deployment: str, model: str, seconds: float) -> None:
+        stats = self._get(deployment, model, create=True)
+        if stats is not None:
+            stats.record_ttfb(seconds)
+
+    def record_throughput(self, deployment: str, model: str, tokens_per_second: float) -> None:
+        stats = self._get(deployment, model, create=True)
+        if stats is not None:
+            stats.record_throughput(tokens_per_second)
+
+    def estimate(self, deployment: str, model: str, quantile: float) -> Optional[LatencyEstimate]:
+        stats = self._get(deployment, model)
+        return None if stats is None else stats.estimate(quantile)
+
+    def samples(self, deployment: str, model: str) -> int:
+        """Streams seen in the current window"""
+        stats = self._get(deployment, model)
+        return 0 if stats is None else stats.current.samples
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {f"{deployment}/{model}": stats.to_dict() for (deployment, model), stats in self._stats.items()}
+
+
+@dataclass(frozen=True)
+class SLO:
+    """Latency a request should be served within, at a quantile"""
+    ttfb_ms: Optional[float] = None
+    tokens_per_second: Optional[float] = None
+    quantile: float = 0.9
+
+    @classmethod
+    def from_dict(cls, spec: Dict[str, Any]) -> "SLO":
+        """Build an SLO from its routing table form, raising ValueError if invalid"""
+        unknown = set(spec) - {f.name for f in fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown SLO fields: {', '.join(sorted(unknown))}")
+        slo = cls(**{key: float(value) for key, value in spec.items() if value is not None})
+        if slo.quantile not in QUANTILES:
+            raise ValueError(f"SLO quantile must be one of {', '.join(map(str, QUANTILES))}")
+        return slo
+
+    def met_by(self, estimate: Optional[LatencyEstimate]) -> Optional[bool]:
+        """Whether the estimate meets the SLO, None when it is not known"""
+        if estimate is None:
+            return None
+        if self.ttfb_ms is not None and estimate.ttfb * 1000 > self.ttfb_ms:
+            return False
+        if self.tokens_per_second is not None:
+            if estimate.tokens_per_second is None:
+                return None
+            if estimate.tokens_per_second < self.tokens_per_second:
+                return False
+        return True
+
+    def shortfall(self, estimate: LatencyEstimate) -> float:
+        """How far the estimate misses the SLO, as a ratio (1 meets it)"""
+        ratio = 1.0
+        if self.ttfb_ms:
+            ratio = max(ratio, estimate.ttfb * 1000 / self.ttfb_ms)
+        if self.tokens_per_second and estimate.tokens_per_second is not None:
+            ratio = max(ratio, self.tokens_per_second / max(estimate.tokens_per_second, 1e-9))
+        return ratio
+
+
+def parse_slo(value: Optional[str]) -> Optional[Dict[str, float]]:
+    """SLO fields from a header such as "ttfb_ms=800, tokens_per_second=30" """
+    if not value:
+        return None
+    try:
+        spec = {}
+        for part in value.split(","):
+            key, _, number = part.partition("=")
+            spec[key.strip()] = float(number)
+        SLO.from_dict(spec)
+    except ValueError as e:
+        logger.warning(f"Ignoring invalid SLO header {value!r}: {e}")
+        return None
+    return spec
+
+
+# Global latency tracker instance
+_latency_tracker: Optional[LatencyTracker] = None
+
+def get_latency_tracker() -> LatencyTracker:
+    """Get the process wide upstream latency tracker"""
+    global _latency_tracker
+    if _latency_tracker is None:
+        settings = get_settings()
+        _latency_tracker = LatencyTracker(
+            window=settings.SLO_WINDOW,
+            min_samples=settings.SLO_MIN_SAMPLES
+        )
+    return _latency_tracker
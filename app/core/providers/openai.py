@@ -12,7 +12,7 @@ class OpenAIProvider(OpenAICompatibleProvider):
         """Create provider instance from settings"""
         settings = get_settings()
         return cls(
-            api_key=settings.openai_api_key,
-            api_base=settings.openai_api_base,
-            timeout=settings.openai_timeout
+            api_key=settings.OPENAI_API_KEY,
+            api_base=settings.OPENAI_API_BASE,
+            timeout=settings.OPENAI_TIMEOUT
         )
\ No newline at end of file
@@ -0,0 +1,452 @@
+import bisect
+import fnmatch
+import json
+import logging
+import os
+import random
+import re
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Collection, Dict, List, Optional, Pattern, Tuple, Union
+
+from app.core.config.settings import get_settings
+from app.core.context import get_request_slo
+from app.core.exceptions import ProviderNotFoundError
+from app.core.providers.health import get_health_checker
+from app.core.providers.latency import SLO, get_latency_tracker
+
+logger = logging.getLogger(__name__)
+
+# Resolved models remembered per table, cleared with every reload
+MAX_RESOLVE_CACHE = 4096
+
+
+@dataclass(frozen=True)
+class Timeouts:
+    """Upstream timeouts in seconds, None waits indefinitely"""
+    connect: Optional[float]
+    pool: Optional[float]  # waiting for a pooled connection
+    ttfb: Optional[float]  # until the response starts, the first chunk for streams
+    idle: Optional[float]  # between chunks of a stream
+
+    @classmethod
+    def default(cls, ttfb: Optional[float] = 30.0) -> "Timeouts":
+        """Timeouts from settings, with a provider's time to first byte"""
+        settings = get_settings()
+        return cls(
+            connect=settings.UPSTREAM_CONNECT_TIMEOUT,
+            pool=settings.UPSTREAM_POOL_TIMEOUT,
+            ttfb=ttfb,
+            idle=settings.UPSTREAM_IDLE_TIMEOUT
+        )
+
+    def override(self, spec: Union[None, float, Dict[str, Optional[float]]]) -> "Timeouts":
+        """Apply a routing table timeout: a number sets the time to first byte,
+        an object any of connect, pool, ttfb and idle"""
+        if spec is None:
+            return self
+        if isinstance(spec, (int, float)):
+            return replace(self, ttfb=float(spec))
+        unknown = set(spec) - {"connect", "pool", "ttfb", "idle"}
+        if unknown:
+            raise ValueError(f"Unknown timeouts: {', '.join(sorted(unknown))}")
+        return replace(self, **{k: None if v is None else float(v) for k, v in spec.items()})
+
+
+@dataclass(frozen=True)
+class Deployment:
+    """One upstream a model can be sent to"""
+    name: str
+    provider: str  # provider class registered with LLMProviderFactory
+    api_base: str
+    api_key: Optional[str]  # comma separated when the deployment has a key pool
+    timeouts: Timeouts
+
+
+@dataclass(frozen=True)
+class RouteTarget:
+    """A deployment together with the model name sent upstream"""
+    deployment: Deployment
+    model: str
+
+
+class Route:
+    """Weighted targets for one model name, alias or pattern
+
+    A target model of None forwards the requested model name unchanged.
+    Targets whose deployment is unhealthy are skipped while the route has
+    a healthy one. Fallbacks only serve requests that failed elsewhere.
+    """
+
+    def __init__(
+        self,
+        pattern: str,
+        targets: List[Tuple[Deployment, Optional[str]]],
+        weights: List[float],
+        fallbacks: Optional[List[Tuple[Deployment, Optional[str]]]] = None
+    ):
+        self.pattern = pattern
+        self.targets = targets
+        self.weights = weights
+        self.fallbacks = fallbacks or []
+        self.cumulative: List[float] = []
+        total = 0.0
+        for weight in weights:
+            total += weight
+            self.cumulative.append(total)
+
+    def pick(self, model: str) -> RouteTarget:
+        if len(self.targets) == 1:
+            index = 0
+        else:
+            index = bisect.bisect_right(self.cumulative, random.random() * self.cumulative[-1])
+            index = min(index, len(self.targets) - 1)
+            health = get_health_checker()
+            if not health.is_healthy(self.targets[index][0].name):
+                index = self._pick_healthy(health, index)
+        deployment, upstream_model = self.targets[index]
+        return RouteTarget(deployment=deployment, model=upstream_model or model)
+
+    def _pick_healthy(self, health, fallback: int) -> int:
+        """Weighted pick among healthy targets, fallback if there are none"""
+        healthy = [i for i, (deployment, _) in enumerate(self.targets) if health.is_healthy(deployment.name)]
+        if not healthy:
+            return fallback
+        return self._weighted_choice(healthy)
+
+    def _weighted_choice(self, indices: List[int]) -> int:
+        point = random.random() * sum(self.weights[i] for i in indices)
+        for i in indices:
+            point -= self.weights[i]
+            if point < 0:
+                return i
+        return indices[-1]
+
+    def pick_fallback(self, model: str, exclude: Collection[str]) -> Optional[RouteTarget]:
+        """A target for a request that failed on the excluded deployments
+
+        Healthy targets come first, picked by weight, then healthy
+        fallbacks in order, then whatever is left.
+        """
+        health = get_health_checker()
+        others = [i for i, (deployment, _) in enumerate(self.targets) if deployment.name not in exclude]
+        fallbacks = [target for target in self.fallbacks if target[0].name not in exclude]
+        healthy = [i for i in others if health.is_healthy(self.targets[i][0].name)]
+        if healthy:
+            candidate = self.targets[self._weighted_choice(healthy)]
+        else:
+            candidates = [target for target in fallbacks if health.is_healthy(target[0].name)]
+            candidates += [self.targets[i] for i in others] + fallbacks
+            if not candidates:
+                return None
+            candidate = candidates[0]
+        deployment, upstream_model = candidate
+        return RouteTarget(deployment=deployment, model=upstream_model or model)
+
+
+class SLORoute(Route):
+    """Equivalent targets for one model class, served by the cheapest that
+    meets a latency SLO
+
+    Each target's time to first token and throughput at the SLO's
+    quantile come from the latency tracker's rolling statistics. The
+    cheapest healthy target meeting the SLO is picked; without one, the
+    cheapest whose statistics are not known yet, else the one missing the
+    SLO by the least. A small share of requests goes to the least sampled
+    other target instead, so statistics stay current and traffic moves
+    back when a cheaper target recovers. A target's cost is its "cost"
+    in the routing table, or its prompt plus completion price per million
+    tokens from MODEL_PRICES. Requests may tighten or relax the SLO with
+    the SLO_HEADER.
+    """
+
+    def __init__(
+        self,
+        pattern: str,
+        targets: List[Tuple[Deployment, Optional[str]]],
+        costs: List[Optional[float]],
+        slo: SLO,
+        explore_rate: float,
+        fallbacks: Optional[List[Tuple[Deployment, Optional[str]]]] = None
+    ):
+        super().__init__(pattern, targets, [1.0] * len(targets), fallbacks)
+        self.costs = costs
+        self.slo = slo
+        self.explore_rate = explore_rate
+
+    def _cost(self, index: int, model: str) -> float:
+        cost = self.costs[index]
+        if cost is None:
+            from app.services.usage.recorder import get_usage_recorder
+
+            prompt, completion = get_usage_recorder().get_price(self.targets[index][1] or model)
+            cost = prompt + completion
+        return cost
+
+    def pick(self, model: str) -> RouteTarget:
+        slo = self.slo
+        overrides = get_request_slo()
+        if overrides:
+            slo = replace(slo, **overrides)
+        health = get_health_checker()
+        tracker = get_latency_tracker()
+        candidates = [i for i, (deployment, _) in enumerate(self.targets) if health.is_healthy(deployment.name)]
+        candidates = candidates or list(range(len(self.targets)))
+
+        meeting: List[int] = []
+        unknown: List[int] = []
+        shortfalls: Dict[int, float] = {}
+        for i in candidates:
+            deployment, upstream_model = self.targets[i]
+            estimate = tracker.estimate(deployment.name, upstream_model or model, slo.quantile)
+            verdict = slo.met_by(estimate)
+            if verdict:
+                meeting.append(i)
+            elif verdict is None:
+                unknown.append(i)
+            else:
+                shortfalls[i] = slo.shortfall(estimate)
+        if meeting or unknown:
+            index = min(meeting or unknown, key=lambda i: self._cost(i, model))
+        else:
+            index = min(shortfalls, key=lambda i: (shortfalls[i], self._cost(i, model)))
+
+        if len(candidates) > 1 and random.random() < self.explore_rate:
+            index = min(
+                (i for i in candidates if i != index),
+                key=lambda i: tracker.samples(self.targets[i][0].name, self.targets[i][1] or model)
+            )
+        deployment, upstream_model = self.targets[index]
+        return RouteTarget(deployment=deployment, model=upstream_model or model)
+
+
+class RoutingTable:
+    """Compiled routing table
+
+    Exact model names and aliases are a dict lookup. Glob patterns are
+    tried in file order, and whichever route a model name ends up with is
+    memoized, so every model name is matched against the patterns once per
+    table version. Weighted splits pick a target by bisecting cumulative
+    weights, SLO routes by cost and live latency statistics.
+    """
+
+    def __init__(self, deployments: Dict[str, Deployment], routes: List[Route]):
+        self.deployments = deployments
+        self._exact: Dict[str, Route] = {}
+        self._patterns: List[Tuple[Pattern, Route]] = []
+        for route in routes:
+            if any(c in route.pattern for c in "*?["):
+                self._patterns.append((re.compile(fnmatch.translate(route.pattern)), route))
+            else:
+                self._exact.setdefault(route.pattern, route)
+        self._resolved: Dict[str, Optional[Route]] = {}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RoutingTable":
+        """Build a table from its JSON form, raising ValueError if invalid"""
+        from app.core.providers.base import LLMProviderFactory
+
+        settings = get_settings()
+        defaults = {
+            config["provider"]: config for config in settings.PROVIDER_CONFIGS.values()
+        }
+
+        deployments: Dict[str, Deployment] = {}
+        for name, spec in data.get("deployments", {}).items():
+            provider = spec.get("provider", name)
+            if not LLMProviderFactory.is_registered(provider):
+                raise ValueError(f"Deployment {name!r} uses unknown provider {provider!r}")
+            default = defaults.get(provider, {})
+            if "api_key_env" in spec:
+                # A list of variables pools their keys
+                names = spec["api_key_env"] if isinstance(spec["api_key_env"], list) else [spec["api_key_env"]]
+                api_key = ",".join(os.environ[name] for name in names if os.environ.get(name)) or None
+            else:
+                api_key = getattr(settings, default.get("api_key", ""), None)
+            api_base = spec.get("api_base") or getattr(settings, default.get("api_base", ""), None)
+            if not api_base:
+                raise ValueError(f"Deployment {name!r} has no api_base")
+            timeouts = Timeouts.default(getattr(settings, default.get("timeout", ""), 30.0))
+            deployments[name] = Deployment(
+                name=name,
+                provider=provider,
+                api_base=api_base.rstrip("/"),
+                api_key=api_key,
+                timeouts=timeouts.override(spec.get("timeout"))
+            )
+
+        routes: List[Route] = []
+        for spec in data.get("routes", []):
+            patterns = spec["match"] if isinstance(spec["match"], list) else [spec["match"]]
+
+            def resolve_target(target: Dict[str, Any]) -> Tuple[Deployment, Optional[str]]:
+                deployment = deployments.get(target.get("deployment"))
+                if deployment is None:
+                    raise ValueError(
+                        f"Route {patterns[0]!r} targets unknown deployment {target.get('deployment')!r}"
+                    )
+                if "timeout" in spec:
+                    # Same deployment and connection pool, other timeouts for these models
+                    deployment = replace(deployment, timeouts=deployment.timeouts.override(spec["timeout"]))
+                return deployment, target.get("model")
+
+            mode = spec.get("mode", "weighted")
+            if mode not in ("weighted", "slo"):
+                raise ValueError(f"Route {patterns[0]!r} has unknown mode {mode!r}")
+            targets: List[Tuple[Deployment, Optional[str]]] = []
+            weights: List[float] = []
+            costs: List[Optional[float]] = []
+            for target in spec.get("targets", []):
+                weight = float(target.get("weight", 1))
+                if weight < 0:
+                    raise ValueError(f"Route {patterns[0]!r} has a negative weight")
+                if weight == 0:
+                    continue
+                targets.append(resolve_target(target))
+                weights.append(weight)
+                costs.append(None if target.get("cost") is None else float(target["cost"]))
+            if not targets:
+                raise ValueError(f"Route {patterns[0]!r} has no target with positive weight")
+            fallbacks = [resolve_target(target) for target in spec.get("fallbacks", [])]
+            if mode == "slo":
+                slo = SLO.from_dict(spec.get("slo", {}))
+                explore_rate = float(spec.get("explore_rate", settings.SLO_EXPLORE_RATE))
+            for pattern in patterns:
+                if mode == "slo":
+                    routes.append(SLORoute(pattern, targets, costs, slo, explore_rate, fallbacks))
+                else:
+                    routes.append(Route(pattern, targets, weights, fallbacks))
+        return cls(deployments, routes)
+
+    @classmethod
+    def default(cls) -> "RoutingTable":
+        """Table used without a routing file: provider name prefixes"""
+        from app.core.providers.base import LLMProviderFactory
+
+        settings = get_settings()
+        deployments: Dict[str, Dict] = {}
+        routes: List[Dict] = []
+        for prefix, config in settings.PROVIDER_CONFIGS.items():
+            provider = config["provider"]
+            if not LLMProviderFactory.is_registered(provider):
+                continue
+            deployments[provider] = {"provider": provider}
+            routes.append({"match": f"{prefix}*", "targets": [{"deployment": provider}]})
+            if prefix != provider:
+                routes.append({"match": f"{provider}*", "targets": [{"deployment": provider}]})
+        return cls.from_dict({"deployments": deployments, "routes": routes})
+
+    def _find_route(self, model: str) -> Optional[Route]:
+        try:
+            return self._resolved[model]
+        except KeyError:
+            pass
+        route = self._exact.get(model)
+        if route is None:
+            for regex, candidate in self._patterns:
+                if regex.match(model):
+                    route = candidate
+                    break
+        if len(self._resolved) >= MAX_RESOLVE_CACHE:
+            self._resolved.clear()
+        self._resolved[model] = route
+        return route
+
+    def resolve(self, model: str) -> RouteTarget:
+        """Pick the deployment and upstream model name for a requested model"""
+        route = self._find_route(model)
+        if route is None:
+            raise ProviderNotFoundError(model)
+        return route.pick(model)
+
+    def resolve_fallback(self, model: str, exclude: Collection[str]) -> Optional[RouteTarget]:
+        """Another target for a requested model, None if all were tried"""
+        route = self._find_route(model)
+        if route is None:
+            return None
+        return route.pick_fallback(model, exclude)
+
+    def get_upstreams(self) -> Dict[str, str]:
+        """Map deployment name to API base for every deployment with an API key
+
+        Deployments sharing an API base share a connection pool, so only
+        the first of them is listed.
+        """
+        upstreams: Dict[str, str] = {}
+        for name, deployment in self.deployments.items():
+            if deployment.api_key and deployment.api_base not in upstreams.values():
+                upstreams[name] = deployment.api_base
+        return upstreams
+
+
+class RoutingTableLoader:
+    """Loads the routing table file and reloads it when it changes
+
+    The file's modification time is checked at most every reload_interval
+    seconds, on lookup, so each worker process picks up edits on its own.
+    A file that fails to parse on reload is logged and the previous table
+    stays in effect.
+    """
+
+    def __init__(self, path: Optional[str], reload_interval: float = 5.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._table: Optional[RoutingTable] = None
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+
+    def _file_mtime(self) -> Optional[float]:
+        if not self.path:
+            return None
+        try:
+            return os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _load(self, mtime: Optional[float]) -> RoutingTable:
+        if mtime is None:
+            return RoutingTable.default()
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return RoutingTable.from_dict(data)
+
+    def get_table(self) -> RoutingTable:
+        """Current table, reloading the file first if it has changed"""
+        now = time.monotonic()
+        if self._table is not None and now - self._checked_at < self.reload_interval:
+            return self._table
+        self._checked_at = now
+
+        mtime = self._file_mtime()
+        if self._table is not None and mtime == self._mtime:
+            return self._table
+        try:
+            table = self._load(mtime)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if self._table is None:
+                raise ValueError(f"Invalid routing table {self.path}: {e}") from e
+            logger.error(f"Invalid routing table {self.path}, keeping previous version: {e}")
+            # Do not retry until the file changes again
+            self._mtime = mtime
+            return self._table
+
+        if self._table is not None:
+            logger.info(f"Reloaded routing table from {self.path or 'defaults'}")
+        self._table = table
+        self._mtime = mtime
+        return table
+
+
+# Global routing table loader
+_routing_table_loader: Optional[RoutingTableLoader] = None
+
+def get_routing_table() -> RoutingTable:
+    """Get the current routing table"""
+    global _routing_table_loader
+    if _routing_table_loader is None:
+        settings = get_settings()
+        _routing_table_loader = RoutingTableLoader(
+            path=settings.ROUTING_TABLE_PATH,
+            reload_interval=settings.ROUTING_RELOAD_INTERVAL
+        )
+    return _routing_table_loader.get_table()
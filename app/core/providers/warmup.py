@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.core.config.settings import get_settings
+from .http_client import get_idle_seconds, get_shared_client
+from .routing import get_routing_table
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionWarmer:
+    """Pre-open and keep warm pooled connections to configured upstreams
+
+    Warm-up opens connections by firing concurrent HEAD probes at each
+    upstream base URL: the status code does not matter, only that DNS, TCP
+    and TLS setup happen before real traffic arrives and that the
+    connection is returned to the shared pool afterwards. Upstreams that
+    have been idle longer than the keep-alive interval get the same probes
+    periodically, so their pooled connections are not closed on us.
+    The warmer is warm once a probe has been answered; if warm-up opens no
+    connection, the keep-alive probes keep trying.
+    """
+
+    def __init__(
+        self,
+        upstreams: Dict[str, str],
+        connections: int = 2,
+        timeout: float = 10.0,
+        keepalive_interval: float = 20.0
+    ):
+        self.upstreams = upstreams
+        self.connections = connections
+        self.timeout = timeout
+        self.keepalive_interval = keepalive_interval
+        self.warm = False
+        self.opened: Dict[str, int] = {}  # connections opened by warm-up, per upstream name
+        self._keepalive_task: Optional[asyncio.Task] = None
+
+    async def _probe(self, api_base: str) -> bool:
+        client = get_shared_client(api_base)
+        try:
+            await client.head(api_base, timeout=self.timeout)
+            self.warm = True
+            return True
+        except httpx.HTTPError as e:
+            logger.warning(f"Warm-up probe to {api_base} failed: {e!r}")
+            return False
+
+    async def _warm_upstream(self, name: str, api_base: str) -> None:
+        async def probe() -> None:
+            # Counted as they open, so a timeout still reports them
+            if await self._probe(api_base):
+                self.opened[name] += 1
+
+        await asyncio.gather(*(probe() for _ in range(self.connections)))
+
+    async def warm_up(self) -> None:
+        """Open connections to every upstream, bounded by the warm-up timeout"""
+        if self.connections <= 0 or not self.upstreams:
+            self.warm = True
+            return
+        self.opened = {name: 0 for name in self.upstreams}
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(
+                    *(self._warm_upstream(name, base) for name, base in self.upstreams.items())
+                ),
+                timeout=self.timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Upstream warm-up timed out, continuing startup")
+        for name, opened in self.opened.items():
+            logger.info(f"Warmed {opened}/{self.connections} connection(s) to {name} ({self.upstreams[name]})")
+        if not self.warm:
+            logger.warning("Upstream warm-up opened no connection, not ready until a keep-alive probe succeeds")
+
+    async def _keepalive(self) -> None:
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            idle: List[str] = [
+                base for base in self.upstreams.values()
+                if get_idle_seconds(base) >= self.keepalive_interval
+            ]
+            for api_base in idle:
+                await asyncio.gather(
+                    *(self._probe(api_base) for _ in range(max(1, self.connections)))
+                )
+
+    async def start(self) -> None:
+        """Warm up, then keep idle upstream connections alive"""
+        await self.warm_up()
+        if self.keepalive_interval > 0 and self.upstreams:
+            self._keepalive_task = asyncio.create_task(self._keepalive())
+
+    async def stop(self) -> None:
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            try:
+                await self._keepalive_task
+            except asyncio.CancelledError:
+                pass
+            self._keepalive_task = None
+
+
+# Global warmer instance
+_connection_warmer: Optional[ConnectionWarmer] = None
+
+def get_connection_warmer() -> ConnectionWarmer:
+    """Get the process wide connection warmer"""
+    global _connection_warmer
+    if _connection_warmer is None:
+        settings = get_settings()
+        _connection_warmer = ConnectionWarmer(
+            upstreams=get_routing_table().get_upstreams(),
+            connections=settings.UPSTREAM_WARMUP_CONNECTIONS,
+            timeout=settings.UPSTREAM_WARMUP_TIMEOUT,
+            keepalive_interval=settings.UPSTREAM_KEEPALIVE_INTERVAL
+        )
+    return _connection_warmer
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import logging
+import time
+from contextlib import aclosing
+from typing import AsyncGenerator, AsyncIterator
+
+import anyio
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from app.core.tracing import activate, create_span
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of the upstream stream in the relay buffer
+_END = object()
+
+
+class _StreamError:
+    """Carries an upstream exception through the relay buffer"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def _is_done_frame(chunk: str) -> bool:
+    return chunk.startswith("data: [DONE]")
+
+
+def _carries_token(chunk: str) -> bool:
+    """Whether a chunk holds a frame with generated content, rather than
+    only the role or an empty delta"""
+    for frame in chunk.split("\n\n"):
+        if not frame.startswith("data: ") or _is_done_frame(frame):
+            continue
+        try:
+            data = json.loads(frame[6:])
+        except ValueError:
+            continue
+        choices = data.get("choices") if isinstance(data, dict) else None
+        for choice in choices or []:
+            delta = choice.get("delta") if isinstance(choice, dict) else None
+            if isinstance(delta, dict) and (delta.get("content") or delta.get("tool_calls")):
+                return True
+    return False
+
+
+async def relay_stream(
+    source: AsyncGenerator[str, None],
+    buffer_size: int = 32,
+    coalesce_window: float = 0.0,
+    coalesce_max_bytes: int = 4096
+) -> AsyncGenerator[str, None]:
+    """Relay a stream through a bounded buffer
+
+    The upstream is read by a separate task into a queue of at most
+    buffer_size chunks. A slow client therefore stops the reader (and with
+    it the upstream socket) instead of letting chunks pile up in memory.
+    When the consumer goes away before the upstream is finished, the
+    reader is cancelled so the upstream request is aborted and its pooled
+    connection released right away instead of at garbage collection.
+
+    With a coalesce_window (seconds), SSE frames arriving within the window
+    after the first one are joined into a single chunk of at most about
+    coalesce_max_bytes, so token-per-frame upstreams cost one socket write
+    per window instead of one per token. Frames up to and including the
+    first one carrying content (upstreams open with a role-only frame) and
+    the final [DONE] frame are always written immediately.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, buffer_size))
+    loop = asyncio.get_running_loop()
+
+    async def pump() -> None:
+        try:
+            async with aclosing(source):
+                async for chunk in source:
+                    await queue.put(chunk)
+        except Exception as e:
+            await queue.put(_StreamError(e))
+            return
+        await queue.put(_END)
+
+    def check_terminal(item) -> bool:
+        if isinstance(item, _StreamError):
+            raise item.error
+        return item is _END
+
+    span = create_span("stream.relay", coalesce_window_ms=coalesce_window * 1000)
+    with activate(span):
+        # The reader task inherits the span, upstream spans nest under it
+        reader = asyncio.create_task(pump())
+    finished = False
+    first = True
+    # Until the first token every frame is written as it comes
+    awaiting_token = True
+    writes = 0
+    try:
+        while True:
+            item = await queue.get()
+            if check_terminal(item):
+                finished = True
+                return
+            if coalesce_window <= 0 or awaiting_token or _is_done_frame(item):
+                if first and span is not None:
+                    span.set_attribute("first_chunk_ms", (time.time_ns() - span.start_ns) / 1e6)
+                first = False
+                if awaiting_token and coalesce_window > 0:
+                    awaiting_token = not _carries_token(item)
+                writes += 1
+                yield item
+                continue
+
+            parts = [item]
+            size = len(item)
+            deadline = loop.time() + coalesce_window
+            terminal = None
+            while size < coalesce_max_bytes:
+                if queue.empty():
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = queue.get_nowait()
+                if item is _END or isinstance(item, _StreamError):
+                    terminal = item
+                    break
+                parts.append(item)
+                size += len(item)
+                if _is_done_frame(item):
+                    break
+            writes += 1
+            yield "".join(parts)
+            if terminal is not None and check_terminal(terminal):
+                finished = True
+                return
+    finally:
+        if not reader.done():
+            if not finished:
+                logger.info("Stream consumer went away, cancelling upstream request")
+            reader.cancel()
+        try:
+            await reader
+        except asyncio.CancelledError:
+            pass
+        if span is not None:
+            span.set_attribute("writes", writes)
+            span.set_attribute("completed", finished)
+            span.end()
+
+
+class DisconnectAwareStreamingResponse(StreamingResponse):
+    """StreamingResponse that always closes its body iterator
+
+    Starlette stops iterating the body when the client disconnects but
+    leaves the generator suspended until it is garbage collected, which
+    keeps the upstream request running. Closing it explicitly (shielded
+    from the cancellation that ended the response) runs the generator's
+    cleanup immediately.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            body_iterator: AsyncIterator = self.body_iterator
+            if hasattr(body_iterator, "aclose"):
+                with anyio.CancelScope(shield=True):
+                    await body_iterator.aclose()
@@ -0,0 +1,429 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import re
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+import httpx
+from fastapi.routing import APIRoute
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """A timed operation within a trace
+
+    Spans of unsampled traces are never created: the parent (or a bare
+    non-recording root) is handed out instead, so instrumented code costs
+    a contextvar lookup and the trace id is still propagated upstream.
+    """
+
+    __slots__ = (
+        "trace_id", "span_id", "parent_id", "name", "kind",
+        "start_ns", "end_ns", "attributes", "status", "status_message", "sampled"
+    )
+
+    def __init__(
+        self,
+        trace_id: str,
+        parent_id: Optional[str],
+        name: str,
+        kind: int = SPAN_KIND_INTERNAL,
+        sampled: bool = True,
+        start_ns: Optional[int] = None
+    ):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.status = 0
+        self.status_message = ""
+        self.sampled = sampled
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if self.sampled:
+            self.attributes[key] = value
+
+    def set_error(self, error: BaseException) -> None:
+        if self.sampled:
+            self.status = STATUS_ERROR
+            self.status_message = f"{type(error).__name__}: {error}"
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        if self.sampled and self.end_ns is None:
+            self.end_ns = end_ns or time.time_ns()
+            get_span_exporter().add(self)
+
+    @property
+    def traceparent(self) -> str:
+        """W3C traceparent header value naming this span as the parent"""
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span: Dict[str, Any] = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.status:
+            span["status"] = {"code": self.status, "message": self.status_message}
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def get_current_span() -> Optional[Span]:
+    """Innermost span of the current context, if tracing is active"""
+    return _current_span.get()
+
+
+def start_root_span(name: str, traceparent: Optional[str] = None, kind: int = SPAN_KIND_SERVER) -> Span:
+    """Start a trace, continuing the caller's when a valid traceparent is given
+
+    The sampling decision of the caller is kept; new traces are sampled
+    with probability TRACING_SAMPLE_RATE.
+    """
+    match = _TRACEPARENT_RE.match(traceparent.strip().lower()) if traceparent else None
+    if match and match.group(1) != "0" * 32:
+        trace_id, parent_id = match.group(1), match.group(2)
+        sampled = bool(int(match.group(3), 16) & 1)
+    else:
+        trace_id, parent_id = os.urandom(16).hex(), None
+        sampled = random.random() < get_settings().TRACING_SAMPLE_RATE
+    return Span(trace_id, parent_id, name, kind=kind, sampled=sampled)
+
+
+@contextmanager
+def use_span(span: Span) -> Iterator[Span]:
+    """Make span current and end it on exit, recording an exception"""
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        if not isinstance(e, (GeneratorExit, asyncio.CancelledError)):
+            span.set_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+@contextmanager
+def start_span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Start a child span of the current span
+
+    Yields None outside of a trace and the parent itself when the trace is
+    not sampled, so callers only need a None check.
+    """
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        yield parent
+        return
+    span = Span(parent.trace_id, parent.span_id, name, kind=kind)
+    span.attributes.update(attributes)
+    with use_span(span):
+        yield span
+
+
+def create_span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes: Any) -> Optional[Span]:
+    """Create a child span without making it current, or None if not sampled
+
+    For spans that outlive a with block, such as one covering a stream;
+    the caller ends it.
+    """
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        return None
+    span = Span(parent.trace_id, parent.span_id, name, kind=kind)
+    span.attributes.update(attributes)
+    return span
+
+
+@contextmanager
+def activate(span: Optional[Span]) -> Iterator[None]:
+    """Make span current for the block without ending it"""
+    if span is None:
+        yield
+        return
+    token = _current_span.set(span)
+    try:
+        yield
+    finally:
+        _current_span.reset(token)
+
+
+def record_span(name: str, start_ns: int, end_ns: int, parent: Optional[Span] = None, **attributes: Any) -> None:
+    """Record an already finished child span, e.g. from timestamps of events"""
+    parent = parent or _current_span.get()
+    if parent is None or not parent.sampled:
+        return
+    span = Span(parent.trace_id, parent.span_id, name, start_ns=start_ns)
+    span.attributes.update(attributes)
+    span.end(end_ns)
+
+
+class UpstreamTrace:
+    """httpcore trace callback turning connection events into spans
+
+    Passed as the "trace" request extension. Records upstream.connect_tcp
+    and upstream.tls_handshake (only when a new connection is opened) and
+    upstream.ttfb (request sent until response headers received) under
+    span. Time before the first of these is spent waiting for the pool.
+    """
+
+    def __init__(self, span: Span):
+        self.span = span
+        self._started: Dict[str, int] = {}
+
+    async def __call__(self, event_name: str, info: Dict[str, Any]) -> None:
+        name, _, phase = event_name.rpartition(".")
+        now = time.time_ns()
+        if phase == "started":
+            self._started[name] = now
+        elif phase == "complete":
+            start = self._started.pop(name, now)
+            if name == "connection.connect_tcp":
+                record_span("upstream.connect_tcp", start, now, parent=self.span)
+            elif name == "connection.start_tls":
+                record_span("upstream.tls_handshake", start, now, parent=self.span)
+            elif name.endswith("send_request_headers"):
+                self._started["ttfb"] = start
+            elif name.endswith("receive_response_headers"):
+                record_span("upstream.ttfb", self._started.get("ttfb", start), now, parent=self.span)
+
+
+# Timestamps of the route handler currently running, see TracedRoute
+_route_timing: contextvars.ContextVar[Optional[Dict[str, int]]] = contextvars.ContextVar("route_timing", default=None)
+
+
+class TracedRoute(APIRoute):
+    """APIRoute splitting the handler into parse, endpoint and serialize spans
+
+    request.parse covers reading the body, validation and dependencies,
+    response.serialize covers response model validation and encoding.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs: Any):
+        if asyncio.iscoroutinefunction(endpoint):
+            endpoint = self._wrap_endpoint(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    @staticmethod
+    def _wrap_endpoint(endpoint: Callable) -> Callable:
+        @functools.wraps(endpoint)
+        async def traced_endpoint(*args: Any, **kwargs: Any) -> Any:
+            timing = _route_timing.get()
+            if timing is None:
+                return await endpoint(*args, **kwargs)
+            timing["endpoint_start"] = time.time_ns()
+            try:
+                with start_span("endpoint"):
+                    return await endpoint(*args, **kwargs)
+            finally:
+                timing["endpoint_end"] = time.time_ns()
+        return traced_endpoint
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def traced_handler(request):
+            parent = _current_span.get()
+            if parent is None or not parent.sampled:
+                return await handler(request)
+            timing = {"start": time.time_ns()}
+            token = _route_timing.set(timing)
+            try:
+                return await handler(request)
+            finally:
+                _route_timing.reset(token)
+                end = time.time_ns()
+                record_span("request.parse", timing["start"], timing.get("endpoint_start", end), parent=parent)
+                if "endpoint_end" in timing:
+                    record_span("response.serialize", timing["endpoint_end"], end, parent=parent)
+        return traced_handler
+
+
+class SpanExporter:
+    """Buffers finished spans and exports them in the background
+
+    Spans are written as OTLP/JSON ExportTraceServiceRequest documents,
+    one per line to a file or POSTed to an OTLP/HTTP collector. When the
+    buffer is full the oldest spans are dropped rather than slowing
+    requests down.
+    """
+
+    def __init__(
+        self,
+        file_path: Optional[str] = None,
+        endpoint: Optional[str] = None,
+        interval: float = 5.0,
+        max_queue: int = 10000,
+        service_name: str = "llm-api-gateway"
+    ):
+        self.file_path = file_path
+        self.endpoint = endpoint
+        self.interval = interval
+        self.service_name = service_name
+        self._queue: Deque[Span] = deque(maxlen=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self.dropped = 0
+
+    def add(self, span: Span) -> None:
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+        self._queue.append(span)
+
+    def _document(self, spans: List[Span]) -> Dict[str, Any]:
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    _otlp_attribute("service.name", self.service_name),
+                    _otlp_attribute("process.pid", os.getpid()),
+                ]},
+                "scopeSpans": [{
+                    "scope": {"name": "app.core.tracing"},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+
+    def _append(self, line: str) -> None:
+        with open(self.file_path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    async def flush(self) -> None:
+        """Export all buffered spans"""
+        if not self._queue:
+            return
+        spans = list(self._queue)
+        self._queue.clear()
+        document = self._document(spans)
+        if self.endpoint:
+            if self._client is None:
+                self._client = httpx.AsyncClient(timeout=10.0)
+            response = await self._client.post(self.endpoint, json=document)
+            response.raise_for_status()
+        if self.file_path:
+            await asyncio.to_thread(self._append, json.dumps(document, separators=(",", ":")))
+
+    async def _export_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Span export failed, spans dropped: {e}")
+
+    async def start(self) -> None:
+        if self.file_path and os.path.dirname(self.file_path):
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        self._task = asyncio.create_task(self._export_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning(f"Final span export failed: {e}")
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class TracingMiddleware:
+    """Root span per HTTP request, from first byte in to last byte out
+
+    A pure ASGI middleware so streamed responses are covered until their
+    final body message. Should wrap every other middleware.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        span = start_root_span(
+            f"{scope['method']} {scope['path']}",
+            traceparent=Headers(scope=scope).get("traceparent")
+        )
+        span.set_attribute("http.method", scope["method"])
+        span.set_attribute("http.target", scope["path"])
+
+        async def traced_send(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                span.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    span.status = STATUS_ERROR
+            await send(message)
+
+        with use_span(span):
+            await self.app(scope, receive, traced_send)
+
+
+# Global span exporter instance
+_span_exporter: Optional[SpanExporter] = None
+
+def get_span_exporter() -> SpanExporter:
+    """Get the process wide span exporter"""
+    global _span_exporter
+    if _span_exporter is None:
+        settings = get_settings()
+        _span_exporter = SpanExporter(
+            file_path=settings.TRACING_EXPORT_FILE,
+            endpoint=settings.TRACING_OTLP_ENDPOINT,
+            interval=settings.TRACING_EXPORT_INTERVAL,
+            service_name=settings.PROJECT_NAME
+        )
+    return _span_exporter
@@ -1,14 +1,24 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
 from app.core.config.settings import get_settings
 from app.core.middleware.request_logging import RequestLoggingMiddleware
 from app.core.middleware.rate_limit import RateLimitMiddleware
+from app.core.middleware.compression import CompressionMiddleware
+from app.core.middleware.capture import CaptureMiddleware, get_traffic_capture
+from app.core.diagnostics import get_loop_monitor
+from app.core.tracing import TracingMiddleware, get_span_exporter
 from app.core.exceptions import AppError
 from app.core.handlers import app_error_handler, validation_error_handler, generic_error_handler
-from app.api.v1 import endpoints
+from app.api.v1 import debug, endpoints, jobs, usage, ws
 from app.utils.system_info import get_welcome_info
 from app.core.logging_config import setup_logging
+from app.core.providers.health import get_health_checker
+from app.core.providers.http_client import close_shared_clients
+from app.core.providers.warmup import get_connection_warmer
+from app.services.batch.jobs import get_batch_job_manager
+from app.services.usage.recorder import get_usage_recorder
 
 # Get settings
 settings = get_settings()
@@ -40,8 +50,32 @@ app.add_middleware(
 if settings.RATE_LIMIT_ENABLED:
     app.add_middleware(RateLimitMiddleware)
 
+# Added last so it wraps every other middleware and sees final responses
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_SIZE,
+        gzip_level=settings.COMPRESSION_GZIP_LEVEL
+    )
+
+# Wraps compression, to record what clients actually sent and received
+if settings.CAPTURE_ENABLED:
+    app.add_middleware(CaptureMiddleware)
+
+# Outermost, so the root span covers every middleware and the whole response
+if settings.TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
+
 # Include routers
 app.include_router(endpoints.router, prefix=settings.API_V1_STR)
+if settings.BATCH_JOB_ENABLED:
+    app.include_router(jobs.router, prefix=settings.API_V1_STR)
+if settings.USAGE_ENABLED:
+    app.include_router(usage.router, prefix=settings.API_V1_STR)
+if settings.WS_ENABLED:
+    app.include_router(ws.router, prefix=settings.API_V1_STR)
+if settings.DEBUG_ENDPOINTS_ENABLED:
+    app.include_router(debug.router, prefix=settings.API_V1_STR)
 
 
 @app.get("/")
@@ -52,6 +86,23 @@ async def root():
     }
 
 
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    """Liveness: the worker's event loop is serving requests"""
+    return {"status": "ok"}
+
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    """Readiness: connection pools are warm and an upstream is healthy"""
+    warmer = get_connection_warmer()
+    ready = warmer.warm and get_health_checker().is_ready()
+    return JSONResponse(
+        {"status": "ready" if ready else "not_ready", "warm": warmer.warm, "warmed_connections": warmer.opened},
+        status_code=200 if ready else 503
+    )
+
+
 @app.on_event("startup")
 async def startup_event():
     """Startup event handler"""
@@ -62,10 +113,37 @@ async def startup_event():
         backup_count=settings.LOG_BACKUP_COUNT,
         log_level=settings.LOG_LEVEL
     )
+    if settings.LOOP_MONITOR_ENABLED:
+        await get_loop_monitor().start()
+    if settings.TRACING_ENABLED:
+        await get_span_exporter().start()
+    if settings.CAPTURE_ENABLED:
+        await get_traffic_capture().start()
+    # Open upstream connections before the worker starts accepting traffic
+    await get_connection_warmer().start()
+    await get_health_checker().start()
+    if settings.USAGE_ENABLED:
+        await get_usage_recorder().start()
+    if settings.BATCH_JOB_ENABLED:
+        await get_batch_job_manager().start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Shutdown event handler"""
-    # Cleanup resources if needed
-    pass
+    # Readiness already fails from the signal under app.server; this covers
+    # other launchers, by which time the listener is closed
+    await get_health_checker().stop()
+    if settings.BATCH_JOB_ENABLED:
+        await get_batch_job_manager().stop()
+    if settings.USAGE_ENABLED:
+        # After batch jobs, whose last requests are still being accounted
+        await get_usage_recorder().stop()
+    await get_connection_warmer().stop()
+    await close_shared_clients()
+    if settings.CAPTURE_ENABLED:
+        await get_traffic_capture().stop()
+    if settings.TRACING_ENABLED:
+        await get_span_exporter().stop()
+    if settings.LOOP_MONITOR_ENABLED:
+        await get_loop_monitor().stop()
@@ -1,10 +1,13 @@
 from typing import List, Optional, Union, Dict, Any, Literal
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
 class Message(BaseModel):
     """Chat message"""
     role: str
     content: str
+    # Marks the end of a prompt prefix to cache upstream, e.g. {"type": "ephemeral"};
+    # only read by providers that need explicit cache breakpoints, never serialized
+    cache_control: Optional[Dict[str, Any]] = Field(default=None, exclude=True)
 
 class ChatCompletionRequest(BaseModel):
     """Chat completion request"""
@@ -16,6 +19,10 @@ class ChatCompletionRequest(BaseModel):
     max_tokens: Optional[int] = None
     presence_penalty: Optional[float] = None
     frequency_penalty: Optional[float] = None
+    stream_options: Optional[Dict[str, Any]] = None
+
+    # Local prompt token estimate, filled in by the pre-flight check
+    _prompt_tokens: Optional[int] = PrivateAttr(default=None)
 
 class DeltaMessage(BaseModel):
     role: Optional[str] = None
@@ -50,6 +57,60 @@ class ChatCompletionStreamResponse(BaseModel):
     created: int
     model: str
     choices: List[ChatCompletionStreamChoice]
+    usage: Optional[UsageInfo] = None
 
 class ErrorResponse(BaseModel):
-    error: Dict[str, Any] 
\ No newline at end of file
+    error: Dict[str, Any] 
+
+class EmbeddingRequest(BaseModel):
+    """Embedding request"""
+    model: str
+    input: Union[str, List[str]]
+    encoding_format: Literal["float", "base64"] = "float"
+    dimensions: Optional[int] = Field(default=None, ge=1)
+    user: Optional[str] = None
+
+class EmbeddingData(BaseModel):
+    object: str = "embedding"
+    index: int
+    embedding: Union[List[float], str]
+
+class EmbeddingUsage(BaseModel):
+    prompt_tokens: int = 0
+    total_tokens: int = 0
+
+class EmbeddingResponse(BaseModel):
+    """Embedding response"""
+    object: str = "list"
+    data: List[EmbeddingData]
+    model: str
+    usage: EmbeddingUsage
+
+class BatchChatCompletionItem(BaseModel):
+    """Single item of a batch chat completion request"""
+    custom_id: str
+    request: ChatCompletionRequest
+
+class BatchChatCompletionRequest(BaseModel):
+    """Batch chat completion request"""
+    requests: List[BatchChatCompletionItem]
+    max_concurrency: Optional[int] = Field(default=None, ge=1)
+
+class BatchChatCompletionResult(BaseModel):
+    """Single NDJSON line of a batch chat completion response"""
+    custom_id: str
+    status_code: int
+    response: Optional[ChatCompletionResponse] = None
+    error: Optional[Dict[str, Any]] = None
+
+class BatchJob(BaseModel):
+    """Asynchronous batch job status"""
+    id: str
+    status: Literal["queued", "running", "completed", "failed", "cancelled"] = "queued"
+    created_at: int
+    updated_at: int
+    total: int = 0
+    completed: int = 0
+    failed: int = 0
+    error: Optional[str] = None
+    tenant: Optional[str] = None
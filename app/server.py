@@ -0,0 +1,243 @@
+"""Multi-process server launcher
+
+Pre-forks worker processes that each bind the listening port with
+SO_REUSEPORT, so the kernel spreads incoming connections across workers
+and one container can use every core. Crashed workers are restarted, and
+on SIGTERM/SIGINT every worker stops accepting new connections and lets
+in-flight requests (including SSE streams) finish up to a deadline.
+
+Usage:
+    python -m app.server [--host HOST] [--port PORT] [--workers N]
+"""
+import argparse
+import logging
+import math
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, List, Optional
+
+import uvicorn
+
+from app.core.config.settings import get_settings
+
+logger = logging.getLogger("app.server")
+
+# A worker dying sooner than this after start counts as a crash loop
+MIN_WORKER_UPTIME = 5.0
+MAX_RESTART_BACKOFF = 30.0
+
+
+def get_cpu_quota() -> Optional[int]:
+    """CPUs allowed by the container's cgroup CPU quota, None when unlimited"""
+    for path, period_path in (
+        ("/sys/fs/cgroup/cpu.max", None),  # cgroup v2: "<quota> <period>"
+        ("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "/sys/fs/cgroup/cpu/cpu.cfs_period_us"),  # cgroup v1
+    ):
+        try:
+            with open(path) as f:
+                fields = f.read().split()
+            if period_path is not None:
+                with open(period_path) as f:
+                    fields.append(f.read().strip())
+            if fields[0] == "max" or int(fields[0]) <= 0:
+                return None
+            return max(1, math.ceil(int(fields[0]) / int(fields[1])))
+        except (OSError, ValueError, IndexError):
+            continue
+    return None
+
+
+def get_worker_count(configured: int) -> int:
+    """Resolve worker count, 0 means one per usable CPU core, within the
+    cgroup CPU quota"""
+    if configured > 0:
+        return configured
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    quota = get_cpu_quota()
+    return max(1, min(cores, quota) if quota else cores)
+
+
+def bind_socket(host: str, port: int, reuse_port: bool) -> socket.socket:
+    """Bind a listening socket, optionally shared between processes"""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.set_inheritable(True)
+    return sock
+
+
+def build_config(graceful_timeout: float, loop: str, http: str) -> uvicorn.Config:
+    """Build uvicorn config for a worker
+
+    loop/http "auto" picks uvloop/httptools when they are installed.
+    """
+    return uvicorn.Config(
+        "app.main:app",
+        loop=loop,
+        http=http,
+        lifespan="on",
+        timeout_graceful_shutdown=graceful_timeout,
+        proxy_headers=True,
+    )
+
+
+class WorkerServer(uvicorn.Server):
+    """uvicorn server that fails readiness as soon as it is told to stop"""
+
+    def handle_exit(self, sig, frame) -> None:
+        from app.core.providers.health import get_health_checker
+
+        # The shutdown hooks only run once connections have drained
+        get_health_checker().draining = True
+        super().handle_exit(sig, frame)
+
+
+def run_worker(host: str, port: int, graceful_timeout: float, loop: str, http: str) -> None:
+    """Worker process entry point"""
+    sock = bind_socket(host, port, reuse_port=True)
+    server = WorkerServer(build_config(graceful_timeout, loop, http))
+    # uvicorn handles SIGTERM/SIGINT by closing the listener and draining
+    server.run(sockets=[sock])
+
+
+class Supervisor:
+    """Keep N worker processes running and drain them on shutdown"""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        workers: int,
+        graceful_timeout: float,
+        loop: str = "auto",
+        http: str = "auto"
+    ):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.loop = loop
+        self.http = http
+        self.should_exit = False
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: Dict[int, multiprocessing.Process] = {}
+        self._started_at: Dict[int, float] = {}
+        self._restart_at: Dict[int, float] = {}
+        self._backoff: Dict[int, float] = {}
+
+    def _spawn(self, slot: int) -> None:
+        process = self._context.Process(
+            target=run_worker,
+            args=(self.host, self.port, self.graceful_timeout, self.loop, self.http),
+            name=f"llm-proxy-worker-{slot}",
+            daemon=False,
+        )
+        process.start()
+        self._processes[slot] = process
+        self._started_at[slot] = time.monotonic()
+        logger.info(f"Started worker {slot} (pid {process.pid})")
+
+    def _handle_exit(self, signum, frame) -> None:
+        self.should_exit = True
+
+    def _reap(self) -> None:
+        """Restart workers that exited, backing off on crash loops"""
+        now = time.monotonic()
+        for slot, process in list(self._processes.items()):
+            if process.is_alive():
+                continue
+            uptime = now - self._started_at[slot]
+            if uptime < MIN_WORKER_UPTIME:
+                self._backoff[slot] = min(MAX_RESTART_BACKOFF, max(1.0, self._backoff.get(slot, 0.5) * 2))
+            else:
+                self._backoff[slot] = 0.0
+            logger.warning(
+                f"Worker {slot} (pid {process.pid}) exited with code {process.exitcode}, "
+                f"restarting in {self._backoff[slot]:.1f}s"
+            )
+            del self._processes[slot]
+            self._restart_at[slot] = now + self._backoff[slot]
+
+        for slot in range(self.workers):
+            if slot not in self._processes and now >= self._restart_at.get(slot, 0.0):
+                self._spawn(slot)
+
+    def _drain(self) -> None:
+        """Ask all workers to shut down gracefully, then force the stragglers"""
+        logger.info(f"Draining {len(self._processes)} worker(s)")
+        for process in self._processes.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+        # Leave uvicorn time to finish in-flight requests and run shutdown hooks
+        deadline = time.monotonic() + self.graceful_timeout + 5.0
+        for process in self._processes.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+        for process in self._processes.values():
+            if process.is_alive():
+                logger.warning(f"Killing worker pid {process.pid} after drain deadline")
+                process.kill()
+                process.join()
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._handle_exit)
+        signal.signal(signal.SIGINT, self._handle_exit)
+        logger.info(f"Starting {self.workers} worker(s) on {self.host}:{self.port}")
+        for slot in range(self.workers):
+            self._spawn(slot)
+        while not self.should_exit:
+            time.sleep(0.5)
+            if not self.should_exit:
+                self._reap()
+        self._drain()
+        logger.info("All workers stopped")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Run the LLM API gateway")
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=settings.SERVER_WORKERS,
+                        help="number of worker processes, 0 for one per CPU core")
+    parser.add_argument("--graceful-timeout", type=float, default=settings.SERVER_GRACEFUL_TIMEOUT)
+    parser.add_argument("--loop", default=settings.SERVER_LOOP)
+    parser.add_argument("--http", default=settings.SERVER_HTTP)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    workers = get_worker_count(args.workers)
+
+    if workers == 1 or not hasattr(socket, "SO_REUSEPORT"):
+        if workers > 1:
+            logger.warning("SO_REUSEPORT is not supported on this platform, running a single worker")
+        sock = bind_socket(args.host, args.port, reuse_port=False)
+        WorkerServer(build_config(args.graceful_timeout, args.loop, args.http)).run(sockets=[sock])
+        return
+
+    Supervisor(
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        graceful_timeout=args.graceful_timeout,
+        loop=args.loop,
+        http=args.http
+    ).run()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
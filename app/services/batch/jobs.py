@@ -0,0 +1,413 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from pydantic import ValidationError as PydanticValidationError
+
+from app.core.concurrency import PRIORITY_BATCH
+from app.core.config.settings import get_settings
+from app.core.context import get_tenant_id, request_id_var, tenant_var
+from app.core.exceptions import AppError, NotFoundError, ValidationError
+from app.schemas.base import BatchChatCompletionItem, BatchChatCompletionResult, BatchJob
+from app.services.chat.service import ChatService
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+# How often workers look for unfinished jobs whose owner process died
+RESCAN_INTERVAL = 30.0
+
+
+def _read_lines(f, count: int) -> List[bytes]:
+    """Read up to count lines from a binary file"""
+    lines = []
+    for _ in range(count):
+        line = f.readline()
+        if not line:
+            break
+        lines.append(line)
+    return lines
+
+
+def _append_lines(path: str, lines: List[str]) -> int:
+    """Append lines to a file and return the new file size"""
+    with open(path, "a", encoding="utf-8") as f:
+        f.writelines(lines)
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell()
+
+
+def _truncate(path: str, size: int) -> None:
+    """Truncate a file to size, creating it if missing"""
+    with open(path, "a+b") as f:
+        f.truncate(size)
+
+
+def _count_lines(path: str) -> int:
+    """Count non-empty lines of a file"""
+    with open(path, "rb") as f:
+        return sum(1 for line in f if line.strip())
+
+
+class BatchJobManager:
+    """Disk-spooled batch jobs processed by a background worker pool
+
+    Each job lives in its own directory holding the uploaded input, the
+    results written so far and a checkpoint. The checkpoint records the
+    input offset below which every line is done, the lines completed out
+    of order beyond it and the size of the results file at that moment,
+    so a restarted worker truncates the results back to the checkpoint and
+    resumes without losing or duplicating lines.
+
+    Several server processes may share the job directory; a job is only
+    processed by the process holding its lock file, and the others pick
+    it up on their next rescan if that process dies.
+    """
+
+    INPUT_FILE = "input.jsonl"
+    OUTPUT_FILE = "output.jsonl"
+    STATE_FILE = "state.json"
+    CANCEL_FILE = "cancel"
+    LOCK_FILE = "lock"
+
+    def __init__(
+        self,
+        job_dir: str,
+        workers: int = 2,
+        concurrency: int = 8,
+        checkpoint_interval: float = 5.0
+    ):
+        self.job_dir = job_dir
+        self.workers = workers
+        self.concurrency = concurrency
+        self.checkpoint_interval = checkpoint_interval
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._worker_tasks: List[asyncio.Task] = []
+        self._queued: Set[str] = set()
+
+    def _path(self, job_id: str, name: str = "") -> str:
+        return os.path.join(self.job_dir, job_id, name)
+
+    def _load_state(self, job_id: str) -> Tuple[BatchJob, Dict]:
+        with open(self._path(job_id, self.STATE_FILE), encoding="utf-8") as f:
+            state = json.load(f)
+        return BatchJob(**state["job"]), state["checkpoint"]
+
+    def _save_state(self, job: BatchJob, checkpoint: Dict) -> None:
+        """Atomically persist job status and checkpoint"""
+        job.updated_at = int(time.time())
+        path = self._path(job.id, self.STATE_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"job": job.model_dump(), "checkpoint": checkpoint}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _is_cancelled(self, job_id: str) -> bool:
+        return os.path.exists(self._path(job_id, self.CANCEL_FILE))
+
+    def _enqueue(self, job_id: str) -> None:
+        if job_id not in self._queued:
+            self._queued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    def _try_lock(self, job_id: str) -> Optional[int]:
+        """Take the job's lock file, None if another process holds it"""
+        fd = os.open(self._path(job_id, self.LOCK_FILE), os.O_CREAT | os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    def _scan(self) -> None:
+        """Queue every unfinished job found on disk"""
+        for job_id in sorted(os.listdir(self.job_dir)):
+            try:
+                job, _ = self._load_state(job_id)
+            except (OSError, ValueError, KeyError):
+                continue
+            if job.status not in TERMINAL_STATUSES:
+                self._enqueue(job_id)
+
+    async def _rescan(self) -> None:
+        while True:
+            await asyncio.sleep(RESCAN_INTERVAL)
+            await asyncio.to_thread(self._scan)
+
+    async def start(self) -> None:
+        """Resume unfinished jobs and start the worker pool"""
+        os.makedirs(self.job_dir, exist_ok=True)
+        await asyncio.to_thread(self._scan)
+        if self._queued:
+            logger.info(f"Found {len(self._queued)} unfinished batch job(s)")
+
+        for _ in range(self.workers):
+            self._worker_tasks.append(asyncio.create_task(self._worker()))
+        self._worker_tasks.append(asyncio.create_task(self._rescan()))
+
+    async def stop(self) -> None:
+        """Stop workers, checkpointing jobs in progress"""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks.clear()
+
+    async def create_job(self, chunks: AsyncIterator[bytes]) -> BatchJob:
+        """Spool an uploaded JSONL body to disk and queue it"""
+        job_id = f"batch_{uuid.uuid4().hex}"
+        os.makedirs(self._path(job_id))
+        input_path = self._path(job_id, self.INPUT_FILE)
+
+        with open(input_path, "wb") as f:
+            async for chunk in chunks:
+                if chunk:
+                    await asyncio.to_thread(f.write, chunk)
+
+        total = await asyncio.to_thread(_count_lines, input_path)
+        if total == 0:
+            await asyncio.to_thread(shutil.rmtree, self._path(job_id), True)
+            raise ValidationError("Batch job input is empty")
+
+        now = int(time.time())
+        job = BatchJob(id=job_id, created_at=now, updated_at=now, total=total, tenant=get_tenant_id())
+        checkpoint = {"offset": 0, "next_index": 0, "done_ahead": [], "output_size": 0}
+        await asyncio.to_thread(self._save_state, job, checkpoint)
+        self._enqueue(job_id)
+        logger.info(f"Created batch job {job_id} with {total} requests")
+        return job
+
+    async def get_job(self, job_id: str) -> BatchJob:
+        """Get job status"""
+        if os.path.basename(job_id) != job_id or not job_id.startswith("batch_"):
+            raise NotFoundError(f"Batch job not found: {job_id}")
+        try:
+            job, _ = await asyncio.to_thread(self._load_state, job_id)
+        except FileNotFoundError:
+            raise NotFoundError(f"Batch job not found: {job_id}")
+        return job
+
+    async def get_results(self, job_id: str) -> Tuple[str, int]:
+        """Get path of the results file of a job and its size at the last
+        checkpoint, past which a running job may still be writing"""
+        if os.path.basename(job_id) != job_id or not job_id.startswith("batch_"):
+            raise NotFoundError(f"Batch job not found: {job_id}")
+        try:
+            _, checkpoint = await asyncio.to_thread(self._load_state, job_id)
+        except FileNotFoundError:
+            raise NotFoundError(f"Batch job not found: {job_id}")
+        return self._path(job_id, self.OUTPUT_FILE), checkpoint["output_size"]
+
+    async def cancel_job(self, job_id: str) -> BatchJob:
+        """Request cancellation of a job; lines already done are kept"""
+        job = await self.get_job(job_id)
+        if job.status not in TERMINAL_STATUSES:
+            # Picked up by whichever worker owns the job at its next checkpoint
+            with open(self._path(job_id, self.CANCEL_FILE), "w"):
+                pass
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            lock_fd = None
+            try:
+                lock_fd = self._try_lock(job_id)
+                if lock_fd is None:
+                    # Owned by another server process
+                    continue
+                await self._process_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"Batch job {job_id} crashed")
+            finally:
+                if lock_fd is not None:
+                    os.close(lock_fd)
+                self._queued.discard(job_id)
+                self._queue.task_done()
+
+    @staticmethod
+    async def _run_line(job_id: str, index: int, line: bytes) -> BatchChatCompletionResult:
+        """Run one input line"""
+        try:
+            item = BatchChatCompletionItem.model_validate_json(line)
+        except PydanticValidationError as e:
+            return BatchChatCompletionResult(
+                custom_id=f"line-{index}",
+                status_code=400,
+                error={"message": f"Invalid request line: {e.errors()[0]['msg']}"}
+            )
+
+        item.request.stream = False
+        request_id_var.set(f"{job_id}:{item.custom_id}")
+        try:
+            response = await ChatService.chat_completion(item.request, priority=PRIORITY_BATCH)
+            return BatchChatCompletionResult(
+                custom_id=item.custom_id,
+                status_code=200,
+                response=response
+            )
+        except AppError as e:
+            return BatchChatCompletionResult(
+                custom_id=item.custom_id,
+                status_code=e.status_code,
+                error={"message": e.message}
+            )
+        except HTTPException as e:
+            return BatchChatCompletionResult(
+                custom_id=item.custom_id,
+                status_code=e.status_code,
+                error={"message": str(e.detail)}
+            )
+        except Exception as e:
+            return BatchChatCompletionResult(
+                custom_id=item.custom_id,
+                status_code=500,
+                error={"message": f"Internal server error: {str(e)}"}
+            )
+
+    async def _process_job(self, job_id: str) -> None:
+        job, checkpoint = await asyncio.to_thread(self._load_state, job_id)
+        if job.status in TERMINAL_STATUSES:
+            return
+        logger.info(f"Processing batch job {job_id} ({job.completed + job.failed}/{job.total})")
+        if self._is_cancelled(job_id):
+            job.status = "cancelled"
+            await asyncio.to_thread(self._save_state, job, checkpoint)
+            return
+
+        input_path = self._path(job_id, self.INPUT_FILE)
+        output_path = self._path(job_id, self.OUTPUT_FILE)
+        # Drop results written after the last checkpoint, they will be redone
+        await asyncio.to_thread(_truncate, output_path, checkpoint["output_size"])
+
+        job.status = "running"
+        await asyncio.to_thread(self._save_state, job, checkpoint)
+        # Inherited by the line tasks, so usage is accounted to the job owner
+        tenant_var.set(job.tenant)
+
+        watermark_index = checkpoint["next_index"]
+        watermark_offset = checkpoint["offset"]
+        already_done: Set[int] = set(checkpoint["done_ahead"])
+        completed: Set[int] = set(already_done)
+        line_ends: Dict[int, int] = {}
+        in_flight: Dict[asyncio.Task, int] = {}
+        results: List[str] = []
+        last_checkpoint = time.monotonic()
+
+        async def save_checkpoint() -> None:
+            nonlocal last_checkpoint
+            output_size = checkpoint["output_size"]
+            if results:
+                output_size = await asyncio.to_thread(_append_lines, output_path, list(results))
+                results.clear()
+            checkpoint.update(
+                offset=watermark_offset,
+                next_index=watermark_index,
+                done_ahead=sorted(i for i in completed if i >= watermark_index),
+                output_size=output_size
+            )
+            await asyncio.to_thread(self._save_state, job, checkpoint)
+            last_checkpoint = time.monotonic()
+
+        reader = open(input_path, "rb")
+        read_offset = watermark_offset
+        read_index = watermark_index
+        reader.seek(read_offset)
+        eof = False
+        try:
+            while True:
+                # Keep the window of in-flight lines full
+                while not eof and len(in_flight) < self.concurrency:
+                    lines = await asyncio.to_thread(_read_lines, reader, self.concurrency)
+                    if not lines:
+                        eof = True
+                        break
+                    for line in lines:
+                        index = read_index
+                        read_index += 1
+                        read_offset += len(line)
+                        line_ends[index] = read_offset
+                        if index in already_done or not line.strip():
+                            completed.add(index)
+                            continue
+                        task = asyncio.create_task(self._run_line(job_id, index, line))
+                        in_flight[task] = index
+
+                if in_flight:
+                    done, _ = await asyncio.wait(
+                        in_flight,
+                        timeout=self.checkpoint_interval,
+                        return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        index = in_flight.pop(task)
+                        result = task.result()
+                        results.append(result.model_dump_json(exclude_none=True) + "\n")
+                        if result.status_code == 200:
+                            job.completed += 1
+                        else:
+                            job.failed += 1
+                        completed.add(index)
+
+                # Advance the watermark over the contiguous completed prefix
+                while watermark_index in completed:
+                    completed.discard(watermark_index)
+                    watermark_offset = line_ends.pop(watermark_index)
+                    watermark_index += 1
+
+                if eof and not in_flight:
+                    job.status = "completed"
+                    break
+                if time.monotonic() - last_checkpoint >= self.checkpoint_interval:
+                    if self._is_cancelled(job_id):
+                        job.status = "cancelled"
+                        break
+                    await save_checkpoint()
+        except asyncio.CancelledError:
+            # Shutting down: keep the job resumable
+            logger.info(f"Batch job {job_id} interrupted, checkpointing")
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            raise
+        finally:
+            for task in in_flight:
+                task.cancel()
+            reader.close()
+            await asyncio.shield(save_checkpoint())
+
+        logger.info(
+            f"Batch job {job_id} {job.status}: "
+            f"{job.completed} completed, {job.failed} failed"
+        )
+
+
+# Global manager instance
+_batch_job_manager: Optional[BatchJobManager] = None
+
+def get_batch_job_manager() -> BatchJobManager:
+    """Get the process wide batch job manager"""
+    global _batch_job_manager
+    if _batch_job_manager is None:
+        settings = get_settings()
+        _batch_job_manager = BatchJobManager(
+            job_dir=settings.BATCH_JOB_DIR,
+            workers=settings.BATCH_JOB_WORKERS,
+            concurrency=settings.BATCH_JOB_CONCURRENCY,
+            checkpoint_interval=settings.BATCH_JOB_CHECKPOINT_INTERVAL
+        )
+    return _batch_job_manager
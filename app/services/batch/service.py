@@ -0,0 +1,86 @@
+import asyncio
+import logging
+from typing import AsyncGenerator, Optional
+
+from fastapi import HTTPException
+
+from app.core.concurrency import PRIORITY_BATCH
+from app.core.config.settings import get_settings
+from app.core.exceptions import AppError
+from app.schemas.base import (
+    BatchChatCompletionItem,
+    BatchChatCompletionRequest,
+    BatchChatCompletionResult
+)
+from app.services.chat.service import ChatService
+
+logger = logging.getLogger(__name__)
+
+
+class BatchService:
+    """Service for handling batch chat completions"""
+
+    @staticmethod
+    async def _run_item(
+        item: BatchChatCompletionItem,
+        semaphore: asyncio.Semaphore
+    ) -> BatchChatCompletionResult:
+        """Run a single batch item under the batch concurrency cap"""
+        async with semaphore:
+            try:
+                # Yields upstream capacity to interactive requests
+                response = await ChatService.chat_completion(item.request, priority=PRIORITY_BATCH)
+                return BatchChatCompletionResult(
+                    custom_id=item.custom_id,
+                    status_code=200,
+                    response=response
+                )
+            except AppError as e:
+                return BatchChatCompletionResult(
+                    custom_id=item.custom_id,
+                    status_code=e.status_code,
+                    error={"message": e.message}
+                )
+            except HTTPException as e:
+                return BatchChatCompletionResult(
+                    custom_id=item.custom_id,
+                    status_code=e.status_code,
+                    error={"message": str(e.detail)}
+                )
+            except Exception as e:
+                logger.exception(f"Batch item {item.custom_id} failed")
+                return BatchChatCompletionResult(
+                    custom_id=item.custom_id,
+                    status_code=500,
+                    error={"message": f"Internal server error: {str(e)}"}
+                )
+
+    @staticmethod
+    def get_concurrency(requested: Optional[int]) -> int:
+        """Resolve the effective concurrency for a batch"""
+        limit = get_settings().BATCH_MAX_CONCURRENCY
+        if requested is None:
+            return limit
+        return min(requested, limit)
+
+    @staticmethod
+    async def chat_completion_batch(
+        batch: BatchChatCompletionRequest
+    ) -> AsyncGenerator[str, None]:
+        """Run batch items concurrently and yield NDJSON lines in completion order"""
+        semaphore = asyncio.Semaphore(BatchService.get_concurrency(batch.max_concurrency))
+        tasks = []
+        for item in batch.requests:
+            # Batch items are always answered as whole responses
+            item.request.stream = False
+            tasks.append(asyncio.create_task(BatchService._run_item(item, semaphore)))
+
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                result = await next_result
+                yield result.model_dump_json(exclude_none=True) + "\n"
+        finally:
+            # Client went away or the generator was closed early
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
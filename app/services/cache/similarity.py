@@ -0,0 +1,306 @@
+import fnmatch
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+from app.core.config.settings import get_settings
+from app.schemas.base import ChatCompletionRequest, ChatCompletionResponse, Message
+
+logger = logging.getLogger(__name__)
+
+# One permutation MinHash: every shingle hash lands in one of NUM_BINS bins
+# and each bin keeps its minimum, so a signature costs one pass over the
+# shingles rather than one per permutation
+NUM_BINS = 64
+# LSH banding, 16 bands of 4 bins: pairs above ~0.5 similarity almost
+# always share a band, the threshold then decides on the estimate
+BANDS = 16
+ROWS = NUM_BINS // BANDS
+SHINGLE_SIZE = 3
+
+_EMPTY = 1 << 64
+_BIN_VALUE_BITS = 58
+# Approximate memory of a memoized message: its bins, digest and dict slot
+_MESSAGE_BINS_SIZE = NUM_BINS * 40 + 200
+
+# Values that change between otherwise identical prompts
+_VOLATILE_RE = [
+    (re.compile(r"\d{4}-\d{2}-\d{2}(?:[t ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:z|[+-]\d{2}:?\d{2})?)?"), " <date> "),
+    (re.compile(r"\b\d{1,2}:\d{2}(?::\d{2})?\b"), " <time> "),
+    (re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b"), " <id> "),
+]
+_TOKEN_RE = re.compile(r"<\w+>|\w+|[^\w\s]")
+
+CachedResponse = Union[ChatCompletionResponse, bytes]
+
+
+def normalize_text(text: str, mask_volatile: bool = True) -> str:
+    """Lowercase, collapse whitespace and optionally mask dates, times and ids"""
+    text = " ".join(text.lower().split())
+    if mask_volatile:
+        for pattern, placeholder in _VOLATILE_RE:
+            text = pattern.sub(placeholder, text)
+        text = " ".join(text.split())
+    return text
+
+
+def _message_bins(message: Message) -> List[int]:
+    """Per bin minimum shingle hash of one message, before densification"""
+    tokens = _TOKEN_RE.findall(normalize_text(message.content))
+    shingles = [
+        " ".join(tokens[i:i + SHINGLE_SIZE])
+        for i in range(max(1, len(tokens) - SHINGLE_SIZE + 1))
+    ]
+    bins = [_EMPTY] * NUM_BINS
+    for shingle in shingles:
+        # The index lives in this process only, so the salted builtin hash will do
+        h = hash((message.role, shingle)) & 0xFFFFFFFFFFFFFFFF
+        index = h % NUM_BINS
+        value = h >> 6
+        if value < bins[index]:
+            bins[index] = value
+    return bins
+
+
+def _densify(bins: List[int]) -> Tuple[int, ...]:
+    """Fill empty bins from the next non-empty one, offset by the distance"""
+    if all(value == _EMPTY for value in bins):
+        return tuple(bins)
+    signature = []
+    for i, value in enumerate(bins):
+        distance = 0
+        while value == _EMPTY:
+            distance += 1
+            value = bins[(i + distance) % NUM_BINS]
+        signature.append(value + (distance << _BIN_VALUE_BITS))
+    return tuple(signature)
+
+
+def estimate_similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures"""
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_BINS
+
+
+@dataclass
+class _Entry:
+    scope: bytes
+    signature: Tuple[int, ...]
+    response: CachedResponse
+    size: int
+    expires_at: float
+
+
+class SimilarityCache:
+    """Near-duplicate cache for deterministic chat completions
+
+    A request's messages are shingled into word 3-grams and summarized as a
+    MinHash signature, which an LSH index matches against earlier
+    requests. Shingles are a set, so whitespace, case, timestamps and the
+    order of few-shot examples do not matter. To keep the answer right, a
+    hit also needs the same model, the same parameters and the same final
+    message (up to whitespace and case); only the context before it is
+    compared approximately. Entries are evicted least recently used once
+    max_entries or max_bytes is exceeded, and expire after ttl seconds.
+    The per message bins memoized for signatures count against max_bytes
+    too and are evicted first.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 3600.0,
+        threshold: float = 0.9,
+        model_thresholds: Optional[Dict[str, float]] = None
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.threshold = threshold
+        self.model_thresholds = model_thresholds or {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[bytes, int, Tuple[int, ...]], Set[int]] = {}
+        self._next_id = 0
+        # System prompts and few-shot examples repeat, their bins are memoized
+        self._message_cache: "OrderedDict[bytes, List[int]]" = OrderedDict()
+        self._message_cache_size = max_entries
+        self.message_bytes = 0
+
+    def get_threshold(self, model: str) -> float:
+        """Similarity threshold for model from model_thresholds (exact name or glob)"""
+        if model in self.model_thresholds:
+            return self.model_thresholds[model]
+        for pattern, threshold in self.model_thresholds.items():
+            if fnmatch.fnmatchcase(model, pattern):
+                return threshold
+        return self.threshold
+
+    @staticmethod
+    def is_cacheable(request: ChatCompletionRequest) -> bool:
+        """Only non-streaming requests at temperature 0 are answered from cache"""
+        return not request.stream and request.temperature == 0 and bool(request.messages)
+
+    def _bins(self, message: Message) -> List[int]:
+        # A digest, so long prompts are not kept alive as keys
+        key = hashlib.blake2b(
+            message.role.encode("utf-8") + b"\0" + message.content.encode("utf-8"),
+            digest_size=16
+        ).digest()
+        bins = self._message_cache.get(key)
+        if bins is not None:
+            self._message_cache.move_to_end(key)
+            return bins
+        bins = _message_bins(message)
+        self._message_cache[key] = bins
+        self.message_bytes += _MESSAGE_BINS_SIZE
+        while self._message_cache and (
+            len(self._message_cache) > self._message_cache_size
+            or self.bytes + self.message_bytes > self.max_bytes
+        ):
+            self._message_cache.popitem(last=False)
+            self.message_bytes -= _MESSAGE_BINS_SIZE
+        return bins
+
+    def signature(self, messages: List[Message]) -> Tuple[int, ...]:
+        """MinHash signature of a conversation
+
+        The signature of a union of shingle sets is the per bin minimum of
+        the parts, so messages are summarized independently and combined.
+        """
+        combined = list(self._bins(messages[0]))
+        for message in messages[1:]:
+            for i, value in enumerate(self._bins(message)):
+                if value < combined[i]:
+                    combined[i] = value
+        return _densify(combined)
+
+    @staticmethod
+    def scope(request: ChatCompletionRequest, raw_body: Optional[bytes] = None) -> bytes:
+        """Hash of everything that must match exactly for a hit
+
+        With raw_body the parameters are read from the body, which may hold
+        fields (tools, response_format, ...) the request model drops.
+        """
+        if raw_body is not None:
+            params = json.loads(raw_body)
+            params.pop("messages", None)
+            params.pop("model", None)
+        else:
+            params = request.model_dump(exclude={"messages", "model"}, exclude_none=True)
+        last = request.messages[-1]
+        key = json.dumps(
+            [request.model, raw_body is not None, params, last.role, normalize_text(last.content, False)],
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+    def _bands(self, scope: bytes, signature: Tuple[int, ...]):
+        for band in range(BANDS):
+            yield (scope, band, signature[band * ROWS:(band + 1) * ROWS])
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        self.bytes -= entry.size
+        for key in self._bands(entry.scope, entry.signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def lookup(
+        self,
+        request: ChatCompletionRequest,
+        raw_body: Optional[bytes] = None
+    ) -> Tuple[Optional[CachedResponse], bytes, Tuple[int, ...]]:
+        """Find a cached response for a near-duplicate of request
+
+        Returns the response (None on a miss) with the request's scope and
+        signature, to be passed to store() after a miss.
+        """
+        scope = self.scope(request, raw_body)
+        signature = self.signature(request.messages)
+        threshold = self.get_threshold(request.model)
+        now = time.monotonic()
+
+        candidates: Set[int] = set()
+        for key in self._bands(scope, signature):
+            candidates.update(self._buckets.get(key, ()))
+        best_id, best_similarity = None, 0.0
+        for entry_id in candidates:
+            entry = self._entries[entry_id]
+            if entry.expires_at <= now:
+                self._remove(entry_id)
+                continue
+            similarity = estimate_similarity(signature, entry.signature)
+            if similarity > best_similarity:
+                best_id, best_similarity = entry_id, similarity
+
+        if best_id is None or best_similarity < threshold:
+            self.misses += 1
+            return None, scope, signature
+        self.hits += 1
+        self._entries.move_to_end(best_id)
+        logger.debug(f"Similarity cache hit for {request.model} at {best_similarity:.2f}")
+        return self._entries[best_id].response, scope, signature
+
+    def store(self, scope: bytes, signature: Tuple[int, ...], response: CachedResponse) -> None:
+        """Cache the response of a request looked up before"""
+        if isinstance(response, bytes):
+            size = len(response)
+        else:
+            size = sum(len(choice.message.content) for choice in response.choices) + 256
+        if size > self.max_bytes:
+            return
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = _Entry(scope, signature, response, size, time.monotonic() + self.ttl)
+        self.bytes += size
+        for key in self._bands(scope, signature):
+            self._buckets.setdefault(key, set()).add(entry_id)
+        while self._message_cache and self.bytes + self.message_bytes > self.max_bytes:
+            self._message_cache.popitem(last=False)
+            self.message_bytes -= _MESSAGE_BINS_SIZE
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "message_bytes": self.message_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+        }
+
+
+# Global similarity cache instance
+_similarity_cache: Optional[SimilarityCache] = None
+
+def get_similarity_cache() -> SimilarityCache:
+    """Get the process wide similarity cache"""
+    global _similarity_cache
+    if _similarity_cache is None:
+        settings = get_settings()
+        _similarity_cache = SimilarityCache(
+            max_entries=settings.SIMILARITY_CACHE_MAX_ENTRIES,
+            max_bytes=settings.SIMILARITY_CACHE_MAX_BYTES,
+            ttl=settings.SIMILARITY_CACHE_TTL,
+            threshold=settings.SIMILARITY_CACHE_THRESHOLD,
+            model_thresholds=settings.SIMILARITY_CACHE_MODEL_THRESHOLDS
+        )
+    return _similarity_cache
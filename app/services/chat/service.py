@@ -1,21 +1,340 @@
-from typing import AsyncGenerator, Union
+import json
+import logging
+import math
+import time
+from contextlib import aclosing, contextmanager
+from typing import Any, AsyncGenerator, Dict, Iterator, Optional, Union
 
+from app.core.concurrency import PRIORITY_ONLINE, get_upstream_limiter
+from app.core.config.settings import get_settings
+from app.core.context import check_deadline
+from app.core.exceptions import StreamInterruptedError, UpstreamTimeoutError
 from app.core.providers.base import LLMProviderFactory
+from app.core.providers.base_openai import extract_usage, patch_json_body
+from app.core.providers.health import get_health_checker, is_upstream_failure
+from app.core.providers.latency import get_latency_tracker
+from app.core.providers.routing import RouteTarget, get_routing_table
+from app.core.streaming import relay_stream
+from app.core.tracing import start_span
 from app.schemas.base import (
     ChatCompletionRequest,
     ChatCompletionResponse,
-    ChatCompletionStreamResponse
+    ChatCompletionStreamResponse,
+    Message,
+    UsageInfo
 )
+from app.services.cache.similarity import get_similarity_cache
+from app.services.usage.recorder import get_usage_recorder
+from app.utils.tokens import check_context_window, get_token_estimator
+
+logger = logging.getLogger(__name__)
+
+# Sent after the partial answer to upstreams that answer a trailing
+# assistant message instead of continuing it
+CONTINUE_PROMPT = (
+    "Your previous reply was cut off. Continue it exactly where it stopped, "
+    "without repeating any of it or commenting on the interruption."
+)
+
+
+def continuation_request(
+    request: ChatCompletionRequest,
+    model: str,
+    partial: str,
+    prefill: bool
+) -> ChatCompletionRequest:
+    """The request that resumes a completion after partial, on model
+
+    request is always the client's original one and partial everything
+    sent so far, so repeated failovers do not stack continuations.
+    """
+    update: Dict[str, Any] = {"model": model}
+    # Trailing whitespace in a prefill is rejected by some upstreams and
+    # skews the next token for others, the splice restores the spacing
+    partial = partial.rstrip()
+    if partial:
+        messages = [*request.messages, Message(role="assistant", content=partial)]
+        if not prefill:
+            messages.append(Message(role="user", content=CONTINUE_PROMPT))
+        update["messages"] = messages
+        if request.max_tokens:
+            update["max_tokens"] = max(1, request.max_tokens - math.ceil(len(partial) / 4))
+    continued = request.model_copy(update=update)
+    # The copy would keep the original's memoized prompt token count
+    continued._prompt_tokens = None
+    return continued
+
+
+class _StreamSplice:
+    """Rewrites a resumed stream's chunks to continue the client's stream
+
+    Chunks keep the id, created and model the client saw first, the
+    repeated assistant role and empty openings are dropped, and leading
+    whitespace the resumed text starts with is dropped when the text
+    before the break already ended in whitespace. The failover marker is
+    attached to the usage chunk, or sent in a chunk of its own before
+    [DONE] when there is none.
+    """
+
+    def __init__(self, header: Optional[Dict[str, Any]], strip_leading: bool, marker: Dict[str, Any]):
+        self.header = header
+        self.strip_leading = strip_leading
+        self.marker = marker
+        self.marked = False
+        self.stripped = False
+
+    def received(self, text: str) -> str:
+        """The part of the text this splice's upstream streamed that the client got"""
+        return text.lstrip() if self.stripped else text
+
+    def rewrite(self, chunk: str) -> Optional[str]:
+        data = json.loads(chunk[len("data: "):])
+        if self.header is None:
+            self.header = {key: data.get(key) for key in ("id", "created", "model")}
+        data.update(self.header)
+        keep = bool(data.get("usage"))
+        for choice in data.get("choices", []):
+            delta = choice.get("delta") or {}
+            delta.pop("role", None)
+            content = delta.get("content")
+            if content and self.strip_leading:
+                content = content.lstrip()
+                delta["content"] = content
+                if content:
+                    self.strip_leading = False
+                    self.stripped = True
+            if content or choice.get("finish_reason") is not None:
+                keep = True
+        if not keep:
+            return None
+        if data.get("usage") and not data.get("choices"):
+            data["failover"] = self.marker
+            self.marked = True
+        return f"data: {json.dumps(data)}\n\n"
+
+    def marker_chunk(self) -> str:
+        self.marked = True
+        return f"data: {json.dumps({**(self.header or {}), 'choices': [], 'failover': self.marker})}\n\n"
 
 
 class ChatService:
     """Service for handling chat completions"""
 
     @staticmethod
-    async def chat_completion(request: ChatCompletionRequest) -> Union[ChatCompletionResponse, AsyncGenerator[ChatCompletionStreamResponse, None]]:
-        """Handle chat completion request"""
-        provider = LLMProviderFactory.create(request.model)
-        async with provider:
-            if request.stream:
-                return provider.chat_completion_stream(request)
-            return await provider.chat_completion(request) 
\ No newline at end of file
+    async def chat_completion(
+        request: ChatCompletionRequest,
+        priority: int = PRIORITY_ONLINE,
+        raw_body: Optional[bytes] = None
+    ) -> Union[ChatCompletionResponse, AsyncGenerator[ChatCompletionStreamResponse, None], bytes]:
+        """Handle chat completion request
+
+        When the original request body is passed as raw_body, non-streaming
+        requests are forwarded as those bytes and the upstream's response
+        body is returned unchanged, instead of a ChatCompletionResponse.
+        With SIMILARITY_CACHE_ENABLED, deterministic requests may be
+        answered from the cached response of a near-duplicate.
+        """
+        check_deadline()
+        with start_span("gateway.route", model=request.model) as span:
+            target = get_routing_table().resolve(request.model)
+            requested_model = request.model
+            if target.model != request.model:
+                request = request.model_copy(update={"model": target.model})
+            messages = request.messages
+            # Reject (or trim) oversized requests before any upstream call
+            prompt_tokens = check_context_window(request)
+            provider = LLMProviderFactory.create(target.deployment)
+            if span is not None:
+                span.set_attribute("deployment", target.deployment.name)
+                span.set_attribute("upstream_model", target.model)
+                span.set_attribute("prompt_tokens_estimate", prompt_tokens)
+        if request.stream:
+            settings = get_settings()
+            return relay_stream(
+                ChatService._stream_with_slot(provider, request, priority, target, requested_model),
+                buffer_size=settings.STREAM_BUFFER_SIZE,
+                coalesce_window=settings.STREAM_COALESCE_WINDOW_MS / 1000,
+                coalesce_max_bytes=settings.STREAM_COALESCE_MAX_BYTES
+            )
+        forward_raw = (
+            raw_body is not None
+            and provider.supports_raw_forwarding
+            and request.messages is messages  # not trimmed
+        )
+        cache = None
+        if get_settings().SIMILARITY_CACHE_ENABLED and get_similarity_cache().is_cacheable(request):
+            cache = get_similarity_cache()
+            with start_span("cache.lookup") as span:
+                cached, scope, signature = cache.lookup(request, raw_body if forward_raw else None)
+                if span is not None:
+                    span.set_attribute("hit", cached is not None)
+            if cached is not None:
+                return cached
+
+        if forward_raw:
+            if request.model != requested_model:
+                raw_body = patch_json_body(raw_body, {"model": request.model})
+            async with get_upstream_limiter().slot(priority):
+                async with provider:
+                    with get_health_checker().track(target.deployment.name):
+                        with ChatService._record_latency(target.deployment.name, request.model):
+                            body = await provider.chat_completion_raw(raw_body)
+            usage = extract_usage(body)
+            if usage is not None:
+                ChatService._record_usage(request, target.deployment.name, usage)
+            if cache is not None:
+                cache.store(scope, signature, body)
+            return body
+
+        async with get_upstream_limiter().slot(priority):
+            async with provider:
+                with get_health_checker().track(target.deployment.name):
+                    with ChatService._record_latency(target.deployment.name, request.model):
+                        response = await provider.chat_completion(request)
+        ChatService._record_usage(request, target.deployment.name, response.usage)
+        if cache is not None:
+            cache.store(scope, signature, response)
+        return response
+
+    @staticmethod
+    async def _stream_with_slot(
+        provider,
+        request: ChatCompletionRequest,
+        priority: int,
+        target: RouteTarget,
+        requested_model: str
+    ) -> AsyncGenerator[str, None]:
+        """Hold an upstream slot for as long as the stream is being consumed
+
+        With STREAM_FAILOVER_ENABLED, a stream the upstream breaks off
+        (connection lost, stalled, ended before the message finished) is
+        resumed on another deployment of the route: the text sent so far is
+        passed along as the start of the assistant's answer, and the new
+        stream is spliced into the client's so it reads as one. Each
+        attempt's time to first chunk and throughput feed the latency
+        statistics SLO routes pick by.
+        """
+        settings = get_settings()
+        failovers = settings.STREAM_FAILOVER_MAX_ATTEMPTS if settings.STREAM_FAILOVER_ENABLED else 0
+        deployment = target.deployment.name
+        tried = [deployment]
+        splice: Optional[_StreamSplice] = None
+        header: Optional[Dict[str, Any]] = None  # id, created and model of the first chunk
+        emitted = ""  # completion text the client has received
+        original = request  # every continuation is built from this
+
+        def next_target() -> Optional[RouteTarget]:
+            if len(tried) > failovers:
+                return None
+            return get_routing_table().resolve_fallback(requested_model, tried)
+
+        async with get_upstream_limiter().slot(priority):
+            while True:
+                fallback = None
+                started = time.perf_counter()
+                first_chunk_at = None
+                try:
+                    async with provider:
+                        with get_health_checker().track(deployment):
+                            async with aclosing(provider.chat_completion_stream(request)) as stream:
+                                async for chunk in stream:
+                                    if first_chunk_at is None:
+                                        first_chunk_at = time.perf_counter()
+                                        get_latency_tracker().record_ttfb(
+                                            deployment, request.model, first_chunk_at - started
+                                        )
+                                    if chunk.startswith("data: [DONE]"):
+                                        if not provider.stream_finished and failovers and next_target():
+                                            raise StreamInterruptedError(deployment)
+                                        if splice is not None and not splice.marked:
+                                            yield splice.marker_chunk()
+                                    elif splice is not None:
+                                        chunk = splice.rewrite(chunk)
+                                        if chunk is None:
+                                            continue
+                                    elif header is None and failovers:
+                                        data = json.loads(chunk[len("data: "):])
+                                        header = {key: data.get(key) for key in ("id", "created", "model")}
+                                    yield chunk
+                    ChatService._record_throughput(provider, deployment, request.model, first_chunk_at)
+                    return
+                except Exception as e:
+                    if first_chunk_at is None and isinstance(e, UpstreamTimeoutError):
+                        # Too slow to answer at all, counts as at least the time waited
+                        get_latency_tracker().record_ttfb(deployment, request.model, time.perf_counter() - started)
+                    if not is_upstream_failure(e):
+                        raise
+                    fallback = next_target()
+                    if fallback is None:
+                        raise
+                    logger.warning(
+                        f"Stream from {deployment} broke off after {provider.stream_completion_chars} chars "
+                        f"({e!r}), resuming on {fallback.deployment.name}"
+                    )
+                finally:
+                    ChatService._record_stream_usage(provider, request, deployment)
+
+                text = provider.stream_completion_text
+                emitted += splice.received(text) if splice is not None else text
+                deployment = fallback.deployment.name
+                tried.append(deployment)
+                splice = _StreamSplice(
+                    header=splice.header if splice is not None else header,
+                    strip_leading=emitted != emitted.rstrip(),
+                    marker={
+                        "attempts": len(tried),
+                        "deployments": list(tried),
+                        "resumed_after_chars": len(emitted),
+                    }
+                )
+                provider_cls = LLMProviderFactory.get_class(fallback.deployment.provider)
+                request = continuation_request(original, fallback.model, emitted, provider_cls.supports_prefill)
+                provider = LLMProviderFactory.create(fallback.deployment)
+
+    @staticmethod
+    @contextmanager
+    def _record_latency(deployment: str, model: str) -> Iterator[None]:
+        """Time a non-streaming upstream call as a time to first token
+        sample, its answer arriving all at once; SLO routes serving no
+        streams would otherwise never get statistics"""
+        started = time.perf_counter()
+        try:
+            yield
+        except UpstreamTimeoutError:
+            # Too slow to answer at all, counts as at least the time waited
+            get_latency_tracker().record_ttfb(deployment, model, time.perf_counter() - started)
+            raise
+        get_latency_tracker().record_ttfb(deployment, model, time.perf_counter() - started)
+
+    @staticmethod
+    def _record_throughput(provider, deployment: str, model: str, first_chunk_at: Optional[float]) -> None:
+        """Completion tokens per second after the first chunk of a finished stream"""
+        if first_chunk_at is None:
+            return
+        elapsed = time.perf_counter() - first_chunk_at
+        usage = provider.stream_usage
+        tokens = usage.completion_tokens if usage is not None else math.ceil(provider.stream_completion_chars / 4)
+        if tokens > 1 and elapsed > 0:
+            get_latency_tracker().record_throughput(deployment, model, tokens / elapsed)
+
+    @staticmethod
+    def _record_stream_usage(provider, request: ChatCompletionRequest, deployment: str) -> None:
+        usage = provider.stream_usage
+        if usage is None and provider.stream_completion_chars:
+            # Stream ended before the upstream's usage report, estimate
+            usage = UsageInfo(
+                prompt_tokens=get_token_estimator().estimate_request(request),
+                completion_tokens=math.ceil(provider.stream_completion_chars / 4)
+            )
+        if usage is not None:
+            ChatService._record_usage(request, deployment, usage)
+
+    @staticmethod
+    def _record_usage(request: ChatCompletionRequest, deployment: str, usage: UsageInfo) -> None:
+        if get_settings().USAGE_ENABLED:
+            get_usage_recorder().record(
+                model=request.model,
+                provider=deployment,
+                prompt_tokens=usage.prompt_tokens,
+                completion_tokens=usage.completion_tokens
+            )
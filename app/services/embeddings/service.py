@@ -0,0 +1,333 @@
+import asyncio
+import base64
+import hashlib
+import logging
+import sys
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.core.concurrency import PRIORITY_ONLINE, get_upstream_limiter
+from app.core.config.settings import get_settings
+from app.core.context import deadline_var, get_deadline
+from app.core.exceptions import DeadlineExceededError, ProviderAPIError, ValidationError
+from app.core.providers.base import LLMProviderFactory
+from app.core.providers.health import get_health_checker
+from app.core.providers.routing import Deployment, get_routing_table
+from app.schemas.base import EmbeddingData, EmbeddingRequest, EmbeddingResponse, EmbeddingUsage
+from app.services.usage.recorder import get_usage_recorder
+from app.utils.tokens import get_token_estimator
+
+logger = logging.getLogger(__name__)
+
+# (deployment, upstream model, dimensions)
+_BatchKey = Tuple[str, str, Optional[int]]
+# Batch key and input content hash
+_ItemKey = Tuple[_BatchKey, bytes]
+# Vector and the prompt tokens it took
+_Embedding = Tuple[array, int]
+
+
+# Upstream statuses that may blame one input of a batch
+_INPUT_STATUSES = (400, 413, 422)
+# Halvings of a rejected batch, enough to isolate an input among 64
+MAX_SPLIT_DEPTH = 6
+
+
+def _rejects_input(error: BaseException) -> bool:
+    """Whether the upstream refused a request for what it held, so that a
+    smaller batch may succeed, rather than for the key, quota or load"""
+    return isinstance(error, ProviderAPIError) and error.upstream_status in _INPUT_STATUSES
+
+
+def _same_rejection(a: BaseException, b: BaseException) -> bool:
+    return (
+        isinstance(a, ProviderAPIError) and isinstance(b, ProviderAPIError)
+        and a.upstream_status == b.upstream_status and a.detail == b.detail
+    )
+
+
+class EmbeddingBatcher:
+    """Micro-batches concurrent embedding inputs into few upstream calls
+
+    Inputs for the same deployment, model and dimensions are queued, and
+    the queue is sent upstream as one request once it holds max_batch_size
+    inputs or window seconds after its first input arrived, whichever
+    comes first. Vectors are cached per input content hash, and an input
+    already on its way upstream is shared rather than sent twice. When the
+    upstream rejects a batch as a bad request (400, 413 or 422), it is
+    split in halves and retried, so only the offending inputs fail; halves
+    rejected alike mean the request itself is bad, and fail together.
+    """
+
+    def __init__(self, window: float = 0.005, max_batch_size: int = 256, cache_max_bytes: int = 128 * 1024 * 1024):
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.cache_max_bytes = cache_max_bytes
+        self.cache_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.upstream_requests = 0
+        self._cache: "OrderedDict[_ItemKey, _Embedding]" = OrderedDict()
+        self._in_flight: Dict[_ItemKey, asyncio.Future] = {}
+        self._pending: Dict[_BatchKey, Tuple[Deployment, List[Tuple[_ItemKey, str, asyncio.Future]]]] = {}
+        self._timers: Dict[_BatchKey, asyncio.TimerHandle] = {}
+        # Most urgent priority among the requests in each pending batch
+        self._priorities: Dict[_BatchKey, int] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _cache_get(self, key: _ItemKey) -> Optional[_Embedding]:
+        embedding = self._cache.get(key)
+        if embedding is not None:
+            self._cache.move_to_end(key)
+        return embedding
+
+    def _cache_put(self, key: _ItemKey, embedding: _Embedding) -> None:
+        if key in self._cache:
+            return
+        self._cache[key] = embedding
+        self.cache_bytes += len(embedding[0]) * embedding[0].itemsize
+        while self.cache_bytes > self.cache_max_bytes and self._cache:
+            _, (vector, _) = self._cache.popitem(last=False)
+            self.cache_bytes -= len(vector) * vector.itemsize
+
+    def _enqueue(
+        self,
+        deployment: Deployment,
+        batch_key: _BatchKey,
+        item_key: _ItemKey,
+        text: str,
+        priority: int
+    ) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[item_key] = future
+        _, items = self._pending.setdefault(batch_key, (deployment, []))
+        items.append((item_key, text, future))
+        self._priorities[batch_key] = min(priority, self._priorities.get(batch_key, priority))
+        if len(items) >= self.max_batch_size:
+            self._flush(batch_key)
+        elif len(items) == 1:
+            self._timers[batch_key] = asyncio.get_running_loop().call_later(
+                self.window, self._flush, batch_key
+            )
+        return future
+
+    def _flush(self, batch_key: _BatchKey) -> None:
+        timer = self._timers.pop(batch_key, None)
+        if timer is not None:
+            timer.cancel()
+        deployment, items = self._pending.pop(batch_key)
+        priority = self._priorities.pop(batch_key)
+        task = asyncio.create_task(self._send(deployment, batch_key, items, priority))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _fail(self, items: List[Tuple[_ItemKey, str, asyncio.Future]], error: BaseException) -> None:
+        for item_key, _, future in items:
+            self._in_flight.pop(item_key, None)
+            if not future.done():
+                future.set_exception(error)
+
+    async def _call(
+        self,
+        deployment: Deployment,
+        batch_key: _BatchKey,
+        items: List[Tuple[_ItemKey, str, asyncio.Future]],
+        priority: int
+    ) -> None:
+        """Send items upstream in one request and resolve their futures"""
+        _, model, dimensions = batch_key
+        texts = [text for _, text, _ in items]
+        self.upstream_requests += 1
+        async with get_upstream_limiter().slot(priority):
+            async with LLMProviderFactory.create(deployment) as provider:
+                with get_health_checker().track(deployment.name):
+                    vectors, prompt_tokens = await provider.embeddings(texts, model, dimensions)
+
+        # The upstream reports tokens for the whole batch, split it by estimate
+        estimator = get_token_estimator()
+        estimates = [estimator.count_text(text, model) for text in texts]
+        total_estimate = sum(estimates) or 1
+        for (item_key, _, future), vector, estimate in zip(items, vectors, estimates):
+            tokens = round(prompt_tokens * estimate / total_estimate) if prompt_tokens else estimate
+            embedding = (array("d", vector), tokens)
+            self._cache_put(item_key, embedding)
+            self._in_flight.pop(item_key, None)
+            if not future.done():
+                future.set_result(embedding)
+
+    async def _attempt(
+        self,
+        deployment: Deployment,
+        batch_key: _BatchKey,
+        items: List[Tuple[_ItemKey, str, asyncio.Future]],
+        priority: int
+    ) -> Optional[Exception]:
+        """Send items, returning the error instead of raising it"""
+        try:
+            await self._call(deployment, batch_key, items, priority)
+        except Exception as e:
+            return e
+        except BaseException as e:
+            self._fail(items, e)
+            raise
+        return None
+
+    async def _split(
+        self,
+        deployment: Deployment,
+        batch_key: _BatchKey,
+        items: List[Tuple[_ItemKey, str, asyncio.Future]],
+        priority: int,
+        depth: int
+    ) -> None:
+        """Retry a batch the upstream rejected as two halves, and halve the
+        halves that fail again until the offending inputs are alone"""
+        middle = len(items) // 2
+        halves = [items[:middle], items[middle:]]
+        errors = await asyncio.gather(
+            *(self._attempt(deployment, batch_key, half, priority) for half in halves)
+        )
+        if all(errors) and _same_rejection(*errors):
+            # Both halves refused alike: the request, not an input, is at fault
+            self._fail(items, errors[0])
+            return
+        retries = []
+        for half, error in zip(halves, errors):
+            if error is None:
+                continue
+            if len(half) > 1 and depth < MAX_SPLIT_DEPTH and _rejects_input(error):
+                retries.append(self._split(deployment, batch_key, half, priority, depth + 1))
+            else:
+                self._fail(half, error)
+        await asyncio.gather(*retries)
+
+    async def _send(
+        self,
+        deployment: Deployment,
+        batch_key: _BatchKey,
+        items: List[Tuple[_ItemKey, str, asyncio.Future]],
+        priority: int
+    ) -> None:
+        # Inherited from whichever request opened the batch, but the batch
+        # serves others too; each caller waits only until its own deadline
+        deadline_var.set(None)
+        error = await self._attempt(deployment, batch_key, items, priority)
+        if error is None:
+            return
+        if len(items) > 1 and _rejects_input(error):
+            # One bad input should not fail the requests batched with it
+            await self._split(deployment, batch_key, items, priority, 1)
+        else:
+            self._fail(items, error)
+
+    async def embed(
+        self,
+        deployment: Deployment,
+        model: str,
+        inputs: List[str],
+        dimensions: Optional[int] = None,
+        priority: int = PRIORITY_ONLINE
+    ) -> Tuple[List[_Embedding], int]:
+        """Embed inputs, returning the embeddings in input order and the
+        upstream prompt tokens this call is accountable for"""
+        batch_key = (deployment.name, model, dimensions)
+        results: List[Optional[_Embedding]] = [None] * len(inputs)
+        waiting: List[Tuple[int, asyncio.Future]] = []
+        owned: Set[int] = set()
+        for index, text in enumerate(inputs):
+            item_key = (batch_key, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest())
+            embedding = self._cache_get(item_key)
+            if embedding is not None:
+                self.hits += 1
+                results[index] = embedding
+                continue
+            future = self._in_flight.get(item_key)
+            if future is None:
+                self.misses += 1
+                future = self._enqueue(deployment, batch_key, item_key, text, priority)
+                owned.add(index)
+            waiting.append((index, future))
+
+        if waiting:
+            # Shielded: other requests may be waiting on the same inputs
+            try:
+                async with asyncio.timeout_at(get_deadline()):
+                    embeddings = await asyncio.gather(*(asyncio.shield(future) for _, future in waiting))
+            except TimeoutError:
+                raise DeadlineExceededError() from None
+            for (index, _), embedding in zip(waiting, embeddings):
+                results[index] = embedding
+        return results, sum(results[index][1] for index in owned)
+
+    def to_dict(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "cache_entries": len(self._cache),
+            "cache_bytes": self.cache_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "upstream_requests": self.upstream_requests,
+            "inputs_per_upstream_request": round(self.misses / self.upstream_requests, 2) if self.upstream_requests else None,
+        }
+
+
+class EmbeddingService:
+    """Service for handling embeddings"""
+
+    @staticmethod
+    async def create_embeddings(request: EmbeddingRequest, priority: int = PRIORITY_ONLINE) -> EmbeddingResponse:
+        """Create embeddings, micro-batched with concurrent requests"""
+        inputs = [request.input] if isinstance(request.input, str) else request.input
+        if not inputs:
+            raise ValidationError("input must not be empty")
+        target = get_routing_table().resolve(request.model)
+        if not LLMProviderFactory.get_class(target.deployment.provider).supports_embeddings:
+            raise ValidationError(f"Model {request.model} does not support embeddings")
+
+        embeddings, upstream_tokens = await get_embedding_batcher().embed(
+            target.deployment, target.model, inputs, request.dimensions, priority
+        )
+        if upstream_tokens and get_settings().USAGE_ENABLED:
+            get_usage_recorder().record(
+                model=target.model,
+                provider=target.deployment.name,
+                prompt_tokens=upstream_tokens,
+                completion_tokens=0
+            )
+
+        data = []
+        for index, (vector, _) in enumerate(embeddings):
+            if request.encoding_format == "base64":
+                # Little endian float32, as the OpenAI API encodes them
+                packed = array("f", vector)
+                if sys.byteorder == "big":
+                    packed.byteswap()
+                embedding = base64.b64encode(packed.tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append(EmbeddingData.model_construct(index=index, embedding=embedding))
+        prompt_tokens = sum(tokens for _, tokens in embeddings)
+        # Constructed without validation, vectors can be large
+        return EmbeddingResponse.model_construct(
+            data=data,
+            model=target.model,
+            usage=EmbeddingUsage(prompt_tokens=prompt_tokens, total_tokens=prompt_tokens)
+        )
+
+
+# Global embedding batcher instance
+_embedding_batcher: Optional[EmbeddingBatcher] = None
+
+def get_embedding_batcher() -> EmbeddingBatcher:
+    """Get the process wide embedding batcher"""
+    global _embedding_batcher
+    if _embedding_batcher is None:
+        settings = get_settings()
+        _embedding_batcher = EmbeddingBatcher(
+            window=settings.EMBEDDINGS_BATCH_WINDOW_MS / 1000,
+            max_batch_size=settings.EMBEDDINGS_MAX_BATCH_SIZE,
+            cache_max_bytes=settings.EMBEDDINGS_CACHE_MAX_BYTES
+        )
+    return _embedding_batcher
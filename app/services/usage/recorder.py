@@ -0,0 +1,239 @@
+import asyncio
+import fnmatch
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config.settings import get_settings
+from app.core.context import get_tenant_id
+
+logger = logging.getLogger(__name__)
+
+# Usage is aggregated into hourly buckets
+BUCKET_SECONDS = 3600
+
+GROUP_BY_COLUMNS = ("tenant", "model", "provider", "bucket")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    bucket INTEGER NOT NULL,
+    tenant TEXT NOT NULL,
+    model TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    requests INTEGER NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    cost REAL NOT NULL,
+    PRIMARY KEY (bucket, tenant, model, provider)
+)
+"""
+
+_UPSERT = """
+INSERT INTO usage (bucket, tenant, model, provider, requests, prompt_tokens, completion_tokens, cost)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (bucket, tenant, model, provider) DO UPDATE SET
+    requests = requests + excluded.requests,
+    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+    completion_tokens = completion_tokens + excluded.completion_tokens,
+    cost = cost + excluded.cost
+"""
+
+# (bucket, tenant, model, provider)
+_Key = Tuple[int, str, str, str]
+
+
+class UsageRecorder:
+    """Per-request token and cost accounting
+
+    record() only adds to in-memory counters keyed by hour, tenant, model
+    and provider. A background task periodically swaps the counters out
+    and upserts them into SQLite from a worker thread, so the request path
+    never waits on disk. Several server processes can share one database.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        flush_interval: float = 10.0,
+        prices: Optional[Dict[str, Dict[str, float]]] = None
+    ):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.prices = prices or {}
+        self._pending: Dict[_Key, List[float]] = {}
+        self._price_cache: Dict[str, Tuple[float, float]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(_SCHEMA)
+        return conn
+
+    def get_price(self, model: str) -> Tuple[float, float]:
+        """Prompt and completion price of model in USD per million tokens"""
+        price = self._price_cache.get(model)
+        if price is None:
+            entry = self.prices.get(model)
+            if entry is None:
+                for pattern, candidate in self.prices.items():
+                    if fnmatch.fnmatchcase(model, pattern):
+                        entry = candidate
+                        break
+            entry = entry or {}
+            price = (entry.get("prompt", 0.0), entry.get("completion", 0.0))
+            self._price_cache[model] = price
+        return price
+
+    def record(
+        self,
+        model: str,
+        provider: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        tenant: Optional[str] = None
+    ) -> None:
+        """Account one request; tenant defaults to the current request's"""
+        tenant = tenant or get_tenant_id() or "unknown"
+        bucket = int(time.time()) // BUCKET_SECONDS * BUCKET_SECONDS
+        prompt_price, completion_price = self.get_price(model)
+        cost = (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+        totals = self._pending.get((bucket, tenant, model, provider))
+        if totals is None:
+            self._pending[(bucket, tenant, model, provider)] = [1, prompt_tokens, completion_tokens, cost]
+        else:
+            totals[0] += 1
+            totals[1] += prompt_tokens
+            totals[2] += completion_tokens
+            totals[3] += cost
+
+    def _write(self, pending: Dict[_Key, List[float]]) -> None:
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(_UPSERT, [key + tuple(totals) for key, totals in pending.items()])
+        finally:
+            conn.close()
+
+    async def flush(self) -> None:
+        """Write pending counters to the database"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self._write, pending)
+            except Exception:
+                # Merge back so nothing is lost, the next flush retries
+                for key, totals in pending.items():
+                    current = self._pending.setdefault(key, [0, 0, 0, 0.0])
+                    for i, value in enumerate(totals):
+                        current[i] += value
+                raise
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Usage flush failed, will retry: {e}")
+
+    async def start(self) -> None:
+        """Create the database and start the flush task"""
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        await asyncio.to_thread(lambda: self._connect().close())
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Stop the flush task and write what is left"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Final usage flush failed: {e}")
+
+    def _query(
+        self,
+        group_by: List[str],
+        tenant: Optional[str],
+        since: Optional[int],
+        until: Optional[int]
+    ) -> List[Dict]:
+        conditions, params = [], []
+        if tenant is not None:
+            conditions.append("tenant = ?")
+            params.append(tenant)
+        if since is not None:
+            conditions.append("bucket >= ?")
+            params.append(since // BUCKET_SECONDS * BUCKET_SECONDS)
+        if until is not None:
+            conditions.append("bucket < ?")
+            params.append(until)
+        columns = ", ".join(group_by)
+        sql = (
+            f"SELECT {columns}, SUM(requests), SUM(prompt_tokens), SUM(completion_tokens), SUM(cost) "
+            f"FROM usage {'WHERE ' + ' AND '.join(conditions) if conditions else ''} "
+            f"GROUP BY {columns} ORDER BY {columns}"
+        )
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+        results = []
+        for row in rows:
+            requests, prompt_tokens, completion_tokens, cost = row[len(group_by):]
+            results.append({
+                **dict(zip(group_by, row)),
+                "requests": requests,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "cost": round(cost, 6),
+            })
+        return results
+
+    async def query(
+        self,
+        group_by: List[str],
+        tenant: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None
+    ) -> List[Dict]:
+        """Usage totals grouped by GROUP_BY_COLUMNS, optionally filtered
+
+        This process flushes first; other server processes' usage shows up
+        within one flush interval.
+        """
+        await self.flush()
+        return await asyncio.to_thread(self._query, group_by, tenant, since, until)
+
+
+# Global usage recorder instance
+_usage_recorder: Optional[UsageRecorder] = None
+
+def get_usage_recorder() -> UsageRecorder:
+    """Get the process wide usage recorder"""
+    global _usage_recorder
+    if _usage_recorder is None:
+        settings = get_settings()
+        _usage_recorder = UsageRecorder(
+            db_path=settings.USAGE_DB_PATH,
+            flush_interval=settings.USAGE_FLUSH_INTERVAL,
+            prices=settings.MODEL_PRICES
+        )
+    return _usage_recorder
@@ -0,0 +1,274 @@
+"""Mock LLM upstream for load tests
+
+Answers OpenAI compatible chat completions and embeddings and Anthropic
+messages, streamed or not, with configurable time to first token and
+per token delay, so the gateway can be load tested without real
+providers. With --rate-limit each API key may send that many requests
+per --rate-window, reported in OpenAI or Anthropic rate limit headers,
+and is answered with 429 beyond it. Point the provider API bases at it,
+e.g.
+
+    python -m app.tools.mock_upstream --port 9100 --ttfb-ms 300 --token-ms 20
+    DEEPSEEK_API_BASE=http://127.0.0.1:9100/v1 \\
+    ANTHROPIC_API_BASE=http://127.0.0.1:9100 python -m app.server
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+
+@dataclass
+class MockConfig:
+    ttfb: float = 0.2  # seconds
+    token_delay: float = 0.01  # seconds between streamed tokens
+    completion_tokens: int = 50  # unless max_tokens asks for fewer
+    jitter: float = 0.1  # +/- fraction applied to every delay
+    dimensions: int = 256
+    error_rate: float = 0.0  # fraction of requests answered with a 500
+    rate_limit: int = 0  # requests per key and window, 0 is unlimited
+    rate_window: float = 60.0  # seconds
+
+
+config = MockConfig()
+# Start and request count of each API key's current rate limit window
+_windows: Dict[str, List[float]] = {}
+app = FastAPI(title="Mock LLM upstream")
+
+
+def _delay(seconds: float) -> float:
+    return max(0.0, seconds * (1 + random.uniform(-config.jitter, config.jitter)))
+
+
+def _completion_tokens(body: Dict[str, Any]) -> int:
+    requested = body.get("max_tokens") or body.get("max_completion_tokens")
+    return max(1, min(config.completion_tokens, requested or config.completion_tokens))
+
+
+def _prompt_tokens(body: Dict[str, Any]) -> int:
+    chars = sum(
+        len(message["content"]) for message in body.get("messages", [])
+        if isinstance(message.get("content"), str)
+    )
+    return max(1, chars // 4)
+
+
+def _sse(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def _failure() -> Optional[Response]:
+    if config.error_rate and random.random() < config.error_rate:
+        return JSONResponse({"error": {"message": "mock failure", "type": "server_error"}}, status_code=500)
+    return None
+
+
+def _rate_limit(request: Request, anthropic: bool = False) -> Tuple[Optional[Response], Dict[str, str]]:
+    """A 429 for a key over its limit, and the rate limit headers to send"""
+    if not config.rate_limit:
+        return None, {}
+    key = request.headers.get("x-api-key") or request.headers.get("authorization", "")
+    now = time.monotonic()
+    window = _windows.get(key)
+    if window is None or now - window[0] >= config.rate_window:
+        window = _windows[key] = [now, 0]
+    reset = window[0] + config.rate_window - now
+    limited = window[1] >= config.rate_limit
+    if not limited:
+        window[1] += 1
+    remaining = str(config.rate_limit - int(window[1]))
+    if anthropic:
+        reset_at = datetime.fromtimestamp(time.time() + reset, timezone.utc).isoformat().replace("+00:00", "Z")
+        headers = {
+            "anthropic-ratelimit-requests-limit": str(config.rate_limit),
+            "anthropic-ratelimit-requests-remaining": remaining,
+            "anthropic-ratelimit-requests-reset": reset_at,
+        }
+    else:
+        headers = {
+            "x-ratelimit-limit-requests": str(config.rate_limit),
+            "x-ratelimit-remaining-requests": remaining,
+            "x-ratelimit-reset-requests": f"{reset:.3f}s",
+        }
+    if not limited:
+        return None, headers
+    headers["retry-after"] = f"{reset:.3f}"
+    error = {"message": "mock rate limit reached", "type": "rate_limit_error"}
+    if anthropic:
+        body: Dict[str, Any] = {"type": "error", "error": error}
+    else:
+        body = {"error": error}
+    return JSONResponse(body, status_code=429, headers=headers), headers
+
+
+@app.api_route("/{path:path}", methods=["HEAD", "GET"])
+async def probe(path: str) -> Response:
+    """Connection warm-up and keep-alive probes"""
+    return Response(status_code=200)
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request) -> Response:
+    body = await request.json()
+    throttled, headers = _rate_limit(request)
+    if throttled is not None:
+        return throttled
+    failure = _failure()
+    if failure is not None:
+        return failure
+    model = body.get("model", "mock")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    tokens = _completion_tokens(body)
+    prompt_tokens = _prompt_tokens(body)
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": tokens, "total_tokens": prompt_tokens + tokens}
+
+    if not body.get("stream"):
+        await asyncio.sleep(_delay(config.ttfb + config.token_delay * tokens))
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(["token"] * tokens)},
+                "finish_reason": "stop" if tokens < config.completion_tokens else "length",
+            }],
+            "usage": usage,
+        }, headers=headers)
+
+    include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+    async def stream() -> AsyncIterator[str]:
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+            return _sse({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            })
+
+        await asyncio.sleep(_delay(config.ttfb))
+        yield chunk({"role": "assistant", "content": ""})
+        for _ in range(tokens):
+            await asyncio.sleep(_delay(config.token_delay))
+            yield chunk({"content": "token "})
+        yield chunk({}, "stop")
+        if include_usage:
+            yield _sse({"id": completion_id, "object": "chat.completion.chunk", "model": model, "choices": [], "usage": usage})
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=headers)
+
+
+@app.post("/v1/messages")
+async def messages(request: Request) -> Response:
+    body = await request.json()
+    throttled, headers = _rate_limit(request, anthropic=True)
+    if throttled is not None:
+        return throttled
+    failure = _failure()
+    if failure is not None:
+        return failure
+    model = body.get("model", "mock")
+    message_id = f"msg_{uuid.uuid4().hex}"
+    tokens = _completion_tokens(body)
+    prompt_tokens = _prompt_tokens(body)
+
+    if not body.get("stream"):
+        await asyncio.sleep(_delay(config.ttfb + config.token_delay * tokens))
+        return JSONResponse({
+            "id": message_id,
+            "type": "message",
+            "role": "assistant",
+            "model": model,
+            "content": [{"type": "text", "text": " ".join(["token"] * tokens)}],
+            "stop_reason": "end_turn",
+            "usage": {"input_tokens": prompt_tokens, "output_tokens": tokens},
+        }, headers=headers)
+
+    async def stream() -> AsyncIterator[str]:
+        def event(name: str, data: Dict[str, Any]) -> str:
+            return _sse({"type": name, **data}, event=name)
+
+        await asyncio.sleep(_delay(config.ttfb))
+        yield event("message_start", {"message": {
+            "id": message_id, "type": "message", "role": "assistant", "model": model,
+            "content": [], "usage": {"input_tokens": prompt_tokens, "output_tokens": 0},
+        }})
+        yield event("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})
+        for _ in range(tokens):
+            await asyncio.sleep(_delay(config.token_delay))
+            yield event("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": "token "}})
+        yield event("content_block_stop", {"index": 0})
+        yield event("message_delta", {"delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": tokens}})
+        yield event("message_stop", {})
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=headers)
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request) -> Response:
+    body = await request.json()
+    throttled, headers = _rate_limit(request)
+    if throttled is not None:
+        return throttled
+    failure = _failure()
+    if failure is not None:
+        return failure
+    inputs = body.get("input", [])
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    dimensions = body.get("dimensions") or config.dimensions
+    await asyncio.sleep(_delay(config.ttfb))
+    data = []
+    for index, text in enumerate(inputs):
+        rng = random.Random(text)
+        data.append({"object": "embedding", "index": index, "embedding": [rng.uniform(-1, 1) for _ in range(dimensions)]})
+    prompt_tokens = sum(max(1, len(text) // 4) for text in inputs)
+    return JSONResponse({
+        "object": "list",
+        "model": body.get("model", "mock"),
+        "data": data,
+        "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+    }, headers=headers)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a mock LLM upstream")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ttfb-ms", type=float, default=config.ttfb * 1000, help="time to first token")
+    parser.add_argument("--token-ms", type=float, default=config.token_delay * 1000, help="delay between tokens")
+    parser.add_argument("--tokens", type=int, default=config.completion_tokens, help="completion tokens per response")
+    parser.add_argument("--jitter", type=float, default=config.jitter, help="+/- fraction applied to every delay")
+    parser.add_argument("--dimensions", type=int, default=config.dimensions, help="default embedding size")
+    parser.add_argument("--error-rate", type=float, default=config.error_rate, help="fraction of requests failing with 500")
+    parser.add_argument("--rate-limit", type=int, default=config.rate_limit, help="requests per key and window, 0 is unlimited")
+    parser.add_argument("--rate-window", type=float, default=config.rate_window, help="rate limit window in seconds")
+    args = parser.parse_args()
+
+    config.ttfb = args.ttfb_ms / 1000
+    config.token_delay = args.token_ms / 1000
+    config.completion_tokens = args.tokens
+    config.jitter = args.jitter
+    config.dimensions = args.dimensions
+    config.error_rate = args.error_rate
+    config.rate_limit = args.rate_limit
+    config.rate_window = args.rate_window
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
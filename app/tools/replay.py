@@ -0,0 +1,238 @@
+"""Replay captured traffic against a gateway
+
+Reads the JSONL records written with CAPTURE_ENABLED and re-sends them,
+keeping their inter-arrival times (divided by --speed), their order and
+their mix of streamed and whole responses, methods and tenants. With
+--speed max requests are sent back to back, at most --concurrency at a
+time. Requests captured without a body are synthesized from their
+shape. Latency percentiles are printed for streamed and whole responses,
+next to those seen when the traffic was captured.
+
+Usage:
+    python -m app.tools.replay logs/capture.jsonl --target http://127.0.0.1:8000 --speed 10
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+import httpx
+
+# Filler for bodies synthesized from a shape, roughly one token per word
+_WORD = "lorem "
+
+
+def load_records(paths: Iterable[str], path_prefix: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Captured records from one or more files, in arrival order"""
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if path_prefix and not record.get("path", "").startswith(path_prefix):
+                    continue
+                records.append(record)
+    records.sort(key=lambda record: record["ts"])
+    return records
+
+
+def _filler(chars: int) -> str:
+    return (_WORD * (chars // len(_WORD) + 1))[:max(chars, 1)]
+
+
+def synthesize_body(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """A request body with the captured shape, for records without one"""
+    shape = record.get("shape")
+    if not shape:
+        return None
+    body = {key: shape[key] for key in ("model", "stream", "max_tokens", "temperature", "dimensions") if key in shape}
+    if "messages" in shape:
+        body["messages"] = [
+            {"role": message.get("role") or "user", "content": _filler(message.get("chars", 0))}
+            for message in shape["messages"]
+        ]
+    if "inputs" in shape:
+        body["input"] = [_filler(chars) for chars in shape["inputs"]]
+    return body
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Replayer:
+    """Sends captured requests on their original schedule, scaled by speed"""
+
+    def __init__(
+        self,
+        target: str,
+        speed: Optional[float],
+        concurrency: int = 64,
+        tenant_header: Optional[str] = None,
+        api_key: Optional[str] = None,
+        timeout: float = 300.0
+    ):
+        self.target = target.rstrip("/")
+        self.speed = speed  # None replays at maximum speed
+        self.concurrency = concurrency
+        self.tenant_header = tenant_header
+        self.api_key = api_key
+        self.timeout = timeout
+        self.results: List[Dict[str, Any]] = []
+        self.max_lag = 0.0
+
+    def _headers(self, record: Dict[str, Any]) -> Dict[str, str]:
+        headers = dict(record.get("headers") or {})
+        headers["X-Request-ID"] = f"replay-{record.get('trace_id') or 'unknown'}"
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        if self.tenant_header and record.get("tenant"):
+            headers[self.tenant_header] = record["tenant"]
+        return headers
+
+    async def _send(self, client: httpx.AsyncClient, record: Dict[str, Any]) -> None:
+        body = record.get("body")
+        if body is None:
+            body = synthesize_body(record)
+        url = self.target + record["path"] + (f"?{record['query']}" if record.get("query") else "")
+        result: Dict[str, Any] = {
+            "trace_id": record.get("trace_id"),
+            "path": record["path"],
+            "stream": bool(record.get("stream")),
+            "captured_status": record.get("status"),
+            "captured_duration": record.get("duration"),
+        }
+        start = time.perf_counter()
+        try:
+            async with client.stream(
+                record.get("method", "POST"),
+                url,
+                headers=self._headers(record),
+                json=body if body is not None else None
+            ) as response:
+                result["status"] = response.status_code
+                async for chunk in response.aiter_raw():
+                    if chunk and "ttfb" not in result:
+                        result["ttfb"] = time.perf_counter() - start
+        except httpx.HTTPError as e:
+            result["status"] = 0
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["duration"] = time.perf_counter() - start
+        self.results.append(result)
+
+    async def run(self, records: List[Dict[str, Any]]) -> float:
+        """Replay records, returning the wall time it took"""
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits) as client:
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            if self.speed is None:
+                semaphore = asyncio.Semaphore(self.concurrency)
+
+                async def bounded(record: Dict[str, Any]) -> None:
+                    async with semaphore:
+                        await self._send(client, record)
+
+                await asyncio.gather(*(bounded(record) for record in records))
+                return loop.time() - started
+
+            # Open loop: requests go out on schedule however slowly earlier
+            # ones are answered, as real clients do
+            first = records[0]["ts"] if records else 0.0
+            tasks = []
+            for record in records:
+                due = started + (record["ts"] - first) / self.speed
+                delay = due - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    self.max_lag = max(self.max_lag, -delay)
+                tasks.append(asyncio.create_task(self._send(client, record)))
+            await asyncio.gather(*tasks)
+            return loop.time() - started
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        """Status counts and latency percentiles, replayed and captured"""
+        summary: Dict[str, Any] = {
+            "requests": len(self.results),
+            "elapsed": round(elapsed, 3),
+            "requests_per_second": round(len(self.results) / elapsed, 2) if elapsed else None,
+            "max_schedule_lag": round(self.max_lag, 3),
+            "status": dict(Counter(str(result["status"]) for result in self.results)),
+        }
+        for kind, stream in (("stream", True), ("non_stream", False)):
+            results = [result for result in self.results if result["stream"] == stream]
+            if not results:
+                continue
+            stats: Dict[str, Any] = {"requests": len(results)}
+            for name, key in (("duration", "duration"), ("captured_duration", "captured_duration"), ("ttfb", "ttfb")):
+                values = [result[key] for result in results if result.get(key) is not None]
+                if values:
+                    stats[name] = {
+                        f"p{int(q * 100)}": round(percentile(values, q), 4)
+                        for q in (0.5, 0.9, 0.99)
+                    }
+            summary[kind] = stats
+        return summary
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay captured traffic against a gateway")
+    parser.add_argument("files", nargs="+", help="capture files (CAPTURE_FILE)")
+    parser.add_argument("--target", default="http://127.0.0.1:8000", help="gateway base URL")
+    parser.add_argument("--speed", default="1", help="time compression factor, e.g. 1, 10, or max")
+    parser.add_argument("--concurrency", type=int, default=64, help="requests in flight with --speed max")
+    parser.add_argument("--limit", type=int, default=0, help="replay only the first N requests")
+    parser.add_argument("--path-prefix", default="/api/v1", help="replay only requests under this path")
+    parser.add_argument("--tenant-header", help="send each request's captured tenant in this header")
+    parser.add_argument("--api-key", help="bearer token sent with every request")
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds per request")
+    parser.add_argument("--output", help="write per request results to this JSONL file")
+    args = parser.parse_args(argv)
+
+    speed = None if args.speed == "max" else float(args.speed)
+    if speed is not None and speed <= 0:
+        parser.error("--speed must be positive or max")
+    records = load_records(args.files, args.path_prefix)
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        print("No requests to replay", file=sys.stderr)
+        sys.exit(1)
+
+    replayer = Replayer(
+        target=args.target,
+        speed=speed,
+        concurrency=args.concurrency,
+        tenant_header=args.tenant_header,
+        api_key=args.api_key,
+        timeout=args.timeout
+    )
+    span = records[-1]["ts"] - records[0]["ts"]
+    print(
+        f"Replaying {len(records)} requests captured over {span:.1f}s at "
+        f"{'max speed' if speed is None else f'{speed:g}x'}",
+        file=sys.stderr
+    )
+    elapsed = asyncio.run(replayer.run(records))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for result in replayer.results:
+                f.write(json.dumps(result) + "\n")
+    print(json.dumps(replayer.summary(elapsed), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,21 @@
 import platform
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, Any
 
+@lru_cache(maxsize=1)
+def _platform_info() -> Dict[str, str]:
+    """Facts fixed for the life of the process, platform() is slow to compute"""
+    return {
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
 def get_system_info() -> Dict[str, Any]:
     """Get system information"""
     return {
         "version": "0.0.1",
-        "python_version": platform.python_version(),
-        "platform": platform.platform(),
+        **_platform_info(),
         "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "timezone": "Asia/Shanghai"
     }
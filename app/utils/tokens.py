@@ -0,0 +1,163 @@
+import fnmatch
+import hashlib
+import logging
+import math
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config.settings import get_settings
+from app.core.exceptions import ContextLengthExceededError
+from app.schemas.base import ChatCompletionRequest, Message
+
+try:
+    import tiktoken
+except ImportError:  # optional, exact counts for OpenAI models
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# OpenAI chat format overhead: every message is wrapped in role/separator
+# tokens and the reply is primed with a few more
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+# CJK ideographs, kana and hangul are roughly one token per character
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]")
+# Heuristic for everything else, calibrated on English prose and code
+_CHARS_PER_TOKEN = 4.0
+
+
+def heuristic_token_count(text: str) -> int:
+    """Estimate tokens of text without a tokenizer"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / _CHARS_PER_TOKEN)
+
+
+class TokenEstimator:
+    """Local prompt token estimator
+
+    Uses tiktoken when it is installed and knows the model, and a
+    heuristic otherwise. Counts are memoized per message content hash in a
+    bounded LRU, so in a multi-turn conversation only the newest messages
+    are actually tokenized.
+    """
+
+    def __init__(self, cache_size: int = 10000):
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, bytes], int]" = OrderedDict()
+        self._encodings: Dict[str, Optional[object]] = {}
+
+    def _get_encoding(self, model: str):
+        if model not in self._encodings:
+            encoding = None
+            if tiktoken is not None:
+                try:
+                    encoding = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    encoding = None
+                except Exception as e:
+                    # e.g. encoding files cannot be downloaded
+                    logger.warning(f"tiktoken unavailable for {model}: {e}")
+            self._encodings[model] = encoding
+        return self._encodings[model]
+
+    def count_text(self, text: str, model: str) -> int:
+        """Count tokens of text for model"""
+        encoding = self._get_encoding(model)
+        encoding_name = encoding.name if encoding is not None else "heuristic"
+        key = (encoding_name, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest())
+        count = self._cache.get(key)
+        if count is not None:
+            self._cache.move_to_end(key)
+            return count
+
+        if encoding is not None:
+            count = len(encoding.encode(text, disallowed_special=()))
+        else:
+            count = heuristic_token_count(text)
+        self._cache[key] = count
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return count
+
+    def count_message(self, message: Message, model: str) -> int:
+        return TOKENS_PER_MESSAGE + self.count_text(message.content, model)
+
+    def count_messages(self, messages: List[Message], model: str) -> int:
+        """Count prompt tokens of a conversation"""
+        return TOKENS_PER_REPLY + sum(self.count_message(m, model) for m in messages)
+
+    def estimate_request(self, request: ChatCompletionRequest) -> int:
+        """Estimate prompt tokens of a request, cached on the request"""
+        if request._prompt_tokens is None:
+            request._prompt_tokens = self.count_messages(request.messages, request.model)
+        return request._prompt_tokens
+
+
+def get_context_window(model: str) -> Optional[int]:
+    """Context window of model from MODEL_CONTEXT_WINDOWS (exact name or glob)"""
+    windows = get_settings().MODEL_CONTEXT_WINDOWS
+    if model in windows:
+        return windows[model]
+    for pattern, window in windows.items():
+        if fnmatch.fnmatchcase(model, pattern):
+            return window
+    return None
+
+
+def check_context_window(request: ChatCompletionRequest) -> int:
+    """Reject or trim a request that cannot fit the model's context window
+
+    Returns the prompt token estimate. With CONTEXT_OVERFLOW_POLICY "trim"
+    the oldest non-system messages are dropped (the last message is always
+    kept) until prompt plus max_tokens fits.
+    """
+    estimator = get_token_estimator()
+    prompt_tokens = estimator.estimate_request(request)
+    settings = get_settings()
+    window = get_context_window(request.model)
+    if window is None or settings.CONTEXT_OVERFLOW_POLICY == "off":
+        return prompt_tokens
+
+    completion_tokens = request.max_tokens or 0
+    if prompt_tokens + completion_tokens <= window:
+        return prompt_tokens
+
+    if settings.CONTEXT_OVERFLOW_POLICY == "trim":
+        messages = list(request.messages)
+        removable = [
+            i for i, m in enumerate(messages[:-1]) if m.role != "system"
+        ]
+        dropped = set()
+        for index in removable:
+            if prompt_tokens + completion_tokens <= window:
+                break
+            prompt_tokens -= estimator.count_message(messages[index], request.model)
+            dropped.add(index)
+        if prompt_tokens + completion_tokens <= window:
+            request.messages = [m for i, m in enumerate(messages) if i not in dropped]
+            request._prompt_tokens = prompt_tokens
+            logger.info(
+                f"Trimmed {len(dropped)} message(s) to fit {request.model} "
+                f"context window of {window} tokens"
+            )
+            return prompt_tokens
+
+    raise ContextLengthExceededError(
+        model=request.model,
+        context_window=window,
+        prompt_tokens=estimator.estimate_request(request),
+        completion_tokens=completion_tokens
+    )
+
+
+# Global estimator instance
+_token_estimator: Optional[TokenEstimator] = None
+
+def get_token_estimator() -> TokenEstimator:
+    """Get the process wide token estimator"""
+    global _token_estimator
+    if _token_estimator is None:
+        _token_estimator = TokenEstimator(cache_size=get_settings().TOKEN_CACHE_SIZE)
+    return _token_estimator
@@ -0,0 +1,11 @@
+import os
+import tempfile
+
+# Settings are read once per process; keep the tests' side effects out of the tree
+_tmp = tempfile.mkdtemp(prefix="gateway-tests-")
+os.environ.setdefault("LOG_DIR", os.path.join(_tmp, "logs"))
+os.environ.setdefault("USAGE_ENABLED", "false")
+os.environ.setdefault("USAGE_DB_PATH", os.path.join(_tmp, "usage.db"))
+os.environ.setdefault("BATCH_JOB_DIR", os.path.join(_tmp, "jobs"))
+os.environ.setdefault("HEALTH_CHECK_ENABLED", "false")
+os.environ.setdefault("ROUTING_TABLE_PATH", "")
@@ -0,0 +1,32 @@
+from app.core.providers.anthropic import AnthropicProvider
+from app.schemas.base import ChatCompletionRequest, Message
+
+
+def translate(**kwargs):
+    provider = AnthropicProvider(api_key="key", api_base="http://anthropic.invalid")
+    request = ChatCompletionRequest(
+        model="claude-sonnet-4",
+        messages=[
+            Message(role="system", content="Be brief"),
+            Message(role="user", content="Hi"),
+            Message(role="user", content="Still there?"),
+        ],
+        **kwargs
+    )
+    return provider.prepare_payload(request)
+
+
+def test_system_messages_and_consecutive_turns():
+    payload = translate()
+    assert payload["system"] == [{"type": "text", "text": "Be brief"}]
+    assert payload["messages"] == [{
+        "role": "user",
+        "content": [{"type": "text", "text": "Hi"}, {"type": "text", "text": "Still there?"}],
+    }]
+
+
+def test_temperature_above_anthropic_range_is_clamped():
+    assert translate(temperature=1.5)["temperature"] == 1.0
+    assert translate(temperature=2)["temperature"] == 1.0
+    assert translate(temperature=0.3)["temperature"] == 0.3
+    assert translate(temperature=0)["temperature"] == 0
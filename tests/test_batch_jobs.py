@@ -0,0 +1,73 @@
+import asyncio
+import json
+from typing import List
+
+from app.schemas.base import BatchChatCompletionResult
+from app.services.batch.jobs import BatchJobManager
+
+
+def input_line(custom_id: str) -> bytes:
+    request = {"model": "chat", "messages": [{"role": "user", "content": custom_id}]}
+    return json.dumps({"custom_id": custom_id, "request": request}).encode() + b"\n"
+
+
+def result_line(custom_id: str) -> str:
+    return BatchChatCompletionResult(custom_id=custom_id, status_code=200).model_dump_json(exclude_none=True) + "\n"
+
+
+async def chunks(data: bytes):
+    yield data
+
+
+def test_resume_redoes_only_lines_after_the_checkpoint(tmp_path):
+    manager = BatchJobManager(job_dir=str(tmp_path), concurrency=2, checkpoint_interval=60.0)
+    lines = [input_line(f"item-{i}") for i in range(5)]
+    ran: List[int] = []
+
+    async def run_line(job_id: str, index: int, line: bytes) -> BatchChatCompletionResult:
+        ran.append(index)
+        return BatchChatCompletionResult(custom_id=json.loads(line)["custom_id"], status_code=200)
+
+    manager._run_line = run_line
+
+    async def run():
+        job = await manager.create_job(chunks(b"".join(lines)))
+        # A previous owner finished line 0 and, out of order, line 2, then
+        # wrote line 3's result but died before its next checkpoint
+        kept = result_line("item-0") + result_line("item-2")
+        with open(manager._path(job.id, manager.OUTPUT_FILE), "w", encoding="utf-8") as f:
+            f.write(kept + result_line("item-3"))
+        job.completed = 2
+        checkpoint = {
+            "offset": len(lines[0]),
+            "next_index": 1,
+            "done_ahead": [2],
+            "output_size": len(kept.encode()),
+        }
+        manager._save_state(job, checkpoint)
+
+        await manager._process_job(job.id)
+        return await manager.get_job(job.id)
+
+    job = asyncio.run(run())
+    assert sorted(ran) == [1, 3, 4]
+    assert job.status == "completed"
+    assert (job.completed, job.failed) == (5, 0)
+    with open(manager._path(job.id, manager.OUTPUT_FILE), encoding="utf-8") as f:
+        custom_ids = [json.loads(line)["custom_id"] for line in f]
+    assert sorted(custom_ids) == [f"item-{i}" for i in range(5)]
+
+
+def test_results_stop_at_the_checkpoint(tmp_path):
+    manager = BatchJobManager(job_dir=str(tmp_path))
+
+    async def run():
+        job = await manager.create_job(chunks(input_line("item-0")))
+        with open(manager._path(job.id, manager.OUTPUT_FILE), "w", encoding="utf-8") as f:
+            f.write(result_line("item-0"))
+        return job, await manager.get_results(job.id)
+
+    job, (path, size) = asyncio.run(run())
+    assert path == manager._path(job.id, manager.OUTPUT_FILE)
+    # Written after the last checkpoint, not served yet
+    assert size == 0
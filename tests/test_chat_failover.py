@@ -0,0 +1,171 @@
+import asyncio
+import json
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.core.concurrency import PRIORITY_ONLINE
+from app.core.providers.base import LLMProvider, LLMProviderFactory
+from app.core.providers.routing import Deployment, RouteTarget, Timeouts
+from app.schemas.base import ChatCompletionRequest, Message
+from app.services.chat import service as chat_service
+from app.services.chat.service import CONTINUE_PROMPT, ChatService, _StreamSplice, continuation_request
+
+
+def make_request(**kwargs) -> ChatCompletionRequest:
+    return ChatCompletionRequest(
+        model="chat",
+        messages=[Message(role="user", content="Say hello")],
+        stream=True,
+        **kwargs
+    )
+
+
+def deployment(name: str) -> Deployment:
+    return Deployment(
+        name=name,
+        provider="fake",
+        api_base=f"http://{name}.invalid",
+        api_key=None,
+        timeouts=Timeouts(1.0, 1.0, 1.0, 1.0)
+    )
+
+
+def sse(data: Dict) -> str:
+    return f"data: {json.dumps(data)}\n\n"
+
+
+def content_chunk(text: Optional[str], role: Optional[str] = None, finish_reason: Optional[str] = None) -> str:
+    delta = {"content": text}
+    if role:
+        delta["role"] = role
+    return sse({
+        "id": "upstream-id",
+        "created": 1,
+        "model": "upstream-model",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    })
+
+
+class FakeProvider(LLMProvider):
+    """Streams its pieces, then finishes or breaks off"""
+
+    def __init__(self, pieces: List[str], finish: bool):
+        self.pieces = pieces
+        self.finish = finish
+        self.requests: List[ChatCompletionRequest] = []
+
+    async def chat_completion(self, request):
+        raise NotImplementedError
+
+    async def chat_completion_stream(self, request):
+        self._reset_stream_state()
+        self.requests.append(request)
+        yield content_chunk("", role="assistant")
+        for piece in self.pieces:
+            self._stream_text(piece)
+            yield content_chunk(piece)
+        if not self.finish:
+            raise httpx.ReadError("connection lost")
+        self.stream_finished = True
+        yield content_chunk(None, finish_reason="stop")
+        yield "data: [DONE]\n\n"
+
+
+def client_text(chunks: List[str]) -> str:
+    text = ""
+    for chunk in chunks:
+        if chunk.startswith("data: [DONE]"):
+            continue
+        data = json.loads(chunk[len("data: "):])
+        for choice in data.get("choices", []):
+            text += (choice.get("delta") or {}).get("content") or ""
+    return text
+
+
+def test_continuation_request_appends_partial_and_prompt():
+    request = make_request(max_tokens=100)
+    request._prompt_tokens = 7
+
+    continued = continuation_request(request, "other-model", "Hello world ", prefill=False)
+
+    assert continued.model == "other-model"
+    assert [(m.role, m.content) for m in continued.messages] == [
+        ("user", "Say hello"),
+        ("assistant", "Hello world"),
+        ("user", CONTINUE_PROMPT),
+    ]
+    assert continued.max_tokens == 97
+    assert continued._prompt_tokens is None
+    # The original is left alone for later continuations
+    assert len(request.messages) == 1
+    assert request._prompt_tokens == 7
+
+
+def test_continuation_request_with_prefill_ends_on_assistant():
+    continued = continuation_request(make_request(), "m", "Hello", prefill=True)
+
+    assert [m.role for m in continued.messages] == ["user", "assistant"]
+    assert continued.max_tokens is None
+
+
+def test_stream_splice_rewrites_resumed_chunks():
+    header = {"id": "first-id", "created": 42, "model": "chat"}
+    marker = {"attempts": 2}
+    splice = _StreamSplice(header, strip_leading=True, marker=marker)
+
+    assert splice.rewrite(content_chunk("", role="assistant")) is None
+    data = json.loads(splice.rewrite(content_chunk("  world"))[len("data: "):])
+    assert data["id"] == "first-id" and data["created"] == 42 and data["model"] == "chat"
+    assert data["choices"][0]["delta"] == {"content": "world"}
+    assert splice.received("  world") == "world"
+
+    usage = sse({"id": "x", "choices": [], "usage": {"prompt_tokens": 1, "completion_tokens": 1}})
+    data = json.loads(splice.rewrite(usage)[len("data: "):])
+    assert data["failover"] == marker
+    assert splice.marked
+
+
+def test_two_consecutive_failovers(monkeypatch):
+    providers = {
+        "a": FakeProvider(["Hello", " world "], finish=False),
+        "b": FakeProvider([" and", " more"], finish=False),
+        "c": FakeProvider([" done."], finish=True),
+    }
+    deployments = {name: deployment(name) for name in providers}
+
+    class Table:
+        def resolve_fallback(self, model, exclude):
+            for name in ("b", "c"):
+                if name not in exclude:
+                    return RouteTarget(deployment=deployments[name], model=f"model-{name}")
+            return None
+
+    monkeypatch.setattr(chat_service, "get_routing_table", lambda: Table())
+    monkeypatch.setattr(LLMProviderFactory, "get_class", lambda provider: FakeProvider)
+    monkeypatch.setattr(LLMProviderFactory, "create", lambda target_deployment: providers[target_deployment.name])
+
+    request = make_request(max_tokens=100)
+    target = RouteTarget(deployment=deployments["a"], model="model-a")
+
+    async def run() -> List[str]:
+        stream = ChatService._stream_with_slot(providers["a"], request, PRIORITY_ONLINE, target, "chat")
+        return [chunk async for chunk in stream]
+
+    chunks = asyncio.run(run())
+
+    assert client_text(chunks) == "Hello world and more done."
+    last = providers["c"].requests[0]
+    assert last.model == "model-c"
+    assert [(m.role, m.content) for m in last.messages] == [
+        ("user", "Say hello"),
+        ("assistant", "Hello world and more"),
+        ("user", CONTINUE_PROMPT),
+    ]
+    assert last.max_tokens == 95
+    markers = [json.loads(c[len("data: "):]).get("failover") for c in chunks if not c.startswith("data: [DONE]")]
+    assert [m for m in markers if m] == [
+        {"attempts": 3, "deployments": ["a", "b", "c"], "resumed_after_chars": 20}
+    ]
+    ids = {json.loads(c[len("data: "):])["id"] for c in chunks if not c.startswith("data: [DONE]")}
+    assert ids == {"upstream-id"}
@@ -0,0 +1,73 @@
+import asyncio
+
+from app.core.exceptions import UpstreamTimeoutError
+from app.core.providers.base import LLMProviderFactory
+from app.core.providers.latency import LatencyTracker
+from app.core.providers.routing import Deployment, RouteTarget, Timeouts
+from app.schemas.base import ChatCompletionChoice, ChatCompletionRequest, ChatCompletionResponse, Message, UsageInfo
+from app.services.chat import service as chat_service
+from app.services.chat.service import ChatService
+
+
+class FakeProvider:
+    """Answers non-streaming requests after a delay, or times out"""
+
+    supports_raw_forwarding = False
+
+    def __init__(self, delay: float, timeout: bool = False):
+        self.delay = delay
+        self.timeout = timeout
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def chat_completion(self, request):
+        await asyncio.sleep(self.delay)
+        if self.timeout:
+            raise UpstreamTimeoutError("ttfb", self.delay)
+        return ChatCompletionResponse(
+            id="resp",
+            created=1,
+            model=request.model,
+            choices=[ChatCompletionChoice(index=0, message=Message(role="assistant", content="Hi"), finish_reason="stop")],
+            usage=UsageInfo(prompt_tokens=3, completion_tokens=1, total_tokens=4)
+        )
+
+
+def run_completion(monkeypatch, provider: FakeProvider) -> LatencyTracker:
+    tracker = LatencyTracker(window=60.0, min_samples=1)
+    target = RouteTarget(
+        deployment=Deployment(name="slow", provider="fake", api_base="http://slow.invalid", api_key=None,
+                              timeouts=Timeouts(1.0, 1.0, 1.0, 1.0)),
+        model="upstream-model"
+    )
+
+    class Table:
+        def resolve(self, model):
+            return target
+
+    monkeypatch.setattr(chat_service, "get_routing_table", lambda: Table())
+    monkeypatch.setattr(chat_service, "get_latency_tracker", lambda: tracker)
+    monkeypatch.setattr(LLMProviderFactory, "create", lambda deployment: provider)
+    request = ChatCompletionRequest(model="economy", messages=[Message(role="user", content="Hi")], stream=False)
+    try:
+        asyncio.run(ChatService.chat_completion(request))
+    except UpstreamTimeoutError:
+        pass
+    return tracker
+
+
+def test_non_streaming_completion_feeds_slo_statistics(monkeypatch):
+    tracker = run_completion(monkeypatch, FakeProvider(delay=0.05))
+    estimate = tracker.estimate("slow", "upstream-model", 0.9)
+    assert estimate is not None
+    assert 0.05 <= estimate.ttfb < 0.5
+    assert estimate.tokens_per_second is None
+
+
+def test_non_streaming_timeout_counts_as_slow(monkeypatch):
+    tracker = run_completion(monkeypatch, FakeProvider(delay=0.02, timeout=True))
+    assert tracker.samples("slow", "upstream-model") == 1
@@ -0,0 +1,69 @@
+import asyncio
+from typing import List
+
+from app.core.providers import dns as dns_module
+from app.core.providers.dns import DNSCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def make_cache(monkeypatch, ttl: float, **kwargs):
+    """A cache whose resolver answers with ttl until told to fail"""
+    clock = Clock()
+    monkeypatch.setattr(dns_module.time, "monotonic", clock.monotonic)
+    cache = DNSCache(**kwargs)
+    queries: List[float] = []
+    state = {"down": False}
+
+    async def query(host, port):
+        queries.append(clock.now)
+        if state["down"]:
+            raise OSError("resolver unreachable")
+        return ["10.0.0.1"], ttl
+
+    cache._query = query
+    return cache, clock, queries, state
+
+
+async def resolve_many(cache: DNSCache, clock: Clock, count: int, step: float) -> None:
+    for _ in range(count):
+        assert await cache.resolve("api.example.com", 443) == ["10.0.0.1"]
+        # Let any background refresh run
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        clock.now += step
+
+
+def test_failed_refresh_backs_off_during_an_outage(monkeypatch):
+    cache, clock, queries, state = make_cache(monkeypatch, ttl=60.0, refresh_ahead=10.0, min_ttl=5.0)
+
+    async def run():
+        await cache.resolve("api.example.com", 443)
+        clock.now += 55.0
+        state["down"] = True
+        # 20 requests in 200 ms, then another 20 over the next 10 seconds
+        await resolve_many(cache, clock, 20, 0.01)
+        await resolve_many(cache, clock, 20, 0.5)
+
+    asyncio.run(run())
+    refreshes = queries[1:]
+    # At 55s, and again 5s later; not once per request
+    assert len(refreshes) == 2
+    assert all(b - a >= 5.0 for a, b in zip(refreshes, refreshes[1:]))
+
+
+def test_short_ttl_is_not_resolved_on_every_request(monkeypatch):
+    cache, clock, queries, _ = make_cache(monkeypatch, ttl=2.0, refresh_ahead=10.0)
+
+    async def run():
+        await resolve_many(cache, clock, 40, 0.1)
+
+    asyncio.run(run())
+    # Four seconds of traffic on a two second TTL, refreshed once a second
+    assert 3 <= len(queries) <= 5
@@ -0,0 +1,74 @@
+import asyncio
+from typing import List, Optional
+
+from app.core.exceptions import ProviderAPIError
+from app.core.providers.base import LLMProviderFactory
+from app.core.providers.routing import Deployment, Timeouts
+from app.services.embeddings.service import EmbeddingBatcher
+
+
+class FakeEmbeddingsProvider:
+    """Embeds every input unless told to reject it"""
+
+    def __init__(self, calls: List[int], bad_input: Optional[str] = None, reject_all: bool = False):
+        self.calls = calls
+        self.bad_input = bad_input
+        self.reject_all = reject_all
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def embeddings(self, texts, model, dimensions):
+        self.calls.append(len(texts))
+        if self.reject_all:
+            raise ProviderAPIError("fake", 400, "dimensions is not supported by this model")
+        if self.bad_input in texts:
+            raise ProviderAPIError("fake", 400, f"input {texts.index(self.bad_input)} is too long")
+        return [[float(len(text))] for text in texts], len(texts)
+
+
+def deployment() -> Deployment:
+    return Deployment(
+        name="fake",
+        provider="fake",
+        api_base="http://fake.invalid",
+        api_key=None,
+        timeouts=Timeouts(1.0, 1.0, 1.0, 1.0)
+    )
+
+
+def embed_each(monkeypatch, inputs: List[str], **provider_kwargs):
+    """Embed every input as its own concurrent request, batched together"""
+    calls: List[int] = []
+    monkeypatch.setattr(
+        LLMProviderFactory, "create",
+        staticmethod(lambda deployment: FakeEmbeddingsProvider(calls, **provider_kwargs))
+    )
+    batcher = EmbeddingBatcher(window=0.01, max_batch_size=len(inputs))
+
+    async def run():
+        return await asyncio.gather(
+            *(batcher.embed(deployment(), "embed", [text]) for text in inputs),
+            return_exceptions=True
+        )
+
+    return asyncio.run(run()), calls
+
+
+def test_bad_input_fails_alone(monkeypatch):
+    inputs = [f"text {i}" for i in range(8)]
+    results, calls = embed_each(monkeypatch, inputs, bad_input="text 5")
+    failed = [i for i, result in enumerate(results) if isinstance(result, Exception)]
+    assert failed == [5]
+    # The whole batch, then one pair of halves per level down to the input
+    assert sorted(calls, reverse=True) == [8, 4, 4, 2, 2, 1, 1]
+
+
+def test_request_level_rejection_is_not_bisected(monkeypatch):
+    inputs = [f"text {i}" for i in range(256)]
+    results, calls = embed_each(monkeypatch, inputs, reject_all=True)
+    assert all(isinstance(result, ProviderAPIError) for result in results)
+    assert len(calls) == 3
@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+from app.core.providers.keys import KeyPool, parse_reset
+
+
+def limits(remaining: int, limit: int = 100, reset: str = "60s"):
+    return {
+        "x-ratelimit-remaining-requests": str(remaining),
+        "x-ratelimit-limit-requests": str(limit),
+        "x-ratelimit-reset-requests": reset,
+    }
+
+
+def test_parse_reset_formats():
+    assert parse_reset("1.5") == 1.5
+    assert parse_reset("6m0s") == 360.0
+    assert parse_reset("20ms") == 0.02
+    assert parse_reset("soon") is None
+
+
+def test_single_unknown_key_is_returned_at_once():
+    pool = KeyPool()
+    assert asyncio.run(pool.acquire(["k1"])) == ("k1", True)
+
+
+def test_acquire_prefers_headroom_then_least_used():
+    async def run():
+        pool = KeyPool()
+        pool.update("k1", limits(10), 200)
+        pool.update("k2", limits(90), 200)
+        assert await pool.acquire(["k1", "k2"]) == ("k2", True)
+
+        pool = KeyPool()
+        # Nothing reported yet: requests alternate between the keys
+        picked = [(await pool.acquire(["k1", "k2"]))[0] for _ in range(4)]
+        assert sorted(picked) == ["k1", "k1", "k2", "k2"]
+
+    asyncio.run(run())
+
+
+def test_acquire_skips_throttled_key():
+    async def run():
+        pool = KeyPool()
+        pool.update("k1", {"retry-after": "30"}, 429)
+        pool.update("k2", limits(5), 200)
+        assert await pool.acquire(["k1", "k2"]) == ("k2", True)
+
+    asyncio.run(run())
+
+
+def test_acquire_waits_for_the_soonest_reset():
+    async def run():
+        pool = KeyPool(max_wait=1.0, reserve=0.0)
+        pool.update("k1", limits(0, reset="50ms"), 200)
+        pool.update("k2", limits(0, reset="60s"), 200)
+        start = time.monotonic()
+        key, had_room = await pool.acquire(["k1", "k2"])
+        assert (key, had_room) == ("k1", True)
+        assert 0.04 <= time.monotonic() - start < 0.5
+        assert pool.waits == 1
+
+    asyncio.run(run())
+
+
+def test_acquire_gives_up_past_max_wait():
+    async def run():
+        pool = KeyPool(max_wait=0.05, reserve=0.0)
+        pool.update("k1", limits(0, reset="60s"), 200)
+        pool.update("k2", limits(0, reset="30s"), 200)
+        start = time.monotonic()
+        assert await pool.acquire(["k1", "k2"]) == ("k2", False)
+        assert time.monotonic() - start < 0.05
+
+    asyncio.run(run())
+
+
+def test_requests_sent_are_counted_down_locally():
+    async def run():
+        pool = KeyPool(max_wait=0.0, reserve=0.0)
+        pool.update("k1", limits(2), 200)
+        assert await pool.acquire(["k1"]) == ("k1", True)
+        assert await pool.acquire(["k1"]) == ("k1", True)
+        # The reported quota is spent until the window resets
+        assert await pool.acquire(["k1"]) == ("k1", False)
+
+    asyncio.run(run())
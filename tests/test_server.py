@@ -0,0 +1,17 @@
+import signal
+
+from app.core.providers.health import get_health_checker
+from app.server import WorkerServer, build_config
+
+
+def test_exit_signal_fails_readiness_before_shutdown():
+    server = WorkerServer(build_config(1.0, "asyncio", "h11"))
+    checker = get_health_checker()
+    checker.draining = False
+    try:
+        server.handle_exit(signal.SIGTERM, None)
+        assert server.should_exit
+        assert checker.draining
+        assert not checker.is_ready()
+    finally:
+        checker.draining = False
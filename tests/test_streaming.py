@@ -0,0 +1,39 @@
+import asyncio
+import json
+from typing import List, Optional
+
+from app.core.streaming import relay_stream
+
+
+def frame(content: Optional[str], role: Optional[str] = None) -> str:
+    delta = {"content": content}
+    if role:
+        delta["role"] = role
+    return f"data: {json.dumps({'choices': [{'index': 0, 'delta': delta}]})}\n\n"
+
+
+async def upstream(frames: List[str], gap: float):
+    for item in frames:
+        yield item
+        await asyncio.sleep(gap)
+
+
+def relayed_writes(frames: List[str], gap: float = 0.001, window: float = 0.05) -> List[str]:
+    async def run():
+        return [chunk async for chunk in relay_stream(upstream(frames, gap), coalesce_window=window)]
+
+    return asyncio.run(run())
+
+
+def test_first_token_is_not_held_behind_the_role_frame():
+    frames = [frame("", role="assistant"), frame("Hello"), frame(" wor"), frame("ld"), "data: [DONE]\n\n"]
+    writes = relayed_writes(frames)
+    # Role frame and first token each written at once, the rest coalesced
+    assert writes[0] == frames[0]
+    assert writes[1] == frames[1]
+    assert writes[2] == frames[2] + frames[3] + frames[4]
+
+
+def test_without_a_window_every_frame_is_written():
+    frames = [frame("", role="assistant"), frame("Hi"), "data: [DONE]\n\n"]
+    assert relayed_writes(frames, window=0.0) == frames
@@ -0,0 +1,80 @@
+import asyncio
+from typing import List
+
+from app.core.concurrency import PRIORITY_BATCH, PRIORITY_ONLINE, UpstreamLimiter
+from app.core.context import tenant_var
+
+
+async def _acquire(limiter: UpstreamLimiter, tenant: str, priority: int, label: str, order: List[str]) -> None:
+    tenant_var.set(tenant)
+    await limiter.acquire(priority)
+    order.append(label)
+
+
+async def _queue_then_drain(limiter: UpstreamLimiter, waiters) -> List[str]:
+    """Queue waiters behind a held slot, then free slots one at a time"""
+    order: List[str] = []
+    await limiter.acquire(PRIORITY_ONLINE)
+    tasks = []
+    for tenant, priority, label in waiters:
+        tasks.append(asyncio.create_task(_acquire(limiter, tenant, priority, label, order)))
+        # Let it queue before the next one arrives
+        await asyncio.sleep(0)
+    limiter.release(PRIORITY_ONLINE)
+    for _ in waiters:
+        await asyncio.sleep(0)
+        granted = order[-1]
+        limiter.release(PRIORITY_BATCH if granted.startswith("batch") else PRIORITY_ONLINE)
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_online_requests_overtake_queued_batch_work():
+    limiter = UpstreamLimiter(max_concurrency=1)
+    order = asyncio.run(_queue_then_drain(limiter, [
+        ("t", PRIORITY_BATCH, "batch-1"),
+        ("t", PRIORITY_BATCH, "batch-2"),
+        ("t", PRIORITY_ONLINE, "online-1"),
+    ]))
+    assert order == ["online-1", "batch-1", "batch-2"]
+
+
+def test_new_tenant_waits_for_one_request_of_a_backlog():
+    limiter = UpstreamLimiter(max_concurrency=1)
+    order = asyncio.run(_queue_then_drain(limiter, [
+        ("a", PRIORITY_ONLINE, "a-1"),
+        ("a", PRIORITY_ONLINE, "a-2"),
+        ("a", PRIORITY_ONLINE, "a-3"),
+        ("b", PRIORITY_ONLINE, "b-1"),
+    ]))
+    assert order == ["a-1", "b-1", "a-2", "a-3"]
+
+
+def test_tenant_weights_share_slots():
+    limiter = UpstreamLimiter(max_concurrency=1, tenant_weights={"heavy": 2.0})
+    order = asyncio.run(_queue_then_drain(limiter, [
+        ("light", PRIORITY_ONLINE, "light-1"),
+        ("light", PRIORITY_ONLINE, "light-2"),
+        ("heavy", PRIORITY_ONLINE, "heavy-1"),
+        ("heavy", PRIORITY_ONLINE, "heavy-2"),
+        ("heavy", PRIORITY_ONLINE, "heavy-3"),
+    ]))
+    assert order == ["light-1", "heavy-1", "heavy-2", "light-2", "heavy-3"]
+
+
+def test_batch_work_is_held_to_its_share():
+    async def run():
+        limiter = UpstreamLimiter(max_concurrency=4, batch_share=0.5)
+        for _ in range(2):
+            await limiter.acquire(PRIORITY_BATCH)
+        waiter = asyncio.create_task(limiter.acquire(PRIORITY_BATCH))
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        # Online traffic still gets the remaining slots
+        await limiter.acquire(PRIORITY_ONLINE)
+        limiter.release(PRIORITY_BATCH)
+        await asyncio.sleep(0)
+        assert waiter.done()
+        assert limiter.to_dict()["batch_in_flight"] == 2
+
+    asyncio.run(run())